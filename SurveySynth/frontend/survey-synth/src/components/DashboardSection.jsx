@@ -122,6 +122,7 @@ const DashboardSection = ({ userId }) => {
       case "analyzed":
         return "bg-green-100 text-green-800";
       case "processing":
+      case "analyzing":
         return "bg-blue-100 text-blue-800";
       case "raw":
         return "bg-yellow-100 text-yellow-800";
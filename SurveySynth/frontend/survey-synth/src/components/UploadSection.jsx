@@ -125,6 +125,7 @@ const UploadSection = ({ userId, email }) => {
       case 'raw':
       case 'processing':
       case 'preprocessed':
+      case 'analyzing':
       case 'analyzed':
         return <Clock className="h-4 w-4 text-blue-500 animate-spin" />;
       case 'completed':
@@ -144,6 +145,7 @@ const UploadSection = ({ userId, email }) => {
         return 'text-red-600';
       case 'uploading':
       case 'processing':
+      case 'analyzing':
         return 'text-blue-600';
       default:
         return 'text-gray-600';
@@ -0,0 +1,69 @@
+"""Micro-benchmark: row-wise iterrows extraction vs the column-wise extractor.
+
+Usage: python src/benchmarks/bench_extraction.py [--rows 500 50000 1000000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambdas', 'summarize_feedback'))
+from extraction import FEEDBACK_COLUMNS, extract_feedback_responses
+
+SAMPLE_CSV = os.path.join(os.path.dirname(__file__), '..', '..', '..', 'synthetic_students_feedback_500.csv')
+
+def extract_feedback_iterrows(df, columns):
+    """The original per-row extraction loop, kept as the reference implementation"""
+    feedback_data = []
+    for _, row in df.iterrows():
+        response_feedback = {}
+        for col in columns:
+            value = str(row[col]).strip() if pd.notna(row[col]) else ""
+            if value and value.lower() not in ['nan', 'none', '']:
+                response_feedback[col] = value
+        if response_feedback:
+            feedback_data.append(response_feedback)
+    return feedback_data
+
+def build_frame(rows, seed=7):
+    """Resample the 500-row fixture to the requested size, sprinkling in blanks and placeholders"""
+    base = pd.read_csv(SAMPLE_CSV)
+    rng = np.random.default_rng(seed)
+    df = base.iloc[rng.integers(0, len(base), rows)].reset_index(drop=True)
+    for col in [c for c in FEEDBACK_COLUMNS if c in df.columns]:
+        noise = rng.random(rows)
+        df.loc[noise < 0.05, col] = np.nan
+        df.loc[(noise >= 0.05) & (noise < 0.08), col] = '  None '
+        df.loc[(noise >= 0.08) & (noise < 0.10), col] = '   '
+    return df
+
+def time_call(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, nargs='+', default=[500, 50_000, 1_000_000])
+    parser.add_argument('--legacy-max-rows', type=int, default=1_000_000,
+                        help='skip the iterrows baseline above this size')
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'iterrows_s':>12} {'columnar_s':>12} {'speedup':>9} {'responses':>10}")
+    for rows in args.rows:
+        df = build_frame(rows)
+        columns = [c for c in FEEDBACK_COLUMNS if c in df.columns]
+
+        fast, fast_s = time_call(extract_feedback_responses, df, columns)
+        if rows <= args.legacy_max_rows:
+            slow, slow_s = time_call(extract_feedback_iterrows, df, columns)
+            assert slow == fast, "columnar extraction diverged from iterrows output"
+            print(f"{rows:>10} {slow_s:>12.3f} {fast_s:>12.3f} {slow_s / fast_s:>8.1f}x {len(fast):>10}")
+        else:
+            print(f"{rows:>10} {'skipped':>12} {fast_s:>12.3f} {'-':>9} {len(fast):>10}")
+
+if __name__ == '__main__':
+    main()
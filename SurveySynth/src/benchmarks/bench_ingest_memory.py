@@ -0,0 +1,116 @@
+"""Peak RSS of survey ingestion: full-body read vs batched streaming.
+
+Each measurement runs in a fresh interpreter reading a local CSV through a
+plain file object, which stands in for the S3 StreamingBody.
+
+The default source resamples the 500-row fixture, so most answers repeat
+and little is retained. --source synthetic uses synthetic_survey.py, where
+nearly every answer is distinct: the worst case for dedup memory. Past
+INGEST_MAX_UNIQUE_RESPONSES distinct answers the survey is read again with
+the stratified sampler, as the handler does ("sampled" in the output).
+
+Usage: python src/benchmarks/bench_ingest_memory.py [--rows 10000 100000 1000000] [--source synthetic]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+LAMBDA_DIR = os.path.join(os.path.dirname(__file__), '..', 'lambdas', 'summarize_feedback')
+SAMPLE_CSV = os.path.join(os.path.dirname(__file__), '..', '..', '..', 'synthetic_students_feedback_500.csv')
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def write_survey(path, rows, unique_rate, seed=11):
+    """Resample the fixture to `rows` rows; unique_rate of them get distinct comments"""
+    import numpy as np
+    import pandas as pd
+
+    base = pd.read_csv(SAMPLE_CSV)
+    rng = np.random.default_rng(seed)
+    written = 0
+    with open(path, 'w', newline='') as f:
+        while written < rows:
+            n = min(100_000, rows - written)
+            batch = base.iloc[rng.integers(0, len(base), n)].reset_index(drop=True)
+            unique = rng.random(n) < unique_rate
+            ids = np.arange(written, written + n).astype(str)
+            batch.loc[unique, 'additional_comments'] = batch.loc[unique, 'additional_comments'] + ' ref ' + ids[unique]
+            batch.to_csv(f, header=written == 0, index=False)
+            written += n
+
+def run_child(path, mode):
+    sys.path.insert(0, LAMBDA_DIR)
+    from dedup import TooManyUniqueResponses
+    from ingest import ingest_survey
+    from sampling import StratifiedSampler
+
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    # As handler.ingest_feedback does: past INGEST_MAX_UNIQUE_RESPONSES, read again and sample
+    try:
+        with open(path, 'rb') as body:
+            unique_feedback, summary = ingest_survey(body, read_mode=mode)
+    except TooManyUniqueResponses:
+        summary = None
+    if summary is None:
+        with open(path, 'rb') as body:
+            groups, summary = ingest_survey(body, read_mode=mode, sampler=StratifiedSampler())
+        unique_feedback = [response for _, members in groups for response in members]
+    print(json.dumps({
+        'mode': mode,
+        'rows': summary['row_count'],
+        'unique_responses': len(unique_feedback),
+        'sampled': 'sampling' in summary,
+        'seconds': round(time.perf_counter() - start, 2),
+        'import_rss_mb': round(baseline, 1),
+        'peak_rss_mb': round(peak_rss_mb(), 1)
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--modes', nargs='+', default=['full', 'stream'])
+    parser.add_argument('--unique-rate', type=float, default=0.05)
+    parser.add_argument('--source', choices=['fixture', 'synthetic'], default='fixture')
+    parser.add_argument('--child', nargs=2, metavar=('PATH', 'MODE'), help=argparse.SUPPRESS)
+    parser.add_argument('--write', nargs=2, metavar=('PATH', 'ROWS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(*args.child)
+        return
+    if args.write:
+        if args.source == 'synthetic':
+            from synthetic_survey import write_survey_csv
+            write_survey_csv(args.write[0], int(args.write[1]))
+        else:
+            write_survey(args.write[0], int(args.write[1]), args.unique_rate)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            path = os.path.join(tmp, f'survey_{rows}.csv')
+            # Written by another process: a forked child starts out with the
+            # parent's peak RSS, which would hide the child's own
+            subprocess.run([sys.executable, __file__, '--write', path, str(rows), '--source', args.source,
+                            '--unique-rate', str(args.unique_rate)], check=True)
+            size_mb = os.path.getsize(path) / 2**20
+            for mode in args.modes:
+                out = subprocess.run(
+                    [sys.executable, __file__, '--child', path, mode],
+                    check=True, capture_output=True, text=True
+                ).stdout.strip().splitlines()[-1]
+                result = json.loads(out)
+                result['csv_mb'] = round(size_mb, 1)
+                result['source'] = args.source
+                print(json.dumps(result))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+"""End-to-end pipeline benchmark against local stand-ins for S3, DynamoDB and Bedrock.
+
+Drives process_feedback (ingest, chunk analysis and combine_insights),
+store_insights and the visualization lambda's generate_all_visualizations on
+surveys resampled from the 500-row fixture, or with --source synthetic
+generated by synthetic_survey.py. Bedrock is the offline stub backend
+(LLM_BACKEND=stub); S3 and the DynamoDB tables are in-memory.
+
+Each survey size runs in a fresh interpreter and prints one JSON line with
+per-stage wall time and memory, model-call and token counters. Memory is the
+process peak RSS after each stage; --trace-memory adds the tracemalloc peak of
+each stage on its own (slower, so timings are not comparable with a plain run).
+
+The visualization stage needs matplotlib, seaborn and wordcloud; without them
+it is reported as skipped.
+
+Usage: python src/benchmarks/bench_pipeline.py [--rows 5000 50000 500000] [--stub-latency-ms 20] [--source synthetic]
+"""
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from bench_ingest_memory import write_survey
+from synthetic_survey import write_survey_csv
+
+LAMBDA_DIR = os.path.join(os.path.dirname(__file__), '..', 'lambdas', 'summarize_feedback')
+VISUALIZATION_HANDLER = os.path.join(os.path.dirname(__file__), '..', 'lambdas', 'visualization-lambda', 'handler.py')
+
+# SET/ADD/REMOVE clauses of an UpdateExpression
+UPDATE_CLAUSE = re.compile(r'(SET|ADD|REMOVE) (.*?)(?= (?:SET|ADD|REMOVE) |$)')
+
+USER_ID = 'bench-user'
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class LocalS3:
+    """get_object and head_object serve one local CSV; put_object keeps the uploaded sizes"""
+
+    def __init__(self, csv_path=None):
+        self.csv_path = csv_path
+        self.uploads = {}
+
+    def get_object(self, Bucket, Key):
+        return {'Body': open(self.csv_path, 'rb')}
+
+    def head_object(self, Bucket, Key):
+        stat = os.stat(self.csv_path)
+        return {'ETag': f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.uploads[Key] = len(Body)
+        return {}
+
+class LocalTable:
+    """Dict-backed DynamoDB table covering the calls the pipeline makes.
+
+    Conditions and key expressions are not evaluated: a benchmark run has a
+    single user and upload, so every query returns every item.
+    """
+
+    def __init__(self, key_names):
+        self.key_names = key_names
+        self.items = {}
+
+    def _key(self, key):
+        return tuple(key[name] for name in self.key_names)
+
+    def put_item(self, Item, **kwargs):
+        self.items[self._key(Item)] = dict(Item)
+        return {}
+
+    def get_item(self, Key, **kwargs):
+        item = self.items.get(self._key(Key))
+        return {'Item': dict(item)} if item is not None else {}
+
+    def query(self, **kwargs):
+        return {'Items': [dict(item) for item in self.items.values()]}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues=None, ReturnValues=None, **kwargs):
+        item = self.items.setdefault(self._key(Key), dict(Key))
+        values = ExpressionAttributeValues or {}
+        for action, clause in UPDATE_CLAUSE.findall(UpdateExpression):
+            if action == 'ADD':
+                for assignment in clause.split(','):
+                    name, placeholder = assignment.split()
+                    item[name] = item.get(name, 0) + values[placeholder]
+            elif action == 'SET':
+                for assignment in clause.split(','):
+                    name, expression = (part.strip() for part in assignment.split('='))
+                    if expression in values:
+                        item[name] = values[expression]
+        return {'Attributes': dict(item) if ReturnValues == 'ALL_NEW' else {}}
+
+class StageRecorder:
+    """Times (and optionally traces the memory of) functions wrapped by name"""
+
+    def __init__(self, trace_memory):
+        self.trace_memory = trace_memory
+        self.stages = {}
+
+    def wrap(self, module, name, stage=None):
+        function = getattr(module, name)
+
+        def timed(*args, **kwargs):
+            if self.trace_memory:
+                tracemalloc.reset_peak()
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(stage or name, time.perf_counter() - start)
+
+        setattr(module, name, timed)
+
+    def record(self, stage, seconds):
+        entry = self.stages.setdefault(stage, {'seconds': 0.0, 'calls': 0})
+        entry['seconds'] = round(entry['seconds'] + seconds, 3)
+        entry['calls'] += 1
+        entry['peak_rss_mb'] = round(peak_rss_mb(), 1)
+        if self.trace_memory:
+            # Nested stages reset the peak, so an outer stage reports the peak since its last nested call
+            traced_mb = tracemalloc.get_traced_memory()[1] / 2**20
+            entry['peak_traced_mb'] = round(max(entry.get('peak_traced_mb', 0), traced_mb), 1)
+
+def load_visualization_handler():
+    """Import the visualization lambda's handler under its own name (both lambdas use handler.py)"""
+    spec = importlib.util.spec_from_file_location('visualization_handler', VISUALIZATION_HANDLER)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def run_child(path, args):
+    os.environ.update({
+        'LLM_BACKEND': 'stub',
+        'STUB_LATENCY_MS': str(args.stub_latency_ms),
+        'STUB_JITTER_MS': str(args.stub_latency_ms / 4),
+        'LLM_CACHE_BACKEND': 'none',
+        'CHECKPOINT_BACKEND': 'none',
+        'MPLBACKEND': 'Agg'
+    })
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    sys.path.insert(0, LAMBDA_DIR)
+
+    recorder = StageRecorder(args.trace_memory)
+    if args.trace_memory:
+        tracemalloc.start()
+
+    # The handlers log every chunk; keep that out of the benchmark output
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        import handler
+        recorder.record('import', time.perf_counter() - start)
+
+        upload_id = f'bench-{args.rows_label}'
+        handler.s3 = LocalS3(path)
+        handler.survey_meta_table = LocalTable(['user_id', 'upload_id'])
+        handler.insights_table = LocalTable(['user_id', 'upload_id'])
+        handler.survey_meta_table.put_item(Item={'user_id': USER_ID, 'upload_id': upload_id, 'status': 'analyzing'})
+
+        recorder.wrap(handler, 'load_analysis_modules')
+        handler.load_analysis_modules()
+        handler.user_stats.user_stats_table = LocalTable(['user_id'])
+
+        recorder.wrap(handler.ingest, 'ingest_survey')
+        recorder.wrap(handler, 'analyze_chunks_concurrently', 'analyze_chunks')
+        recorder.wrap(handler, 'combine_insights')
+        recorder.wrap(handler, 'process_feedback')
+        recorder.wrap(handler, 'store_insights')
+
+        insights = handler.process_feedback(USER_ID, upload_id, path)
+        handler.store_insights(USER_ID, upload_id, insights)
+
+        charts = None
+        try:
+            start = time.perf_counter()
+            visualization = load_visualization_handler()
+            recorder.record('import_visualization', time.perf_counter() - start)
+        except ImportError as e:
+            recorder.stages['generate_all_visualizations'] = {'skipped': str(e)}
+        else:
+            visualization.s3 = LocalS3()
+            recorder.wrap(visualization, 'generate_all_visualizations')
+            stored = handler.insights_table.get_item(Key={'user_id': USER_ID, 'upload_id': upload_id})['Item']
+            charts = visualization.generate_all_visualizations([stored], USER_ID, upload_id)
+
+    model = handler.llm_backend.stats()
+    print(json.dumps({
+        'rows': insights['response_count'],
+        'feedback_count': insights['feedback_count'],
+        'unique_feedback_count': insights.get('unique_feedback_count', 0),
+        'chunks': insights.get('analysis_chunks', 0),
+        'stub_latency_ms': args.stub_latency_ms,
+        'stages': recorder.stages,
+        'model_calls': model['calls'],
+        'model_errors': model['errors'],
+        'prompt_tokens': model['prompt_tokens'],
+        'output_tokens': model['output_tokens'],
+        'rate_controller': handler.rate_controller.stats(),
+        'charts': sum(1 for url in (charts or {}).values() if url),
+        'peak_rss_mb': round(peak_rss_mb(), 1)
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[5_000, 50_000, 500_000])
+    parser.add_argument('--unique-rate', type=float, default=0.05,
+                        help='share of rows whose comment is made distinct from the fixture')
+    parser.add_argument('--source', choices=['fixture', 'synthetic'], default='fixture',
+                        help='resample the 500-row fixture or generate rows with synthetic_survey.py')
+    parser.add_argument('--stub-latency-ms', type=float, default=20)
+    parser.add_argument('--trace-memory', action='store_true', help='add per-stage tracemalloc peaks')
+    parser.add_argument('--child', metavar='PATH', help=argparse.SUPPRESS)
+    parser.add_argument('--rows-label', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            path = os.path.join(tmp, f'survey_{rows}.csv')
+            if args.source == 'synthetic':
+                write_survey_csv(path, rows)
+            else:
+                write_survey(path, rows, args.unique_rate)
+            command = [sys.executable, __file__, '--child', path, '--rows-label', str(rows),
+                       '--stub-latency-ms', str(args.stub_latency_ms)]
+            if args.trace_memory:
+                command.append('--trace-memory')
+            out = subprocess.run(command, check=True, capture_output=True, text=True).stdout.strip().splitlines()[-1]
+            result = json.loads(out)
+            result['source'] = args.source
+            result['csv_mb'] = round(os.path.getsize(path) / 2**20, 1)
+            print(json.dumps(result))
+
+if __name__ == '__main__':
+    main()
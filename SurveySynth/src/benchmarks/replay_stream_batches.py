@@ -0,0 +1,271 @@
+"""Replay DynamoDB stream batches through the feedback handler under two retry strategies.
+
+bisect:  legacy behaviour. Any failed record fails the whole invocation and the
+         poller bisects the batch (BisectBatchOnFunctionError). The claim is
+         replaced by an unconditional status write, as before uploads were
+         claimed, so records that already succeeded are analyzed again.
+partial: the handler as deployed. It returns batchItemFailures and the poller
+         retries from the earliest failed sequence number; redelivered
+         records whose upload already finished fail the claim and are skipped.
+
+Every invocation runs the real handler.lambda_handler with the stub model
+backend (LLM_BACKEND=stub), a small survey served by an in-memory S3 and an
+in-memory SurveyMeta table that evaluates the handler's claim, renewal and
+release conditions. A record's analysis fails transiently for its first few
+executions, drawn per upload with --fail-rate; the reported counts are what the
+handler actually did.
+
+Records come from a recorded event file (a stream event or a list of them) or
+are synthesized.
+
+Usage: python src/benchmarks/replay_stream_batches.py [--events batches.json] [--records 200 --batch-size 10]
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+
+from bench_ingest_memory import SAMPLE_CSV
+from bench_pipeline import LAMBDA_DIR, LocalS3, LocalTable
+
+SURVEY_ROWS = 40  # rows of the fixture each replayed upload analyzes
+SILVER_KEY = 'silver/replay.csv'
+ASSIGNMENT_SEPARATOR = re.compile(r',\s*(?![^()]*\))')  # commas outside if_not_exists(...)
+
+def load_records(path):
+    with open(path) as f:
+        recorded = json.load(f)
+    events = recorded if isinstance(recorded, list) else [recorded]
+    return [record for event in events for record in event['Records']]
+
+def synthesize_records(count):
+    return [
+        {
+            'eventName': 'MODIFY',
+            'dynamodb': {
+                'SequenceNumber': str(1000 + i),
+                'OldImage': {'status': {'S': 'uploaded'}},
+                'NewImage': {
+                    'user_id': {'S': 'replay-user'},
+                    'upload_id': {'S': f'upload-{i}'},
+                    's3_path_silver': {'S': SILVER_KEY},
+                    'status': {'S': 'preprocessed'}
+                }
+            }
+        }
+        for i in range(count)
+    ]
+
+def upload_key(record):
+    new_image = record['dynamodb']['NewImage']
+    return new_image['user_id']['S'], new_image['upload_id']['S']
+
+class SurveyMetaTable(LocalTable):
+    """In-memory SurveyMeta that applies the handler's updates and checks their conditions.
+
+    Each ConditionExpression the handler sends is evaluated against the
+    stored item; an unknown one raises, so the replay cannot silently drift
+    from the handler.
+    """
+
+    CONDITIONS = {
+        # claim_upload
+        "#s IN (:preprocessed, :failed) OR (#s = :analyzing AND lease_expires_at < :now)":
+            lambda item, v: item.get('status') in (v[':preprocessed'], v[':failed'])
+            or (item.get('status') == v[':analyzing'] and item.get('lease_expires_at', 0) < v[':now']),
+        # renew_claim
+        "#s = :analyzing AND lease_owner = :o":
+            lambda item, v: item.get('status') == v[':analyzing'] and item.get('lease_owner') == v[':o'],
+        # update_survey_status with a lease
+        "lease_owner = :o":
+            lambda item, v: item.get('lease_owner') == v[':o']
+    }
+
+    def __init__(self):
+        super().__init__(['user_id', 'upload_id'])
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues=None, ExpressionAttributeNames=None,
+                    ConditionExpression=None, ReturnValues=None, **kwargs):
+        from botocore.exceptions import ClientError
+
+        values = ExpressionAttributeValues or {}
+        names = ExpressionAttributeNames or {}
+        item = self.items.setdefault(self._key(Key), dict(Key))
+        if ConditionExpression is not None and not self.CONDITIONS[ConditionExpression](item, values):
+            raise ClientError({'Error': {'Code': 'ConditionalCheckFailedException', 'Message': 'condition'}},
+                              'UpdateItem')
+
+        old = dict(item)
+        set_part, _, remove_part = UpdateExpression[len('SET '):].partition(' REMOVE ')
+        updated = []
+        for assignment in ASSIGNMENT_SEPARATOR.split(set_part):
+            name, expression = (part.strip() for part in assignment.split('=', 1))
+            name = names.get(name, name)
+            updated.append(name)
+            if expression.startswith('if_not_exists('):
+                expression = expression[len('if_not_exists('):-1].split(',')[1].strip()
+                if name in item:
+                    continue
+            item[name] = values[expression]
+        for name in filter(None, (part.strip() for part in remove_part.split(','))):
+            item.pop(names.get(name, name), None)
+
+        return {'Attributes': {name: old[name] for name in updated if name in old} if ReturnValues else {}}
+
+class Replay:
+    """Drives handler.lambda_handler for one strategy and counts what it did"""
+
+    def __init__(self, handler, records, args, legacy):
+        self.handler = handler
+        rng = random.Random(args.seed)
+        uploads = list(dict.fromkeys(upload_key(r) for r in records))
+        self.failures_left = {
+            upload: (rng.randint(1, args.max_failures) if rng.random() < args.fail_rate else 0) for upload in uploads
+        }
+        self.invocations = 0
+        self.analyses = 0
+        self.repeated = 0
+        self.skipped = 0
+        self.completed = set()
+
+        handler.survey_meta_table = SurveyMetaTable()
+        handler.insights_table = LocalTable(['user_id', 'upload_id'])
+        handler.user_stats.user_stats_table = LocalTable(['user_id'])
+        for upload in uploads:
+            handler.survey_meta_table.put_item(Item={'user_id': upload[0], 'upload_id': upload[1],
+                                                     'status': 'preprocessed'})
+
+        process_feedback = handler.process_feedback
+        claim_upload = handler.claim_upload
+
+        def failing_process_feedback(user_id, upload_id, *rest):
+            self.analyses += 1
+            if (user_id, upload_id) in self.completed:
+                self.repeated += 1
+            if self.failures_left[(user_id, upload_id)] > 0:
+                self.failures_left[(user_id, upload_id)] -= 1
+                raise Exception("Injected transient failure")
+            result = process_feedback(user_id, upload_id, *rest)
+            self.completed.add((user_id, upload_id))
+            return result
+
+        def counted_claim_upload(user_id, upload_id, lease_owner):
+            claimed, lease_expires_at = claim_upload(user_id, upload_id, lease_owner)
+            self.skipped += not claimed
+            return claimed, lease_expires_at
+
+        def unconditional_claim(user_id, upload_id, lease_owner):
+            # Before claims: the status was simply overwritten
+            handler.survey_meta_table.update_item(
+                Key={'user_id': user_id, 'upload_id': upload_id},
+                UpdateExpression="SET #s = :analyzing, lease_owner = :o",
+                ExpressionAttributeNames={'#s': 'status'},
+                ExpressionAttributeValues={':analyzing': 'analyzing', ':o': lease_owner}
+            )
+            return True, None
+
+        self.patches = {
+            'process_feedback': failing_process_feedback,
+            'claim_upload': unconditional_claim if legacy else counted_claim_upload
+        }
+
+    def invoke(self, batch):
+        """Returns the failed sequence numbers of this invocation"""
+        self.invocations += 1
+        originals = {name: getattr(self.handler, name) for name in self.patches}
+        for name, patched in self.patches.items():
+            setattr(self.handler, name, patched)
+        try:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                response = self.handler.lambda_handler({'Records': batch}, None)
+        finally:
+            for name, original in originals.items():
+                setattr(self.handler, name, original)
+        return [failure['itemIdentifier'] for failure in response['batchItemFailures']]
+
+def replay_bisect(replay, batch, max_retries, attempt=0):
+    """Whole-batch failure with bisection; returns records dropped after exhausting retries"""
+    if not replay.invoke(batch):
+        return 0
+    if attempt >= max_retries:
+        return len(batch)
+    if len(batch) == 1:
+        return replay_bisect(replay, batch, max_retries, attempt + 1)
+    middle = len(batch) // 2
+    return (replay_bisect(replay, batch[:middle], max_retries, attempt + 1) +
+            replay_bisect(replay, batch[middle:], max_retries, attempt + 1))
+
+def replay_partial(replay, batch, max_retries):
+    """Partial batch response: retry from the earliest reported failure"""
+    for attempt in range(max_retries + 1):
+        failed = replay.invoke(batch)
+        if not failed:
+            return 0
+        first = min(failed, key=int)
+        batch = batch[[r['dynamodb']['SequenceNumber'] for r in batch].index(first):]
+    return len(batch)
+
+def run(handler, strategy, records, args):
+    replay = Replay(handler, records, args, legacy=strategy == 'bisect')
+    dropped = 0
+    for start in range(0, len(records), args.batch_size):
+        batch = records[start:start + args.batch_size]
+        if strategy == 'bisect':
+            dropped += replay_bisect(replay, batch, args.max_retries)
+        else:
+            dropped += replay_partial(replay, batch, args.max_retries)
+    statuses = [item.get('status') for item in handler.survey_meta_table.items.values()]
+    return {
+        'strategy': strategy,
+        'records': len(records),
+        'batch_size': args.batch_size,
+        'invocations': replay.invocations,
+        'analyses': replay.analyses,
+        'repeated_analyses': replay.repeated,
+        'skipped_redeliveries': replay.skipped,
+        'succeeded': len(replay.completed),
+        'analyzed_status': statuses.count('analyzed'),
+        'dropped': dropped
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', help='JSON file with a recorded stream event or a list of events')
+    parser.add_argument('--records', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=10)
+    parser.add_argument('--fail-rate', type=float, default=0.1)
+    parser.add_argument('--max-failures', type=int, default=2, help='transient failures per failing upload')
+    parser.add_argument('--max-retries', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--strategies', nargs='+', default=['bisect', 'partial'])
+    args = parser.parse_args()
+
+    os.environ.update({
+        'LLM_BACKEND': 'stub',
+        'STUB_LATENCY_MS': '0',
+        'STUB_JITTER_MS': '0',
+        'LLM_CACHE_BACKEND': 'none',
+        'CHECKPOINT_BACKEND': 'none',
+        'COLDSTART_PROFILE': 'off'
+    })
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    sys.path.insert(0, LAMBDA_DIR)
+    import handler
+    import pandas as pd
+
+    records = load_records(args.events) if args.events else synthesize_records(args.records)
+    with tempfile.TemporaryDirectory() as tmp:
+        survey = os.path.join(tmp, 'survey.csv')
+        pd.read_csv(SAMPLE_CSV, nrows=SURVEY_ROWS).to_csv(survey, index=False)
+        handler.s3 = LocalS3(survey)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            handler.load_analysis_modules()
+        for strategy in args.strategies:
+            print(json.dumps(run(handler, strategy, records, args)))
+
+if __name__ == '__main__':
+    main()
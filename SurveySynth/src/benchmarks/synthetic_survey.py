@@ -0,0 +1,245 @@
+"""Synthetic course-feedback surveys for load testing.
+
+Rows have the 29-column schema of synthetic_students_feedback_500.csv:
+student_name, email, batch_code, 22 ratings (1-5) and 4 free-text answers.
+Every batch is built with NumPy array operations, with no per-row Python
+loop. Rows are written batch by batch to a local file or, for s3:// targets,
+to an S3 multipart upload, so memory stays flat however many rows are asked for.
+
+Each row draws a latent satisfaction that drives both its ratings and the
+tone of its answers, so sentiment, ratings and cohorts (batch_code) relate
+the way they do in real surveys. Answers are clauses assembled from phrase
+pools that name course topics (Spring, React, Hibernate...). A share of them
+are exact repeats of common short answers (duplicate_rate) and a share are
+left blank (null_rate).
+
+Usage: python src/benchmarks/synthetic_survey.py --rows 1000000 --output survey.csv
+       python src/benchmarks/synthetic_survey.py --rows 5000000 --output s3://bucket/load/survey.csv
+"""
+import argparse
+import io
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+IDENTITY_COLUMNS = ['student_name', 'email', 'batch_code']
+RATING_COLUMNS = [
+    'course_content_rating', 'syllabus_structured', 'build_tools_rating', 'hibernate_rating', 'spring_rating',
+    'restapi_rating', 'react_rating', 'microservices_rating', 'testing_rating', 'instructor_explanation',
+    'pace_of_teaching', 'doubt_solving_support', 'instructor_approach', 'assignments_helpful',
+    'assignments_aligned', 'mini_projects_given', 'project_based_learning', 'tools_covered',
+    'fullstack_exposure', 'project_experience', 'confident_fullstack', 'job_readiness'
+]
+TEXT_COLUMNS = ['needs_more_emphasis', 'liked_most', 'improvement_suggestions', 'additional_comments']
+SURVEY_COLUMNS = IDENTITY_COLUMNS + RATING_COLUMNS + TEXT_COLUMNS
+
+DEFAULT_BATCH_ROWS = 100_000
+DEFAULT_MEAN_CLAUSES = 1.5  # clauses per free-text answer
+DEFAULT_MAX_CLAUSES = 6
+DEFAULT_DUPLICATE_RATE = 0.3  # answers replaced by a common short answer
+DEFAULT_NULL_RATE = 0.05  # answers left blank
+DEFAULT_BATCH_CODES = 40
+S3_PART_BYTES = 16 * 2**20  # multipart parts must be at least 5 MiB
+
+# Variable-width strings, so concatenation runs as NumPy string ufuncs
+STRING = np.dtypes.StringDType()
+
+FIRST_NAMES = np.array([
+    'Aarav', 'Aditi', 'Alex', 'Ananya', 'Arjun', 'Chloe', 'Daniel', 'Deepa', 'Emma', 'Farhan', 'Grace', 'Ishaan',
+    'Jia', 'Kavya', 'Liam', 'Maya', 'Mohit', 'Nina', 'Omar', 'Priya', 'Rahul', 'Riya', 'Sam', 'Sara', 'Tanvi',
+    'Vikram', 'Yash', 'Zara'
+], dtype=STRING)
+LAST_NAMES = np.array([
+    'Agarwal', 'Brown', 'Chen', 'Das', 'Fernandes', 'Garcia', 'Gupta', 'Iyer', 'Johnson', 'Khan', 'Kumar', 'Lee',
+    'Menon', 'Nair', 'Patel', 'Reddy', 'Rao', 'Sharma', 'Singh', 'Smith', 'Thomas', 'Verma', 'Wilson'
+], dtype=STRING)
+EMAIL_DOMAINS = np.array(['@gmail.com', '@outlook.com', '@yahoo.com', '@example.edu'], dtype=STRING)
+
+TOPICS = np.array([
+    'the Spring module', 'Spring Boot', 'the React module', 'React state management', 'Hibernate',
+    'the REST API lab', 'the microservices module', 'the testing module', 'unit testing', 'Maven',
+    'the build tools section', 'the mini project work', 'the assignment work', 'the capstone project',
+    'doubt solving', 'the instructor', 'the pace of teaching', 'the syllabus', 'deployment', 'JPA'
+], dtype=STRING)
+# Same count of positive and negative predicates, so clauses index as [topic, tone, predicate, qualifier]
+POSITIVE_PREDICATES = np.array([
+    'was great', 'was really helpful', 'was explained clearly', 'was very engaging', 'helped me a lot',
+    'was well structured', 'gave good hands-on practice', 'was the best part', 'made concepts easy',
+    'built my confidence'
+], dtype=STRING)
+NEGATIVE_PREDICATES = np.array([
+    'was too fast', 'was confusing', 'needs more depth', 'felt rushed', 'was not aligned with the lectures',
+    'needs more examples', 'was too short', 'was hard to follow', 'needs more practice time', 'felt outdated'
+], dtype=STRING)
+QUALIFIERS = np.array([
+    '', '', '', ' overall', ' in my opinion', ' for beginners', ' in the later weeks', ' compared to other modules',
+    ' during the live sessions', ' for the project work'
+], dtype=STRING)
+CAPITALIZED_TOPICS = np.array([topic[0].upper() + topic[1:] for topic in TOPICS], dtype=STRING)
+COMMON_ANSWERS = np.array([
+    'Nothing', 'None', 'No comments', 'Good', 'Great course', 'Everything was good', 'Nothing to add',
+    'More projects', 'More practice', 'Good course', 'Excellent', 'Very good', 'NA', 'All good', 'Thank you'
+], dtype=STRING)
+
+def clause_table(topics, separator=''):
+    """Every topic + predicate + qualifier clause, indexed by topic, tone, predicate and qualifier"""
+    predicates = np.concatenate([POSITIVE_PREDICATES, NEGATIVE_PREDICATES])
+    clauses = np.strings.add(np.strings.add(np.strings.add(separator, topics[:, None, None]), ' '),
+                             np.strings.add(predicates[None, :, None], QUALIFIERS[None, None, :]))
+    return clauses.reshape(len(topics), 2, len(POSITIVE_PREDICATES), len(QUALIFIERS))
+
+# The opening clause of an answer starts with a capital; later ones follow a '; '
+OPENING_CLAUSES = clause_table(CAPITALIZED_TOPICS)
+FOLLOWING_CLAUSES = clause_table(TOPICS, '; ')
+
+def compose_answers(rng, satisfaction, mean_clauses, max_clauses):
+    """One answer per row: 1..max_clauses clauses whose tone follows the row's satisfaction"""
+    n = len(satisfaction)
+    clauses = np.clip(1 + rng.poisson(max(mean_clauses - 1, 0), n), 1, max_clauses)
+    answers = None
+    for k in range(max_clauses):
+        active = np.flatnonzero(clauses > k)
+        if not len(active):
+            break
+        m = len(active)
+        # Mostly on-tone, with some mixed remarks from every respondent
+        negative = rng.random(m) >= 1 / (1 + np.exp(-2.5 * satisfaction[active]))
+        table = OPENING_CLAUSES if k == 0 else FOLLOWING_CLAUSES
+        clause = table[rng.integers(0, table.shape[0], m), negative.astype(np.intp),
+                       rng.integers(0, table.shape[2], m), rng.integers(0, table.shape[3], m)]
+        if answers is None:
+            answers = clause
+        else:
+            answers[active] = np.strings.add(answers[active], clause)
+    return answers
+
+def batch_code_pool(rng, cardinality):
+    """Cohort codes like the fixture's BC188, with uneven cohort sizes"""
+    width = max(3, len(str(cardinality + 99)))
+    numbers = rng.choice(10 ** width - 100, cardinality, replace=False) + 100
+    codes = np.strings.add('BC', np.strings.zfill(numbers.astype(STRING), width))
+    weights = rng.gamma(2.0, size=cardinality)
+    return codes, weights / weights.sum()
+
+def generate_batch(rng, start, rows, codes, code_weights, mean_clauses=DEFAULT_MEAN_CLAUSES,
+                   max_clauses=DEFAULT_MAX_CLAUSES, duplicate_rate=DEFAULT_DUPLICATE_RATE,
+                   null_rate=DEFAULT_NULL_RATE):
+    """DataFrame of `rows` survey rows, numbered from `start`"""
+    first = FIRST_NAMES[rng.integers(0, len(FIRST_NAMES), rows)]
+    last = LAST_NAMES[rng.integers(0, len(LAST_NAMES), rows)]
+    row_ids = np.arange(start, start + rows).astype(STRING)
+    email = np.strings.add(np.strings.add(np.strings.add(np.strings.lower(first), '.'), np.strings.lower(last)),
+                           np.strings.add(row_ids, EMAIL_DOMAINS[rng.integers(0, len(EMAIL_DOMAINS), rows)]))
+
+    cohort = rng.choice(len(codes), rows, p=code_weights)
+    # Cohorts differ a little in how satisfied they are, students more so
+    cohort_mood = np.random.default_rng(len(codes)).normal(0, 0.4, len(codes))
+    satisfaction = cohort_mood[cohort] + rng.normal(0, 1, rows)
+    ratings = np.clip(np.rint(3 + 0.9 * satisfaction[:, None] + rng.normal(0, 0.8, (rows, len(RATING_COLUMNS)))),
+                      1, 5).astype(np.int8)
+
+    columns = {
+        'student_name': np.strings.add(np.strings.add(first, ' '), last).astype(object),
+        'email': email.astype(object),
+        'batch_code': codes[cohort].astype(object)
+    }
+    columns.update(zip(RATING_COLUMNS, ratings.T))
+    for column in TEXT_COLUMNS:
+        answers = compose_answers(rng, satisfaction, mean_clauses, max_clauses).astype(object)
+        draw = rng.random(rows)
+        duplicate = draw < duplicate_rate
+        answers[duplicate] = COMMON_ANSWERS[rng.integers(0, len(COMMON_ANSWERS), int(duplicate.sum()))]
+        answers[(draw >= duplicate_rate) & (draw < duplicate_rate + null_rate)] = None
+        columns[column] = answers
+    return pd.DataFrame(columns, columns=SURVEY_COLUMNS)
+
+def generate_batches(rows, batch_rows=DEFAULT_BATCH_ROWS, batch_codes=DEFAULT_BATCH_CODES, seed=7, **options):
+    """Yield DataFrames of at most batch_rows rows, rows in total; options go to generate_batch"""
+    rng = np.random.default_rng(seed)
+    codes, code_weights = batch_code_pool(rng, batch_codes)
+    for start in range(0, rows, batch_rows):
+        yield generate_batch(rng, start, min(batch_rows, rows - start), codes, code_weights, **options)
+
+class S3MultipartWriter:
+    """Text file object that streams to an S3 object in fixed-size multipart parts"""
+
+    def __init__(self, s3, bucket, key, part_bytes=S3_PART_BYTES):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.part_bytes = part_bytes
+        self.buffer = io.BytesIO()
+        self.parts = []
+        self.upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key, ContentType='text/csv')['UploadId']
+
+    def write(self, text):
+        self.buffer.write(text.encode('utf-8'))
+        if self.buffer.tell() >= self.part_bytes:
+            self._upload_part()
+        return len(text)
+
+    def _upload_part(self):
+        number = len(self.parts) + 1
+        response = self.s3.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                       PartNumber=number, Body=self.buffer.getvalue())
+        self.parts.append({'PartNumber': number, 'ETag': response['ETag']})
+        self.buffer = io.BytesIO()
+
+    def close(self):
+        if self.buffer.tell() or not self.parts:
+            self._upload_part()
+        self.s3.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                          MultipartUpload={'Parts': self.parts})
+
+    def abort(self):
+        self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+def write_survey_csv(target, rows, **options):
+    """Stream a generated survey to a path or s3://bucket/key; returns the number of rows written"""
+    if target.startswith('s3://'):
+        import boto3
+
+        bucket, key = target[len('s3://'):].split('/', 1)
+        out = S3MultipartWriter(boto3.client('s3'), bucket, key)
+    else:
+        out = open(target, 'w', newline='')
+
+    written = 0
+    try:
+        for batch in generate_batches(rows, **options):
+            batch.to_csv(out, header=written == 0, index=False)
+            written += len(batch)
+    except Exception:
+        if isinstance(out, S3MultipartWriter):
+            out.abort()
+        raise
+    out.close()
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--output', required=True, help='CSV path or s3://bucket/key')
+    parser.add_argument('--batch-rows', type=int, default=DEFAULT_BATCH_ROWS)
+    parser.add_argument('--mean-clauses', type=float, default=DEFAULT_MEAN_CLAUSES)
+    parser.add_argument('--max-clauses', type=int, default=DEFAULT_MAX_CLAUSES)
+    parser.add_argument('--duplicate-rate', type=float, default=DEFAULT_DUPLICATE_RATE)
+    parser.add_argument('--null-rate', type=float, default=DEFAULT_NULL_RATE)
+    parser.add_argument('--batch-codes', type=int, default=DEFAULT_BATCH_CODES, help='distinct batch_code values')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    rows = write_survey_csv(
+        args.output, args.rows, batch_rows=args.batch_rows, batch_codes=args.batch_codes, seed=args.seed,
+        mean_clauses=args.mean_clauses, max_clauses=args.max_clauses,
+        duplicate_rate=args.duplicate_rate, null_rate=args.null_rate
+    )
+    seconds = time.perf_counter() - start
+    print(json.dumps({'output': args.output, 'rows': rows, 'seconds': round(seconds, 2),
+                      'rows_per_second': round(rows / seconds) if seconds > 0 else None}))
+
+if __name__ == '__main__':
+    main()
@@ -2,8 +2,10 @@ import boto3
 import json
 import csv
 
+from llm_backend import build_llm_backend
+
 s3_client = boto3.client("s3")
-bedrock_client = boto3.client("bedrock-runtime")
+llm_backend = build_llm_backend()
 
 def extract_feedback_from_s3(bucket, key):
     obj = s3_client.get_object(Bucket=bucket, Key=key)
@@ -50,32 +52,14 @@ def lambda_handler(event, context):
 
     print("Prompt sent to Claude:\n", prompt)
 
-    # Prepare Bedrock API payload
-    body = json.dumps({
-        "prompt": prompt,
-        "max_tokens_to_sample": 1500,
-        "temperature": 0.7,
-        # "stop_sequences": ["\n\n"]
-    })
-
-    # Invoke Claude (Bedrock)
-    response = bedrock_client.invoke_model(
-        modelId="anthropic.claude-v2",
-        body=body,
-        contentType="application/json",
-        accept="application/json"
+    # Invoke Claude through the configured backend (Bedrock, or the offline stub)
+    summary = llm_backend.complete(
+        prompt,
+        model_id="anthropic.claude-v2",
+        max_tokens=1500,
+        temperature=0.7
     )
-
-    # Read response once and log
-    response_body = response['body'].read().decode('utf-8')
-    print("Raw Bedrock result:\n", response_body)
-
-    try:
-        result_json = json.loads(response_body)
-        summary = result_json.get("completion", "No 'completion' field")
-        print("Final output:\n", summary)
-    except Exception as e:
-        print("Could not decode result as JSON:", str(e))
+    print("Final output:\n", summary)
 
     return {
         'statusCode': 200,
@@ -0,0 +1,69 @@
+"""Model calls for the upload summary.
+
+The invoke path of summarize_feedback/llm_backend.py, cut down to the one
+non-streaming call this function makes; the stub answers offline runs with a
+fixed summary.
+"""
+import json
+import os
+
+import boto3
+from botocore.config import Config
+
+# Which backend serves model calls: 'bedrock' in AWS, 'stub' for offline runs
+LLM_BACKEND = os.environ.get('LLM_BACKEND', 'bedrock')
+BEDROCK_REGION = os.environ.get('BEDROCK_REGION', 'us-east-1')
+# One attempt per request, as in summarize_feedback
+BEDROCK_CLIENT_CONFIG = Config(retries={'total_max_attempts': 1, 'mode': 'standard'})
+
+STUB_SUMMARY = """- Summary: Mostly positive (stub backend)
+- Pain Points: none
+- Positive Feedback: none
+- Top 3 Actionable Suggestions: none"""
+
+def uses_messages_api(model_id):
+    """Claude 3+ models take the Messages body; claude-v2/instant take a raw prompt"""
+    return not any(legacy in model_id for legacy in ('claude-v2', 'claude-instant'))
+
+class BedrockBackend:
+    """Amazon Bedrock runtime"""
+
+    def __init__(self, region_name=BEDROCK_REGION, client=None):
+        self.client = client or boto3.client('bedrock-runtime', region_name=region_name,
+                                             config=BEDROCK_CLIENT_CONFIG)
+
+    def complete(self, prompt, model_id, max_tokens, temperature, stop_sequences=None):
+        """Send one prompt and return the model's text output"""
+        if uses_messages_api(model_id):
+            body = {
+                'anthropic_version': 'bedrock-2023-05-31',
+                'max_tokens': max_tokens,
+                'messages': [{'role': 'user', 'content': prompt}],
+                'temperature': temperature
+            }
+        else:
+            body = {'prompt': prompt, 'max_tokens_to_sample': max_tokens, 'temperature': temperature}
+        if stop_sequences:
+            body['stop_sequences'] = stop_sequences
+        response = self.client.invoke_model(
+            modelId=model_id,
+            contentType='application/json',
+            accept='application/json',
+            body=json.dumps(body)
+        )
+        response_body = json.loads(response['body'].read())
+        if uses_messages_api(model_id):
+            return response_body['content'][0]['text']
+        return response_body.get('completion', 'No output')
+
+class StubBackend:
+    """Offline stand-in"""
+
+    def complete(self, prompt, model_id, max_tokens, temperature, stop_sequences=None):
+        return STUB_SUMMARY
+
+def build_llm_backend(name=LLM_BACKEND):
+    """Create the backend selected by LLM_BACKEND"""
+    if name == 'stub':
+        return StubBackend()
+    return BedrockBackend()
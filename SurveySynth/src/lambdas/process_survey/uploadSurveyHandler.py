@@ -3,6 +3,7 @@ import json
 import uuid
 import time
 import base64
+import os
 glue = boto3.client('glue')
 
 dynamodb = boto3.resource('dynamodb')
@@ -10,6 +11,7 @@ s3 = boto3.client('s3')
 
 USERS_TABLE = 'Users'
 METADATA_TABLE = 'SurveyMeta'
+USER_STATS_TABLE = os.environ.get('USER_STATS_TABLE', 'UserSurveyStats')
 BUCKET_NAME = 'surveysynth-uploads'
 
 def lambda_handler(event, context):
@@ -77,9 +79,21 @@ def lambda_handler(event, context):
             'upload_id': upload_id,
             's3_path_raw': object_key,
             'status': 'raw',
-            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            # Counted by the ADD below; the one-time backfill in user_stats skips marked items
+            'counted_in_stats': True
         })
 
+        # Per-user survey counter read by the analysis step instead of querying SurveyMeta
+        try:
+            dynamodb.Table(USER_STATS_TABLE).update_item(
+                Key={'user_id': user_id},
+                UpdateExpression='ADD total_survey_count :one',
+                ExpressionAttributeValues={':one': 1}
+            )
+        except Exception as e:
+            print('Failed to update survey counter:', str(e))
+
         print('Upload successful!')
         response = glue.start_job_run(
         JobName='SurveyPreprocessJob',  # your actual job name
@@ -0,0 +1,185 @@
+import gzip
+import json
+import os
+import threading
+import time
+
+import boto3
+from boto3.dynamodb.conditions import Key
+
+from dynamodb_tables import SharedTable
+
+# Where completed chunk results are persisted between attempts
+CHECKPOINT_BACKEND = os.environ.get('CHECKPOINT_BACKEND', 'none')  # dynamodb | file | none
+CHECKPOINT_TABLE = os.environ.get('CHECKPOINT_TABLE', 'AnalysisCheckpoints')
+CHECKPOINT_DIR = os.environ.get('CHECKPOINT_DIR', '/tmp/analysis-checkpoints')
+CHECKPOINT_TTL_SECONDS = int(os.environ.get('CHECKPOINT_TTL_SECONDS', str(7 * 24 * 3600)))
+# A run's ingest result (the responses left to chunk) outgrows a DynamoDB item, so it goes to S3
+CHECKPOINT_PLAN_BUCKET = os.environ.get('CHECKPOINT_PLAN_BUCKET', 'surveysynth-uploads')
+CHECKPOINT_PLAN_PREFIX = os.environ.get('CHECKPOINT_PLAN_PREFIX', 'analysis-plans/')
+
+def checkpoint_run_id(user_id, upload_id):
+    """Stable id so every retry of an upload finds the same checkpoints"""
+    return f"{user_id}#{upload_id}"
+
+class DynamoDBCheckpointStore:
+    """One item per finished chunk: run_id (hash key) + chunk_index (range key).
+
+    The run's plan is a gzipped JSON object under CHECKPOINT_PLAN_PREFIX.
+    """
+
+    def __init__(self, table_name=CHECKPOINT_TABLE, ttl_seconds=CHECKPOINT_TTL_SECONDS,
+                 plan_bucket=CHECKPOINT_PLAN_BUCKET, plan_prefix=CHECKPOINT_PLAN_PREFIX):
+        self.table = SharedTable(table_name)
+        self.ttl_seconds = ttl_seconds
+        self.s3 = boto3.client('s3')
+        self.plan_bucket = plan_bucket
+        self.plan_prefix = plan_prefix
+
+    def _plan_key(self, run_id):
+        return f"{self.plan_prefix}{run_id.replace('#', '/')}.json.gz"
+
+    def load_plan(self, run_id):
+        try:
+            response = self.s3.get_object(Bucket=self.plan_bucket, Key=self._plan_key(run_id))
+        except self.s3.exceptions.NoSuchKey:
+            return None
+        return json.loads(gzip.decompress(response['Body'].read()))
+
+    def save_plan(self, run_id, plan):
+        self.s3.put_object(Bucket=self.plan_bucket, Key=self._plan_key(run_id),
+                           Body=gzip.compress(json.dumps(plan).encode('utf-8'), compresslevel=1))
+
+    def load(self, run_id):
+        checkpoints = {}
+        kwargs = {'KeyConditionExpression': Key('run_id').eq(run_id)}
+        while True:
+            response = self.table.query(**kwargs)
+            for item in response.get('Items', []):
+                checkpoints[int(item['chunk_index'])] = (item['chunk_key'], json.loads(item['result']))
+            if 'LastEvaluatedKey' not in response:
+                return checkpoints
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def save(self, run_id, chunk_index, chunk_key, result):
+        self.table.put_item(Item={
+            'run_id': run_id,
+            'chunk_index': chunk_index,
+            'chunk_key': chunk_key,
+            'result': json.dumps(result),
+            'expires_at': int(time.time()) + self.ttl_seconds
+        })
+
+    def clear(self, run_id):
+        self.table.delete_items({'run_id': run_id, 'chunk_index': chunk_index} for chunk_index in self.load(run_id))
+        self.s3.delete_object(Bucket=self.plan_bucket, Key=self._plan_key(run_id))
+
+class LocalFileCheckpointStore:
+    """Local stand-in: one JSON file per run, rewritten as chunks finish, plus one for its plan"""
+
+    def __init__(self, directory=CHECKPOINT_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, run_id):
+        return os.path.join(self.directory, f"{run_id.replace('/', '_')}.json")
+
+    def _plan_path(self, run_id):
+        return os.path.join(self.directory, f"{run_id.replace('/', '_')}.plan.json")
+
+    def load_plan(self, run_id):
+        try:
+            with open(self._plan_path(run_id), 'r') as f:
+                return json.load(f)
+        except OSError:
+            return None
+
+    def save_plan(self, run_id, plan):
+        tmp_path = f"{self._plan_path(run_id)}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(plan, f)
+        os.replace(tmp_path, self._plan_path(run_id))
+
+    def _read(self, run_id):
+        try:
+            with open(self._path(run_id), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def load(self, run_id):
+        return {int(index): (entry['chunk_key'], entry['result']) for index, entry in self._read(run_id).items()}
+
+    def save(self, run_id, chunk_index, chunk_key, result):
+        with self._lock:
+            entries = self._read(run_id)
+            entries[str(chunk_index)] = {'chunk_key': chunk_key, 'result': result}
+            tmp_path = f"{self._path(run_id)}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self._path(run_id))
+
+    def clear(self, run_id):
+        with self._lock:
+            for path in (self._path(run_id), self._plan_path(run_id)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+def build_checkpoint_store(backend=CHECKPOINT_BACKEND):
+    """Create the store configured by CHECKPOINT_BACKEND, or None when disabled"""
+    if backend == 'dynamodb':
+        return DynamoDBCheckpointStore()
+    if backend == 'file':
+        return LocalFileCheckpointStore()
+    return None
+
+def resumable_results(store, run_id, chunk_keys):
+    """Checkpointed results that still match the current chunk plan, by chunk index.
+
+    A checkpoint is reused only if its chunk_key (hash of model, temperature
+    and prompt) equals the key of the chunk now at that index.
+    """
+    if store is None:
+        return {}
+    try:
+        saved = store.load(run_id)
+    except Exception as e:
+        print(f"Failed to load checkpoints for {run_id}: {str(e)}")
+        return {}
+    return {
+        index: result
+        for index, (chunk_key, result) in saved.items()
+        if index < len(chunk_keys) and chunk_keys[index] == chunk_key
+    }
+
+def resumable_plan(store, run_id, source, etag):
+    """The plan a previous attempt saved for this run, if it was built from the same source object.
+
+    The ETag tells a re-upload to the same key apart: a plan from an older
+    version of the object is discarded and the survey is ingested again.
+    """
+    if store is None:
+        return None
+    try:
+        plan = store.load_plan(run_id)
+    except Exception as e:
+        print(f"Failed to load the plan for {run_id}: {str(e)}")
+        return None
+    if plan is None or plan.get('source') != source:
+        return None
+    if plan.get('etag') != etag:
+        print(f"Discarding the plan for {run_id}: {source} changed since it was saved")
+        return None
+    return plan
+
+def save_plan(store, run_id, plan):
+    """Persist a run's plan; a failure only means the next attempt ingests again"""
+    try:
+        store.save_plan(run_id, plan)
+        return True
+    except Exception as e:
+        print(f"Failed to save the plan for {run_id}: {str(e)}")
+        return False
@@ -0,0 +1,103 @@
+import math
+import os
+
+from dedup import feedback_fields, multiplicity
+
+# Token budgets for a single analysis call
+CHUNK_INPUT_TOKEN_BUDGET = int(os.environ.get('CHUNK_INPUT_TOKEN_BUDGET', '6000'))
+CHUNK_OUTPUT_TOKEN_RESERVE = int(os.environ.get('CHUNK_OUTPUT_TOKEN_RESERVE', '2000'))
+MODEL_CONTEXT_TOKENS = int(os.environ.get('MODEL_CONTEXT_TOKENS', '200000'))
+CHUNK_MAX_RESPONSES = int(os.environ.get('CHUNK_MAX_RESPONSES', '100'))
+
+# Claude tokenizes English prose at roughly 4 characters per token
+CHARS_PER_TOKEN = 4
+
+# Metadata key holding the tag of the group (stratum) a response belongs to
+# when several groups share chunks; the tag is shown in the prompt
+GROUP_KEY = '_group'
+
+def estimate_tokens(text):
+    """Cheap upper-leaning token estimate for a piece of prompt text"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+def group_tag(index):
+    """Prompt tag of the index-th group"""
+    return f"G{index + 1}"
+
+def chunk_tags(feedback_chunk):
+    """Group tags of a chunk's responses, in order of first appearance"""
+    return list(dict.fromkeys(response[GROUP_KEY] for response in feedback_chunk if GROUP_KEY in response))
+
+def chunk_group_weights(feedback_chunk, labels):
+    """{group label: responses it stands for in the chunk}; labels maps group tags to labels"""
+    weights = {}
+    for response in feedback_chunk:
+        label = labels[response[GROUP_KEY]]
+        weights[label] = weights.get(label, 0) + multiplicity(response)
+    return weights
+
+def format_response_block(index, response):
+    """Render one response exactly as it appears in the analysis prompt"""
+    count = multiplicity(response)
+    suffix = f" (x{count} similar responses)" if count > 1 else ""
+    if GROUP_KEY in response:
+        suffix += f" [{response[GROUP_KEY]}]"
+    block = f"\n--- Response {index}{suffix} ---\n"
+    for column, text in feedback_fields(response):
+        block += f"{column.replace('_', ' ').title()}: {text}\n"
+    return block
+
+def format_feedback_text(feedback_chunk):
+    """Render a whole chunk of responses for the analysis prompt"""
+    return "".join(format_response_block(i, response) for i, response in enumerate(feedback_chunk, 1))
+
+def truncate_response(response, max_tokens):
+    """Shrink every field of an oversized response evenly so it fits max_tokens"""
+    fields = dict(feedback_fields(response))
+    max_chars = max(1, max_tokens * CHARS_PER_TOKEN // max(1, len(fields)))
+    truncated = {col: value for col, value in response.items() if col not in fields}
+    truncated.update({col: text[:max_chars] for col, text in fields.items()})
+    return truncated
+
+def response_budget(prompt_overhead_tokens, input_budget=None, output_reserve=None, context_tokens=None):
+    """Tokens left for responses once the prompt template and model output are accounted for"""
+    input_budget = input_budget or CHUNK_INPUT_TOKEN_BUDGET
+    output_reserve = output_reserve or CHUNK_OUTPUT_TOKEN_RESERVE
+    context_tokens = context_tokens or MODEL_CONTEXT_TOKENS
+    return max(1, min(input_budget, context_tokens - output_reserve) - prompt_overhead_tokens)
+
+def chunk_by_token_budget(feedback_data, prompt_overhead_tokens=0, input_budget=None,
+                          output_reserve=None, context_tokens=None, max_responses=None):
+    """Greedily pack responses into chunks that fit the token budget.
+
+    Returns (chunks, chunk_token_counts) where each count is the estimated
+    prompt size of that chunk including the template overhead.
+    """
+    budget = response_budget(prompt_overhead_tokens, input_budget, output_reserve, context_tokens)
+    max_responses = max_responses or CHUNK_MAX_RESPONSES
+
+    chunks = []
+    chunk_tokens = []
+    current = []
+    current_tokens = 0
+
+    for response in feedback_data:
+        tokens = estimate_tokens(format_response_block(len(current) + 1, response))
+        if tokens > budget:
+            response = truncate_response(response, budget)
+            tokens = estimate_tokens(format_response_block(len(current) + 1, response))
+
+        if current and (current_tokens + tokens > budget or len(current) >= max_responses):
+            chunks.append(current)
+            chunk_tokens.append(current_tokens + prompt_overhead_tokens)
+            current = []
+            current_tokens = 0
+
+        current.append(response)
+        current_tokens += tokens
+
+    if current:
+        chunks.append(current)
+        chunk_tokens.append(current_tokens + prompt_overhead_tokens)
+
+    return chunks, chunk_tokens
@@ -0,0 +1,165 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from dedup import multiplicity
+from local_sentiment import SENTIMENT_KEYS
+from sampling import stratum_sentiment_counts
+
+# Per-cohort (batch_code) rating and sentiment breakdown
+COHORT_ANALYTICS = os.environ.get('COHORT_ANALYTICS', 'on') == 'on'
+COHORT_COLUMN = os.environ.get('COHORT_COLUMN', 'batch_code')
+# Largest cohorts reported one by one; the rest are summed into 'other'
+COHORT_LIMIT = int(os.environ.get('COHORT_LIMIT', '20'))
+# Reported cohorts with at least this many feedback responses get chunks of their own (and a sentiment)
+COHORT_MIN_RESPONSES = int(os.environ.get('COHORT_MIN_RESPONSES', '20'))
+
+COHORT_KEY = '_cohort'
+UNKNOWN_COHORT = 'unknown'
+
+def row_cohorts(df):
+    """Cohort label per row, or None when the survey has no cohort column"""
+    if COHORT_COLUMN not in df.columns:
+        return None
+    return df[COHORT_COLUMN].fillna(UNKNOWN_COHORT).astype(str).to_numpy(dtype=object)
+
+class CohortAccumulator:
+    """Per-cohort rating sums and counts, built batch by batch with one groupby each.
+
+    Rating columns are passed per batch, so a column rejected later by the
+    rating detector is simply left out of result().
+    """
+
+    def __init__(self):
+        self.totals = None
+
+    def add(self, df, rating_columns):
+        cohorts = row_cohorts(df)
+        if cohorts is None or df.empty:
+            return
+        columns = [col for col in rating_columns if col in df.columns]
+        values = df[columns].to_numpy(dtype=float)
+        rated = ~np.isnan(values)
+
+        # Sums, non-null counts and row counts side by side, grouped in a single pass
+        frame = pd.DataFrame(
+            np.hstack([np.where(rated, values, 0.0), rated, np.ones((len(df), 1))]),
+            columns=pd.MultiIndex.from_tuples(
+                [('sum', col) for col in columns] + [('count', col) for col in columns] + [('rows', '')]),
+            index=cohorts
+        )
+        batch_totals = frame.groupby(level=0, sort=False).sum()
+        self.totals = batch_totals if self.totals is None else self.totals.add(batch_totals, fill_value=0)
+
+    def result(self, rating_columns, limit=None):
+        """Compact per-cohort rating report.
+
+        The limit largest cohorts get their row count, mean rating and the
+        mean of each rating column (a list aligned with 'rating_columns');
+        the remaining cohorts are summed into 'other'.
+        """
+        limit = COHORT_LIMIT if limit is None else limit
+        if self.totals is None:
+            return {}
+
+        totals = self.totals.sort_values(('rows', ''), ascending=False, kind='stable')
+        # Through the full column index: a survey without rating columns has no 'sum' level to select
+        sums = totals.reindex(columns=pd.MultiIndex.from_product([['sum'], rating_columns]), fill_value=0).to_numpy()
+        counts = totals.reindex(columns=pd.MultiIndex.from_product([['count'], rating_columns]),
+                                fill_value=0).to_numpy()
+        rows = totals[('rows', '')].to_numpy()
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            column_means = sums / counts
+            mean_rating = sums.sum(axis=1) / counts.sum(axis=1)
+
+        cohorts = {}
+        for i, cohort in enumerate(totals.index[:limit]):
+            cohorts[cohort] = {
+                'rows': int(rows[i]),
+                'mean_rating': _rounded(mean_rating[i]),
+                'rating_means': [_rounded(value) for value in column_means[i]]
+            }
+        report = {'column': COHORT_COLUMN, 'rating_columns': list(rating_columns), 'cohorts': cohorts}
+
+        if len(totals) > limit:
+            rest_sum = sums[limit:].sum()
+            rest_count = counts[limit:].sum()
+            report['other'] = {
+                'cohorts': len(totals) - limit,
+                'rows': int(rows[limit:].sum()),
+                'mean_rating': _rounded(rest_sum / rest_count) if rest_count else None
+            }
+        return report
+
+def _rounded(value):
+    return round(float(value), 2) if np.isfinite(value) else None
+
+def cohort_of(responses):
+    """The cohort shared by every response, or None when they are mixed"""
+    cohorts = {response.get(COHORT_KEY) for response in responses}
+    return cohorts.pop() if len(cohorts) == 1 else None
+
+def cohort_groups(unique_feedback, report, min_responses=None):
+    """Split responses into (label, responses) groups for chunking.
+
+    Reported cohorts with at least min_responses responses form their own
+    group, labelled with the cohort; everything else shares one group
+    labelled None, as a handful of answers gives no meaningful sentiment.
+    Groups share chunks (see chunking.GROUP_KEY), so the number of groups
+    does not add model calls.
+    """
+    min_responses = COHORT_MIN_RESPONSES if min_responses is None else min_responses
+    reported = set(report.get('cohorts', {}))
+    sizes = {}
+    for response in unique_feedback:
+        cohort = response.get(COHORT_KEY)
+        if cohort in reported:
+            sizes[cohort] = sizes.get(cohort, 0) + multiplicity(response)
+    own = {cohort for cohort, size in sizes.items() if size >= min_responses}
+
+    members = {cohort: [] for cohort in report.get('cohorts', {}) if cohort in own}
+    pooled = []
+    for response in unique_feedback:
+        cohort = response.get(COHORT_KEY)
+        if cohort in own:
+            members[cohort].append(response)
+        else:
+            pooled.append(response)
+
+    groups = list(members.items())
+    if pooled:
+        groups.append((None, pooled))
+    return groups
+
+def cohort_sentiment(groups, chunk_groups, chunk_insights, group_local_sentiment, expansion=None, skip=None):
+    """Sentiment percentages per cohort from groups that each hold a single cohort.
+
+    expansion scales a group's counts to the responses it stands for
+    (sampling mode); groups are counted as they are otherwise.
+    """
+    counts = stratum_sentiment_counts(groups, chunk_groups, chunk_insights, group_local_sentiment, skip=skip)
+    totals = {}
+    for label, members in groups:
+        cohort = cohort_of(members)
+        if cohort is None:
+            continue
+        scale = expansion.get(label, 0) if expansion is not None else 1
+        cohort_counts = totals.setdefault(cohort, dict.fromkeys(SENTIMENT_KEYS, 0.0))
+        for key in SENTIMENT_KEYS:
+            cohort_counts[key] += counts[label][key] * scale
+
+    sentiment = {}
+    for cohort, cohort_counts in totals.items():
+        total = sum(cohort_counts.values())
+        if total > 0:
+            sentiment[cohort] = {key: round(100 * cohort_counts[key] / total, 1) for key in SENTIMENT_KEYS}
+    return sentiment
+
+def attach_sentiment(report, sentiment):
+    """Add each reported cohort's sentiment (when it has one) to the rating report"""
+    for cohort, entry in report.get('cohorts', {}).items():
+        if cohort in sentiment:
+            entry['sentiment'] = sentiment[cohort]
+    return report
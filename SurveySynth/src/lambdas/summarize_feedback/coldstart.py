@@ -0,0 +1,161 @@
+import importlib.util
+import os
+import sys
+import threading
+import time
+import types
+
+# Time every module import so cold starts are measured, not guessed
+COLDSTART_PROFILE = os.environ.get('COLDSTART_PROFILE', 'on') == 'on'
+COLDSTART_LOG_TOP = int(os.environ.get('COLDSTART_LOG_TOP', '10'))
+
+def lazy_import(name):
+    """Module object whose body only runs on first attribute access (importlib LazyLoader)"""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f"No module named {name!r}")
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+_UNSET = object()
+
+class LazyObject:
+    """Proxy that builds its target (a client, table, backend...) on first attribute access"""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._target = _UNSET
+        self._lock = threading.Lock()
+
+    def _resolve(self):
+        if self._target is _UNSET:
+            with self._lock:
+                if self._target is _UNSET:
+                    self._target = self._factory()
+        return self._target
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+def lazy_object(factory):
+    return LazyObject(factory)
+
+def lazy_value(obj):
+    """The built target of a lazy_object (which may be None); lazy_import modules are loaded"""
+    if isinstance(obj, LazyObject):
+        return obj._resolve()
+    if isinstance(obj, types.ModuleType):
+        # Any attribute access runs a LazyLoader module's body
+        obj.__name__
+    return obj
+
+class _TimedLoader:
+    """Wraps a module loader and reports how long the module took to create and execute"""
+
+    def __init__(self, loader, name, profiler):
+        self._loader = loader
+        self._name = name
+        self._profiler = profiler
+
+    def create_module(self, spec):
+        # Extension modules do their work here rather than in exec_module
+        with self._profiler.timing(self._name):
+            return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        with self._profiler.timing(self._name):
+            self._loader.exec_module(module)
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+class _Timing:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler._enter(self.name)
+
+    def __exit__(self, *exc):
+        self.profiler._exit(self.name)
+
+class ImportProfiler:
+    """sys.meta_path hook recording per-module import time.
+
+    For every module it keeps total time (including the modules it imported)
+    and self time. Imports triggered later by lazy modules are recorded too,
+    so log() after the first analysis shows what that path pulled in.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.modules = {}  # name -> [self_ms, total_ms]
+        self._stack = threading.local()
+        self._lock = threading.Lock()
+        self._logged = set()
+
+    @classmethod
+    def install(cls):
+        profiler = cls()
+        sys.meta_path.insert(0, profiler)
+        return profiler
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if spec.loader is not None and hasattr(spec.loader, 'exec_module') and \
+                not isinstance(spec.loader, _TimedLoader):
+            spec.loader = _TimedLoader(spec.loader, name, self)
+        return spec
+
+    def timing(self, name):
+        return _Timing(self, name)
+
+    def _enter(self, name):
+        stack = getattr(self._stack, 'frames', None)
+        if stack is None:
+            stack = self._stack.frames = []
+        # [name, start, time spent in nested imports]
+        stack.append([name, time.perf_counter(), 0.0])
+
+    def _exit(self, name):
+        stack = self._stack.frames
+        _, started, nested = stack.pop()
+        total = (time.perf_counter() - started) * 1000
+        if stack:
+            stack[-1][2] += total
+        with self._lock:
+            entry = self.modules.setdefault(name, [0.0, 0.0])
+            entry[0] += total - nested
+            entry[1] += total
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def log(self, label, top=COLDSTART_LOG_TOP, only_new=False):
+        """Print modules imported since the previous log(), slowest (self time) first.
+
+        With only_new, nothing is printed when no module was imported since.
+        """
+        with self._lock:
+            fresh = {name: times for name, times in self.modules.items() if name not in self._logged}
+            self._logged.update(fresh)
+        if only_new and not fresh:
+            return
+        slowest = sorted(fresh.items(), key=lambda item: -item[1][0])[:top]
+        print(f"Import profile [{label}]: {len(fresh)} modules, "
+              f"{sum(times[0] for times in fresh.values()):.0f} ms total; slowest (self/total ms): " +
+              ', '.join(f"{name} {times[0]:.0f}/{times[1]:.0f}" for name, times in slowest))
@@ -0,0 +1,72 @@
+import json
+import os
+import threading
+
+from coldstart import lazy_import, lazy_object
+
+boto3 = lazy_import('boto3')
+
+# Stop starting new chunks once less than this much invocation time remains
+CONTINUATION_RESERVE_MS = int(os.environ.get('CONTINUATION_RESERVE_MS', '60000'))
+# Upper bound on self re-invocations for one upload
+CONTINUATION_MAX_HOPS = int(os.environ.get('CONTINUATION_MAX_HOPS', '25'))
+
+# Key of the payload a continuation invocation receives instead of stream Records
+CONTINUATION_EVENT_KEY = 'continuation'
+
+# Created on the first continuation, not at cold start
+lambda_client = lazy_object(lambda: boto3.client('lambda'))
+
+class AnalysisIncomplete(Exception):
+    """Raised when the time budget ran out before every chunk was analyzed"""
+
+    def __init__(self, done, total):
+        super().__init__(f"Analyzed {done}/{total} chunks before the time budget ran out")
+        self.done = done
+        self.total = total
+
+class TimeBudget:
+    """Watches the Lambda deadline; the reserve grows to 1.5x the slowest chunk seen"""
+
+    def __init__(self, context, reserve_ms=CONTINUATION_RESERVE_MS):
+        self.context = context
+        self.reserve_ms = reserve_ms
+        self._slowest_ms = 0
+        self._lock = threading.Lock()
+
+    def remaining_ms(self):
+        return self.context.get_remaining_time_in_millis()
+
+    def expired(self):
+        """True once there is not enough time left to start (and finish) another chunk"""
+        with self._lock:
+            reserve_ms = max(self.reserve_ms, 1.5 * self._slowest_ms)
+        return self.remaining_ms() < reserve_ms
+
+    def note_chunk(self, seconds):
+        with self._lock:
+            self._slowest_ms = max(self._slowest_ms, seconds * 1000)
+
+def continuation_event(user_id, upload_id, s3_silver_path, hop, lease_owner=None):
+    """Payload that resumes one upload's analysis in a fresh invocation, under the same lease"""
+    return {
+        CONTINUATION_EVENT_KEY: {
+            'user_id': user_id,
+            'upload_id': upload_id,
+            's3_silver_path': s3_silver_path,
+            'hop': hop,
+            'lease_owner': lease_owner
+        }
+    }
+
+def failed_continuation(record):
+    """The continuation payload of an OnFailure destination record, or None for any other event"""
+    return record.get('requestPayload', {}).get(CONTINUATION_EVENT_KEY)
+
+def schedule_continuation(function_name, event):
+    """Asynchronously re-invoke this function with the continuation payload"""
+    lambda_client.invoke(
+        FunctionName=function_name,
+        InvocationType='Event',
+        Payload=json.dumps(event).encode('utf-8')
+    )
@@ -0,0 +1,337 @@
+import hashlib
+import os
+import re
+import unicodedata
+
+import numpy as np
+
+# Estimated Jaccard similarity (over character shingles) above which two responses are merged
+DEDUP_SIMILARITY = float(os.environ.get('DEDUP_SIMILARITY', '0.8'))
+SHINGLE_SIZE = 5
+MINHASH_PERMUTATIONS = 64
+MINHASH_BLOCK = 16  # texts and permutations hashed per pass (keeps the scratch array in cache)
+LSH_BANDS = 16  # 16 bands x 4 rows: pairs above ~0.5 Jaccard become candidates
+LSH_MAX_CANDIDATES = 16  # representatives checked per response
+LSH_BUCKET_SCAN = 16  # earliest representatives read from each band bucket
+SIGNATURE_BATCH = 256  # new responses hashed and matched per vectorized batch (bounds scratch memory)
+
+# Metadata keys on a response dict start with this prefix and are never sent as feedback
+META_PREFIX = '_'
+MULTIPLICITY_KEY = '_count'
+
+_rng = np.random.default_rng(1729)
+_PERM_A = _rng.integers(1, 1 << 63, MINHASH_PERMUTATIONS, dtype=np.uint64) | np.uint64(1)
+_PERM_B = _rng.integers(0, 1 << 63, MINHASH_PERMUTATIONS, dtype=np.uint64)
+_BAND_MIX = _rng.integers(1, 1 << 63, MINHASH_PERMUTATIONS // LSH_BANDS, dtype=np.uint64) | np.uint64(1)
+_SHINGLE_WEIGHTS = 256 ** np.arange(SHINGLE_SIZE, dtype=np.uint64)
+_SHINGLE_PRIME = np.uint64(4294967291)  # largest prime below 2**32
+# Salts equal band values in different bands apart, so all bands share one index
+_BAND_SALT = _rng.integers(0, 1 << 63, LSH_BANDS, dtype=np.uint64)
+# Mixed into band keys so each partition has buckets of its own
+_PARTITION_MIX = _rng.integers(1, 1 << 63, dtype=np.uint64) | np.uint64(1)
+
+def feedback_fields(response):
+    """Yield the (column, text) pairs of a response, skipping metadata keys"""
+    for column, text in response.items():
+        if not column.startswith(META_PREFIX):
+            yield column, text
+
+def multiplicity(response):
+    """Number of original responses a (possibly collapsed) response stands for"""
+    return response.get(MULTIPLICITY_KEY, 1)
+
+# Anything but word characters and whitespace, in any script
+NON_WORD = re.compile(r'[^\w\s]')
+
+def _drop_non_word(match):
+    # Combining marks (Devanagari vowel signs, accents) are part of their word
+    char = match.group()
+    return char if unicodedata.category(char).startswith('M') else ' '
+
+def normalize_text(text):
+    """Lower-case, drop punctuation and symbols and collapse whitespace"""
+    return ' '.join(NON_WORD.sub(_drop_non_word, str(text).lower()).split())
+
+def text_key(text):
+    """normalize_text, or the stripped text when nothing is left (e.g. an emoji-only answer).
+
+    Used wherever texts are merged or counted by their normalized form, so
+    such texts never all collapse into one empty key.
+    """
+    return normalize_text(text) or str(text).strip()
+
+def shingle_batch(texts):
+    """Character shingles of a batch of normalized texts, hashed with NumPy.
+
+    Each SHINGLE_SIZE-byte window is packed into an integer and folded into
+    32 bits. Returns (hashes, offsets): text i owns hashes[offsets[i]:offsets[i + 1]].
+    """
+    encoded = [text.encode('utf-8').ljust(SHINGLE_SIZE) for text in texts]
+    lengths = np.fromiter((len(e) for e in encoded), dtype=np.int64, count=len(encoded))
+    data = np.frombuffer(b''.join(encoded), dtype=np.uint8).astype(np.uint64)
+
+    windows = np.lib.stride_tricks.sliding_window_view(data, SHINGLE_SIZE)
+    packed = windows @ _SHINGLE_WEIGHTS
+    packed %= _SHINGLE_PRIME
+
+    # Drop windows that straddle two texts
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    counts = lengths - SHINGLE_SIZE + 1
+    keep = np.repeat(starts, counts) + (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts))
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    return packed[keep], offsets
+
+def minhash_signatures(hashes, offsets):
+    """MinHash signatures (one row per text) over MINHASH_PERMUTATIONS universal hash functions"""
+    # Multiply-shift hashing in wrapping uint64 arithmetic (no slow modulo),
+    # a block of texts and permutations at a time so the scratch array stays in cache
+    signatures = np.empty((len(offsets) - 1, MINHASH_PERMUTATIONS), dtype=np.uint64)
+    for first in range(0, len(offsets) - 1, MINHASH_BLOCK):
+        texts = slice(first, first + MINHASH_BLOCK)
+        block_offsets = offsets[first:first + MINHASH_BLOCK + 1]
+        block_hashes = hashes[block_offsets[0]:block_offsets[-1]]
+        for start in range(0, MINHASH_PERMUTATIONS, MINHASH_BLOCK):
+            permutations = slice(start, start + MINHASH_BLOCK)
+            permuted = np.multiply(_PERM_A[permutations, None], block_hashes[None, :])
+            permuted += _PERM_B[permutations, None]
+            permuted >>= np.uint64(32)
+            signatures[texts, permutations] = np.minimum.reduceat(
+                permuted, block_offsets[:-1] - block_offsets[0], axis=1).T
+    return signatures
+
+def band_keys(signatures, partitions=None):
+    """One 32-bit LSH key per band of each signature: its rows mixed together, salted by band.
+
+    With partitions (one integer code per signature), equal bands in
+    different partitions get different keys, so buckets never fill up with
+    representatives that could not be merged anyway.
+    """
+    rows_per_band = MINHASH_PERMUTATIONS // LSH_BANDS
+    # Wrapping uint64 arithmetic; the high bits are the best mixed
+    mixed = (signatures.reshape(-1, LSH_BANDS, rows_per_band) * _BAND_MIX).sum(axis=2) ^ _BAND_SALT
+    if partitions is not None:
+        mixed += partitions.astype(np.uint64)[:, None] * _PARTITION_MIX
+    return (mixed >> np.uint64(32)).astype(np.uint32)
+
+class BandIndex:
+    """Append-only LSH index from band keys to cluster representatives.
+
+    Keys are kept in a few sorted NumPy runs; a run is merged into the one
+    before it once it is as large, so adding n keys costs O(n log n) overall
+    and a lookup is one binary search per run.
+    """
+
+    def __init__(self):
+        self.runs = []
+
+    def add(self, keys, clusters):
+        order = np.argsort(keys, kind='stable')
+        self.runs.append((keys[order], clusters[order]))
+        while len(self.runs) > 1 and len(self.runs[-2][0]) <= len(self.runs[-1][0]):
+            newer_keys, newer_clusters = self.runs.pop()
+            older_keys, older_clusters = self.runs.pop()
+            # Newer entries go after equal older keys, so the earliest
+            # representatives stay first; no sort or index array of the whole run
+            at = np.searchsorted(older_keys, newer_keys, side='right') + np.arange(len(newer_keys))
+            from_older = np.ones(len(older_keys) + len(newer_keys), dtype=bool)
+            from_older[at] = False
+            keys = np.empty(len(from_older), dtype=older_keys.dtype)
+            keys[at] = newer_keys
+            keys[from_older] = older_keys
+            clusters = np.empty(len(from_older), dtype=older_clusters.dtype)
+            clusters[at] = newer_clusters
+            clusters[from_older] = older_clusters
+            self.runs.append((keys, clusters))
+
+    def lookup(self, keys, limit):
+        """(query, cluster) pairs: up to limit of the earliest clusters per run sharing each key"""
+        # Binary searches for sorted needles walk each run once
+        needles = np.argsort(keys)
+        sorted_keys = keys[needles]
+        queries = []
+        clusters = []
+        for run_keys, run_clusters in self.runs:
+            # Equal keys are contiguous: read up to limit entries from the first one
+            first = np.searchsorted(run_keys, sorted_keys)
+            found = np.flatnonzero(run_keys[np.minimum(first, len(run_keys) - 1)] == sorted_keys)
+            window = first[found, None] + np.arange(limit)
+            inside = window < len(run_keys)
+            window = np.minimum(window, len(run_keys) - 1)
+            equal = np.cumprod(inside & (run_keys[window] == sorted_keys[found, None]), axis=1, dtype=bool)
+            queries.append(np.broadcast_to(needles[found, None], window.shape)[equal])
+            clusters.append(run_clusters[window[equal]])
+        if not queries:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate(queries), np.concatenate(clusters).astype(np.int64)
+
+def _best_matches(queries, candidates, query_signatures, candidate_signatures, similarity):
+    """(query, candidate) pairs estimated at least similarity, best first within each query.
+
+    queries and candidates hold one entry per shared band. Only the
+    LSH_MAX_CANDIDATES candidates sharing the most bands with a query are
+    compared; ties go to the earliest candidate.
+    """
+    # Orderings use one composite int64 key: query, then rank, then candidate
+    modulus = len(candidate_signatures)
+    pair_keys, band_hits = np.unique(queries * modulus + candidates, return_counts=True)
+    queries, candidates = np.divmod(pair_keys, modulus)
+    order = np.argsort((queries * (LSH_BANDS + 1) + LSH_BANDS - band_hits) * modulus + candidates)
+    queries, candidates = queries[order], candidates[order]
+    rank = np.arange(len(queries)) - np.searchsorted(queries, queries)
+    queries, candidates = queries[rank < LSH_MAX_CANDIDATES], candidates[rank < LSH_MAX_CANDIDATES]
+
+    # Fraction of agreeing MinHash components estimates Jaccard similarity
+    agreeing = np.count_nonzero(candidate_signatures[candidates] == query_signatures[queries], axis=1)
+    similar = agreeing >= similarity * MINHASH_PERMUTATIONS
+    queries, candidates, agreeing = queries[similar], candidates[similar], agreeing[similar]
+    order = np.argsort((queries * (MINHASH_PERMUTATIONS + 1) + MINHASH_PERMUTATIONS - agreeing) * modulus
+                       + candidates)
+    return queries[order], candidates[order]
+
+def _first_per_query(queries, candidates):
+    first = np.unique(queries, return_index=True)[1]
+    return queries[first], candidates[first]
+
+def _grown(array, size):
+    """array with room for at least size rows (capacity doubles)"""
+    if size <= len(array):
+        return array
+    grown = np.empty((max(size, 2 * len(array)),) + array.shape[1:], dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+class TooManyUniqueResponses(Exception):
+    """Raised by collapse_duplicates once more than max_unique representatives would be retained"""
+
+    def __init__(self, max_unique):
+        super().__init__(f"More than {max_unique} distinct responses")
+        self.max_unique = max_unique
+
+def collapse_duplicates(feedback_data, similarity=None, partition_key=None, max_unique=None):
+    """Collapse exact and near-duplicate responses in one streaming pass.
+
+    Returns the unique responses in first-seen order, each carrying a
+    MULTIPLICITY_KEY count of how many original responses it represents.
+    Responses with different values under the partition_key metadata key
+    (e.g. their cohort) are never merged and get LSH buckets of their own.
+
+    Only cluster representatives are retained: an exact duplicate (after
+    normalization) only bumps a count, and a near duplicate is matched
+    against the representatives and dropped. New texts are handled
+    SIGNATURE_BATCH at a time with NumPy: MinHash signatures, LSH lookups
+    in a BandIndex and similarity estimates all run per batch, so
+    per-response Python work is a dict lookup. As before, buckets are read
+    up to LSH_BUCKET_SCAN entries and at most LSH_MAX_CANDIDATES
+    representatives (those sharing the most bands) are compared.
+
+    Memory grows with the number of representatives; with max_unique the
+    pass stops with TooManyUniqueResponses as soon as that many are exceeded.
+    """
+    similarity = DEDUP_SIMILARITY if similarity is None else similarity
+
+    responses = []  # cluster representatives, first-seen order
+    counts = []
+    cluster_of = {}  # digest of (partition, normalized fields) -> cluster
+    partition_codes = {}
+    signatures = np.empty((0, MINHASH_PERMUTATIONS), dtype=np.uint16)
+    partitions = np.empty(0, dtype=np.int64)
+    index = BandIndex()
+
+    # Distinct texts not seen before, waiting for the next vectorized batch
+    pending = {}  # digest -> position in the batch
+    batch = []  # [digest, response, count, signature text, partition code]
+
+    def flush():
+        nonlocal signatures, partitions
+        size = len(batch)
+        codes = np.fromiter((entry[4] for entry in batch), dtype=np.int64, count=size)
+        target = np.full(size, -1, dtype=np.int64)
+        earlier = {}
+
+        if similarity < 1.0:
+            batch_signatures = minhash_signatures(*shingle_batch([entry[3] for entry in batch]))
+            keys = band_keys(batch_signatures, codes)
+            # The low 16 bits of each component are enough to estimate similarity (b-bit MinHash)
+            batch_signatures = batch_signatures.astype(np.uint16)
+
+            # Against the representatives of earlier batches
+            queries, candidates = index.lookup(keys.ravel(), LSH_BUCKET_SCAN)
+            queries //= LSH_BANDS
+            same = partitions[candidates] == codes[queries]
+            if same.any():
+                queries, candidates = _first_per_query(*_best_matches(
+                    queries[same], candidates[same], batch_signatures, signatures, similarity))
+                target[queries] = candidates
+
+            # Within the batch: each unmatched text against earlier unmatched
+            # texts sharing a band key, resolved in order so merges only go to
+            # texts that stayed representatives
+            unmatched = np.flatnonzero(target < 0)
+            if len(unmatched) > 1:
+                flat_keys = keys[unmatched].ravel()
+                flat_positions = np.repeat(unmatched, LSH_BANDS)
+                order = np.lexsort((flat_positions, flat_keys))
+                flat_keys, flat_positions = flat_keys[order], flat_positions[order]
+                starts = np.flatnonzero(np.concatenate(([True], flat_keys[1:] != flat_keys[:-1])))
+                group_start = np.repeat(starts, np.diff(np.append(starts, len(flat_keys))))
+                n_earlier = np.minimum(np.arange(len(flat_keys)) - group_start, LSH_BUCKET_SCAN)
+                offsets = np.arange(n_earlier.sum()) - np.repeat(np.cumsum(n_earlier) - n_earlier, n_earlier)
+                later_positions = np.repeat(flat_positions, n_earlier)
+                earlier_positions = flat_positions[np.repeat(group_start, n_earlier) + offsets]
+                valid = (earlier_positions < later_positions) & (codes[earlier_positions] == codes[later_positions])
+                if valid.any():
+                    later_positions, earlier_positions = _best_matches(
+                        later_positions[valid], earlier_positions[valid], batch_signatures, batch_signatures,
+                        similarity)
+                    for j, i in zip(later_positions.tolist(), earlier_positions.tolist()):
+                        if j not in earlier and i not in earlier:
+                            earlier[j] = i
+
+        new = [position for position in range(size) if target[position] < 0 and position not in earlier]
+        first_new = len(responses)
+        for k, position in enumerate(new):
+            target[position] = first_new + k
+            responses.append(batch[position][1])
+            counts.append(0)
+        for j, i in earlier.items():
+            target[j] = target[i]
+        for (digest, _, count, _, _), cluster in zip(batch, target.tolist()):
+            cluster_of[digest] = cluster
+            counts[cluster] += count
+
+        if similarity < 1.0 and new:
+            new = np.asarray(new)
+            signatures = _grown(signatures, len(responses))
+            signatures[first_new:len(responses)] = batch_signatures[new]
+            partitions = _grown(partitions, len(responses))
+            partitions[first_new:len(responses)] = codes[new]
+            index.add(keys[new].ravel(), np.repeat(np.arange(first_new, len(responses), dtype=np.int32), LSH_BANDS))
+        pending.clear()
+        batch.clear()
+        if max_unique is not None and len(responses) > max_unique:
+            raise TooManyUniqueResponses(max_unique)
+
+    for response in feedback_data:
+        partition = response.get(partition_key) if partition_key is not None else None
+        code = partition_codes.setdefault(partition, len(partition_codes))
+        fields = [(col, text_key(text)) for col, text in feedback_fields(response)]
+        digest = hashlib.blake2b(
+            '\x1e'.join([str(code)] + [f"{col}\x1f{text}" for col, text in fields]).encode('utf-8'),
+            digest_size=16).digest()
+
+        if digest in cluster_of:
+            counts[cluster_of[digest]] += multiplicity(response)
+        elif digest in pending:
+            batch[pending[digest]][2] += multiplicity(response)
+        else:
+            pending[digest] = len(batch)
+            batch.append([digest, response, multiplicity(response), ' | '.join(text for _, text in fields), code])
+            if len(batch) >= SIGNATURE_BATCH:
+                flush()
+    if batch:
+        flush()
+
+    # Replaced one by one, so the input dicts are freed as the output is built
+    for i, count in enumerate(counts):
+        responses[i] = {**responses[i], MULTIPLICITY_KEY: count}
+    return responses
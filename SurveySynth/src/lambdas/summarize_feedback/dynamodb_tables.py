@@ -0,0 +1,42 @@
+import functools
+import threading
+
+import boto3
+
+# boto3 resources (and their Table objects) must not be shared between
+# threads; clients can be. The DynamoDB resource registers its type
+# conversion and condition building on its own client, so that client takes
+# and returns plain Python values just like Table does. One such client is
+# shared by every upload and chunk worker in the container.
+_client = None
+_client_lock = threading.Lock()
+
+def shared_client():
+    """The container's DynamoDB client, built on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = boto3.resource('dynamodb').meta.client
+    return _client
+
+class SharedTable:
+    """Thread-safe stand-in for a boto3 Table: item operations on the shared client"""
+
+    OPERATIONS = ('get_item', 'put_item', 'update_item', 'delete_item', 'query')
+
+    def __init__(self, table_name):
+        self.table_name = table_name
+
+    def __getattr__(self, operation):
+        if operation not in self.OPERATIONS:
+            raise AttributeError(operation)
+        return functools.partial(getattr(shared_client(), operation), TableName=self.table_name)
+
+    def delete_items(self, keys):
+        """Delete items by key, 25 to a BatchWriteItem call, retrying unprocessed ones"""
+        keys = list(keys)
+        for start in range(0, len(keys), 25):
+            requests = {self.table_name: [{'DeleteRequest': {'Key': key}} for key in keys[start:start + 25]]}
+            while requests:
+                requests = shared_client().batch_write_item(RequestItems=requests).get('UnprocessedItems')
@@ -0,0 +1,48 @@
+import numpy as np
+
+# Free-text columns produced by the Glue preprocessing job
+FEEDBACK_COLUMNS = [
+    'liked_most',
+    'improvement_suggestions',
+    'additional_comments',
+    'feedback_text',
+    'needs_more_emphasis'
+]
+
+# Cell values that carry no feedback once stripped and lower-cased
+EMPTY_PLACEHOLDERS = ['nan', 'none', '']
+
+def clean_feedback_column(series):
+    """Strip a column and mask nulls/placeholders, returning (values, keep_mask) arrays"""
+
+    text = series.astype(str).str.strip()
+    keep = series.notna() & ~text.str.lower().isin(EMPTY_PLACEHOLDERS) & text.notna()
+    return text.to_numpy(dtype=object), keep.to_numpy(dtype=bool)
+
+def extract_feedback_responses(df, columns, row_meta=None):
+    """Build one {column: text} dict per row that has any usable feedback, column-wise.
+
+    row_meta maps metadata keys (e.g. '_stratum') to arrays aligned with the
+    rows of df; each response gets its row's values under those keys.
+    """
+
+    if not columns or df.empty:
+        return []
+
+    cleaned = [clean_feedback_column(df[col]) for col in columns]
+    values = [v for v, _ in cleaned]
+    masks = [m for _, m in cleaned]
+
+    # Only rows with at least one non-empty answer become responses
+    rows = np.flatnonzero(np.logical_or.reduce(masks))
+    row_values = zip(*(v[rows].tolist() for v in values))
+    row_masks = zip(*(m[rows].tolist() for m in masks))
+
+    responses = [
+        {col: value for col, value, keep in zip(columns, vals, keeps) if keep}
+        for vals, keeps in zip(row_values, row_masks)
+    ]
+    for key, meta in (row_meta or {}).items():
+        for response, value in zip(responses, np.asarray(meta)[rows].tolist()):
+            response[key] = value
+    return responses
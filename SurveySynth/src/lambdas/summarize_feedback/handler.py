@@ -1,32 +1,178 @@
-import boto3
+# The profiler goes in first so it sees every import that follows
+from coldstart import COLDSTART_PROFILE, ImportProfiler, lazy_import, lazy_object, lazy_value
+import_profiler = ImportProfiler.install() if COLDSTART_PROFILE else None
+
+import importlib
 import json
-import pandas as pd
-import io
 from datetime import datetime
 from decimal import Decimal
 import math
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from json_stream import StreamingJSONParser, is_number_map, is_string_list
+from continuation import (
+    CONTINUATION_EVENT_KEY,
+    CONTINUATION_MAX_HOPS,
+    AnalysisIncomplete,
+    TimeBudget,
+    continuation_event,
+    failed_continuation,
+    schedule_continuation
+)
+
+# Most stream records are filtered out by became_preprocessed, so boto3,
+# pandas/NumPy and the analysis modules are only loaded once an upload is
+# actually analyzed (see load_analysis_modules)
+boto3 = lazy_import('boto3')
+chunking = lazy_import('chunking')
+llm_cache_module = lazy_import('llm_cache')
+llm_backend_module = lazy_import('llm_backend')
+dedup = lazy_import('dedup')
+reduction = lazy_import('tree_reduce')
+text_clustering = lazy_import('text_clustering')
+ingest = lazy_import('ingest')
+user_stats = lazy_import('user_stats')
+checkpoints = lazy_import('checkpoints')
+rate_control = lazy_import('rate_control')
+local_sentiment_module = lazy_import('local_sentiment')
+sampling = lazy_import('sampling')
+cohorts = lazy_import('cohorts')
+topics_module = lazy_import('topics')
+dynamodb_tables = lazy_import('dynamodb_tables')
+ANALYSIS_MODULES = [boto3, chunking, llm_cache_module, llm_backend_module, dedup, reduction, text_clustering,
+                    ingest, user_stats, checkpoints, rate_control, local_sentiment_module, sampling, cohorts,
+                    topics_module, dynamodb_tables]
+
+# Only looked up when an exception reaches an except clause, by which time boto3 is loaded
+botocore_exceptions = lazy_object(lambda: importlib.import_module('botocore.exceptions'))
+
+# Initialize clients (on first use)
+s3 = lazy_object(lambda: boto3.client('s3'))
+dynamodb = lazy_object(lambda: dynamodb_tables.shared_client())
+
+# Tables; upload workers run in threads, so these go through the shared
+# client rather than a boto3 resource
+survey_meta_table = lazy_object(lambda: dynamodb_tables.SharedTable('SurveyMeta'))
+insights_table = lazy_object(lambda: dynamodb_tables.SharedTable('SurveyInsights'))
+
+# How long a claimed upload stays reserved for its worker: about one function
+# timeout plus a margin, so the upload of a crashed worker is free again soon.
+# Each continuation renews it, and so does a worker handing off to one.
+ANALYSIS_LEASE_SECONDS = int(os.environ.get('ANALYSIS_LEASE_SECONDS', '330'))
+
+# Stream records analyzed at once; all of them share one Bedrock concurrency budget
+STREAM_RECORD_CONCURRENCY = int(os.environ.get('STREAM_RECORD_CONCURRENCY', '4'))
+
+# Each upload in flight holds its ingest (CSV batches, dedup index, responses)
+# in memory, so the function's memory size caps the concurrency above too:
+# UPLOAD_MEMORY_MB per upload on top of RUNTIME_MEMORY_MB for the runtime
+# with pandas/NumPy loaded
+FUNCTION_MEMORY_MB = int(os.environ.get('AWS_LAMBDA_FUNCTION_MEMORY_SIZE', '1024'))
+UPLOAD_MEMORY_MB = int(os.environ.get('UPLOAD_MEMORY_MB', '300'))
+RUNTIME_MEMORY_MB = int(os.environ.get('RUNTIME_MEMORY_MB', '150'))
+
+# Ceiling on Bedrock chunk calls in flight; the AIMD controller finds the usable limit below it
+BEDROCK_MAX_CONCURRENCY = int(os.environ.get('BEDROCK_MAX_CONCURRENCY', '4'))
+
+# Model settings; both are part of the response cache key
+ANALYSIS_MODEL_ID = os.environ.get('ANALYSIS_MODEL_ID', 'anthropic.claude-3-haiku-20240307-v1:0')
+ANALYSIS_TEMPERATURE = 0.3
+
+# 'stream' reads the analysis as it is generated and stops once the schema is
+# complete; 'complete' waits for the whole response body
+LLM_RESPONSE_MODE = os.environ.get('LLM_RESPONSE_MODE', 'stream')
+
+# Fields of the chunk analysis JSON and how each is validated as it arrives
+is_sentiment_scores = is_number_map(['positive', 'neutral', 'negative'])
+ANALYSIS_VALIDATORS = {
+    'sentiment_scores': is_sentiment_scores,
+    'pain_points': is_string_list,
+    'positive_aspects': is_string_list,
+    'actionable_insights': is_string_list,
+    'topics_mentioned': is_string_list,
+    'topic_ratings': lambda value: isinstance(value, dict),
+    'group_sentiment': lambda value: isinstance(value, dict) and all(map(is_sentiment_scores, value.values()))
+}
+# Only requested when topics are not extracted locally (see analysis_fields)
+ANALYSIS_TOPIC_FIELDS = ['topics_mentioned', 'topic_ratings']
+# Only requested from chunks that mix responses of several groups
+ANALYSIS_GROUP_FIELDS = ['group_sentiment']
+# Optional; every other requested field must be present for a complete result
+ANALYSIS_OPTIONAL_FIELDS = ['topic_ratings', 'group_sentiment']
+# Stand-ins for required list fields missing from an otherwise valid answer.
+# sentiment_scores has none: such a chunk is left out of the sentiment averages
+ANALYSIS_DEFAULTS = {'pain_points': [], 'positive_aspects': [], 'actionable_insights': [], 'topics_mentioned': []}
 
-# Initialize clients
-s3 = boto3.client('s3')
-bedrock = boto3.client('bedrock-runtime', region_name='us-east-1')
-dynamodb = boto3.resource('dynamodb')
+# Model backend: Bedrock in AWS, a deterministic stub when LLM_BACKEND=stub
+llm_backend = lazy_object(lambda: llm_backend_module.build_llm_backend())
 
-# Tables
-survey_meta_table = dynamodb.Table('SurveyMeta')
-insights_table = dynamodb.Table('SurveyInsights')
+# Shared by all chunk workers in this container: grows concurrency while calls
+# succeed, halves it on throttling and retries throttled calls with jitter
+rate_controller = lazy_object(lambda: rate_control.AIMDController(BEDROCK_MAX_CONCURRENCY))
+
+# Content-addressed cache of parsed chunk analyses (kept warm across invocations);
+# None when disabled, so call sites check lazy_value(llm_cache)
+llm_cache = lazy_object(lambda: llm_cache_module.build_llm_cache())
+
+# Per-run chunk checkpoints so a retried upload only analyzes unfinished chunks;
+# None when disabled, like llm_cache
+checkpoint_store = lazy_object(lambda: checkpoints.build_checkpoint_store())
+
+# Marks a placeholder result produced when a chunk could not be analyzed
+FALLBACK_KEY = '_fallback'
+
+if import_profiler is not None:
+    import_profiler.log('init')
+
+analysis_modules_lock = threading.Lock()
+analysis_modules_loaded = False
+
+def load_analysis_modules():
+    """Load the lazily imported modules and clients before uploads are analyzed.
+    
+    Runs once per container, before the upload workers start: LazyLoader
+    modules are not safe to load from several threads at once.
+    """
+    
+    global analysis_modules_loaded
+    with analysis_modules_lock:
+        if analysis_modules_loaded:
+            return
+        for lazy in ANALYSIS_MODULES + [s3, dynamodb, survey_meta_table, insights_table, llm_backend,
+                                        rate_controller, llm_cache, checkpoint_store]:
+            lazy_value(lazy)
+        analysis_modules_loaded = True
+    if import_profiler is not None:
+        import_profiler.log('first analysis')
 
 def lambda_handler(event, context):
     print("DynamoDB Event:", json.dumps(event))
     
+    # Shared by every upload in this invocation
+    budget = TimeBudget(context) if context is not None else None
+    
+    # Continuation of a run that ran out of time in an earlier invocation
+    if CONTINUATION_EVENT_KEY in event:
+        job = event[CONTINUATION_EVENT_KEY]
+        load_analysis_modules()
+        analyze_upload(job['user_id'], job['upload_id'], job['s3_silver_path'], context, budget,
+                       job.get('hop', 0), job.get('lease_owner'))
+        log_late_imports()
+        return {'statusCode': 200, 'body': 'Processing completed'}
+    
     # Handle DynamoDB Stream event
+    jobs = {}
     for record in event['Records']:
         if record['eventName'] in ['INSERT', 'MODIFY']:
             # Get the new image (updated record)
             new_image = record['dynamodb'].get('NewImage', {})
             
-            # Check if status changed to 'preprocessed'
-            status = new_image.get('status', {}).get('S', '')
-            if status != 'preprocessed':
+            # Only a change *into* 'preprocessed' starts an analysis; other
+            # attribute updates on a preprocessed item are ignored
+            if not became_preprocessed(record):
                 continue
                 
             user_id = new_image.get('user_id', {}).get('S', '')
@@ -36,27 +182,173 @@ def lambda_handler(event, context):
             if not all([user_id, upload_id, s3_silver_path]):
                 print("Missing required fields, skipping record")
                 continue
-                
-            try:
-                # Process the feedback
-                insights = process_feedback(user_id, upload_id, s3_silver_path)
-                
-                # Store insights
-                store_insights(user_id, upload_id, insights)
-                
-                # Update survey meta status
-                update_survey_status(user_id, upload_id, 'analyzed')
-                
-                print(f"Successfully analyzed feedback for {user_id}/{upload_id}")
-                
-            except Exception as e:
-                print(f"Error processing feedback for {user_id}/{upload_id}: {str(e)}")
-                update_survey_status(user_id, upload_id, 'analysis_failed')
+            
+            # A later record for the same upload supersedes an earlier one in this batch
+            sequence_numbers = jobs.get((user_id, upload_id), (None, []))[1]
+            jobs[(user_id, upload_id)] = (s3_silver_path, sequence_numbers + [record['dynamodb'].get('SequenceNumber')])
+    
+    # Fan uploads out so one large survey does not hold up the small ones; chunk
+    # calls from every upload go through the same rate_controller
+    failed_sequence_numbers = []
+    if jobs:
+        load_analysis_modules()
+        with ThreadPoolExecutor(max_workers=upload_concurrency(len(jobs))) as executor:
+            futures = {
+                executor.submit(analyze_upload, user_id, upload_id, s3_silver_path, context, budget): (user_id, upload_id)
+                for (user_id, upload_id), (s3_silver_path, _) in jobs.items()
+            }
+            for future in as_completed(futures):
+                user_id, upload_id = futures[future]
+                try:
+                    succeeded = future.result()
+                except Exception as e:
+                    print(f"Unhandled error analyzing {user_id}/{upload_id}: {str(e)}")
+                    succeeded = False
+                if not succeeded:
+                    failed_sequence_numbers.extend(n for n in jobs[(user_id, upload_id)][1] if n)
+        log_late_imports()
     
-    return {'statusCode': 200, 'body': 'Processing completed'}
+    # Partial batch response: the poller retries from the earliest failed record
+    # only, and the claim in analyze_upload skips uploads that already finished
+    return {
+        'statusCode': 200,
+        'body': 'Processing completed',
+        'batchItemFailures': [{'itemIdentifier': n} for n in sorted(failed_sequence_numbers, key=int)]
+    }
+
+def continuation_failed(event, context):
+    """OnFailure destination for continuation invocations (EventInvokeConfig in template.yml).
+    
+    A continuation that crashed or timed out on every attempt still holds
+    the upload's lease, and no stream record will retry it; without this the
+    upload would stay 'analyzing' forever. Marks it failed, unless another
+    worker has taken the lease over since.
+    """
+    
+    print("Failed invocation:", json.dumps(event))
+    job = failed_continuation(event)
+    if job is None:
+        print("Not a continuation; nothing to do")
+        return
+    print(f"Continuation {job.get('hop')} for {job['user_id']}/{job['upload_id']} failed: "
+          f"{event.get('requestContext', {}).get('condition')}")
+    update_survey_status(job['user_id'], job['upload_id'], 'analysis_failed', job.get('lease_owner'))
 
-def process_feedback(user_id, upload_id, s3_silver_path):
-    """Process feedback data and generate insights using Bedrock"""
+def upload_concurrency(job_count):
+    """Uploads to analyze at once: STREAM_RECORD_CONCURRENCY, or fewer if memory would run out"""
+    
+    by_memory = max(1, (FUNCTION_MEMORY_MB - RUNTIME_MEMORY_MB) // UPLOAD_MEMORY_MB)
+    workers = max(1, min(STREAM_RECORD_CONCURRENCY, by_memory, job_count))
+    if by_memory < min(STREAM_RECORD_CONCURRENCY, job_count):
+        print(f"Analyzing {workers} uploads at once: {FUNCTION_MEMORY_MB} MB fits {by_memory} "
+              f"at {UPLOAD_MEMORY_MB} MB each")
+    return workers
+
+def log_late_imports():
+    """Log modules the libraries imported on demand during the analysis (pandas parsers, ...)"""
+    if import_profiler is not None:
+        import_profiler.log('during analysis', only_new=True)
+
+def became_preprocessed(record):
+    """True when this stream record moves an upload into 'preprocessed'.
+    
+    Needs a NEW_AND_OLD_IMAGES stream; without an OldImage the conditional
+    claim in analyze_upload is the only guard.
+    """
+    
+    new_status = record['dynamodb'].get('NewImage', {}).get('status', {}).get('S', '')
+    if new_status != 'preprocessed':
+        return False
+    old_image = record['dynamodb'].get('OldImage')
+    if record['eventName'] == 'INSERT' or old_image is None:
+        return True
+    return old_image.get('status', {}).get('S', '') != 'preprocessed'
+
+def analyze_upload(user_id, upload_id, s3_silver_path, context, budget=None, hop=0, lease_owner=None):
+    """Analyze one upload, handing the rest of the run to a new invocation if time runs out.
+    
+    A fresh run first claims the upload (preprocessed -> analyzing); a
+    continuation renews the lease it was handed. Either way, a worker that
+    does not hold the lease does nothing, so redelivered or concurrent
+    records never analyze the same upload twice.
+    
+    Returns False when the analysis failed, or another worker holds a live
+    lease on the upload, and the stream record should be retried (a crashed
+    worker's lease runs out and the retry takes over); skipped, completed and
+    handed-off uploads return True.
+    """
+    
+    if lease_owner is None:
+        lease_owner = uuid.uuid4().hex
+        claimed, lease_expires_at = claim_upload(user_id, upload_id, lease_owner)
+        if not claimed and lease_expires_at is not None and budget is not None:
+            # Wait out a lease that ends before this invocation has to stop
+            wait_s = lease_expires_at - time.time() + 1
+            if wait_s * 1000 < budget.remaining_ms() - budget.reserve_ms:
+                print(f"Waiting {wait_s:.0f}s for the lease on {user_id}/{upload_id} to run out")
+                time.sleep(max(0, wait_s))
+                claimed, lease_expires_at = claim_upload(user_id, upload_id, lease_owner)
+        if not claimed:
+            if lease_expires_at is not None:
+                print(f"Not analyzing {user_id}/{upload_id} yet: another worker's lease runs until "
+                      f"{lease_expires_at}; leaving the record for a retry")
+                return False
+            print(f"Skipping {user_id}/{upload_id}: no longer preprocessed")
+            return True
+    elif not renew_claim(user_id, upload_id, lease_owner):
+        print(f"Stopping continuation for {user_id}/{upload_id}: lease lost")
+        return True
+    
+    try:
+        if budget is not None and budget.expired():
+            raise AnalysisIncomplete(0, 0)
+        
+        # Process the feedback
+        insights = process_feedback(user_id, upload_id, s3_silver_path, budget)
+        
+        # Store insights
+        store_insights(user_id, upload_id, insights)
+        
+        # Update survey meta status
+        update_survey_status(user_id, upload_id, 'analyzed', lease_owner)
+        
+        # The run is complete, so its chunk checkpoints are no longer needed
+        clear_checkpoints(user_id, upload_id)
+        
+        print(f"Successfully analyzed feedback for {user_id}/{upload_id}")
+        return True
+        
+    except AnalysisIncomplete as e:
+        # Finished chunks are checkpointed; the next invocation picks up the rest
+        print(f"Time budget reached for {user_id}/{upload_id}: {str(e)}")
+        try:
+            if hop >= CONTINUATION_MAX_HOPS:
+                raise Exception(f"Gave up after {hop} continuations")
+            # The next hop may start late; it renews the lease again when it does
+            if not renew_claim(user_id, upload_id, lease_owner):
+                print(f"Not continuing {user_id}/{upload_id}: lease lost")
+                return True
+            schedule_continuation(context.function_name,
+                                  continuation_event(user_id, upload_id, s3_silver_path, hop + 1, lease_owner))
+            print(f"Scheduled continuation {hop + 1} for {user_id}/{upload_id}")
+            return True
+        except Exception as e:
+            print(f"Error continuing analysis for {user_id}/{upload_id}: {str(e)}")
+            update_survey_status(user_id, upload_id, 'analysis_failed', lease_owner)
+            return False
+        
+    except Exception as e:
+        print(f"Error processing feedback for {user_id}/{upload_id}: {str(e)}")
+        update_survey_status(user_id, upload_id, 'analysis_failed', lease_owner)
+        return False
+
+def process_feedback(user_id, upload_id, s3_silver_path, budget=None):
+    """Process feedback data and generate insights using Bedrock.
+    
+    With a TimeBudget, raises AnalysisIncomplete once time runs short; the
+    ingest result and the chunks finished so far are checkpointed for the
+    continuation, which neither reads nor dedups the CSV again.
+    """
     
     # Parse S3 path
     bucket = 'surveysynth-uploads'  # Use your actual bucket name
@@ -64,85 +356,357 @@ def process_feedback(user_id, upload_id, s3_silver_path):
     
     print(f"Attempting to read from bucket: {bucket}, key: {key}")
     
-    # Download and read the processed CSV
-    try:
-        response = s3.get_object(Bucket=bucket, Key=key)
-        df = pd.read_csv(io.BytesIO(response['Body'].read()))
-        print(f"Loaded {len(df)} survey responses")
-    except Exception as e:
-        raise Exception(f"Failed to load CSV from S3: {str(e)}")
+    # A continuation resumes from the plan its first attempt saved (the
+    # responses left after ingest, grouped); only a new run reads the CSV
+    store = lazy_value(checkpoint_store)
+    run_id = checkpoints.checkpoint_run_id(user_id, upload_id)
+    etag = s3.head_object(Bucket=bucket, Key=key)['ETag'] if budget is not None and store is not None else None
+    plan = checkpoints.resumable_plan(store, run_id, key, etag) if budget is not None else None
+    if plan is not None:
+        groups = [(label, members) for label, members in plan['groups']]
+        ingest_summary = plan['summary']
+        print(f"Resuming run {run_id} from its saved plan")
+    else:
+        groups, ingest_summary = ingest_feedback(bucket, key)
     
-    # Identify feedback columns
-    feedback_columns = [
-        'liked_most', 
-        'improvement_suggestions', 
-        'additional_comments',
-        'feedback_text',
-        'needs_more_emphasis'
-    ]
+    sampling_report = ingest_summary.get('sampling')
+    cohort_report = ingest_summary.get('cohorts')
+    unique_feedback = [response for _, members in groups for response in members]
+    if sampling_report is not None:
+        print(f"Sampled {sampling_report['sample_size']} of {sampling_report['population']} responses "
+              f"from {len(sampling_report['strata'])} strata")
+    elif cohort_report:
+        print(f"Analyzing {sum(1 for label, _ in groups if label is not None)} cohorts separately")
     
-    # Filter existing columns
-    available_feedback_cols = [col for col in feedback_columns if col in df.columns]
-    print(f"Available feedback columns: {available_feedback_cols}")
+    # Stopping early only helps if finished chunks survive to the next invocation
+    if store is None:
+        budget = None
+    if plan is None and budget is not None and unique_feedback:
+        checkpoints.save_plan(store, run_id, {'source': key, 'etag': etag, 'groups': groups, 'summary': ingest_summary})
+        if budget.expired():
+            # Ingest used up this invocation; the continuation starts from the saved plan
+            raise AnalysisIncomplete(0, 0)
     
-    if not available_feedback_cols:
-        raise Exception("No feedback columns found in the data")
+    response_count = ingest_summary['row_count']
+    feedback_count = ingest_summary['feedback_count']
+    rating_analytics = ingest_summary['rating_analytics']
+    print(f"Loaded {response_count} survey responses")
+    print(f"Computed rating stats for {len(rating_analytics['rating_stats'])} rating columns")
     
-    # Extract and clean feedback data
-    feedback_data = []
-    for _, row in df.iterrows():
-        response_feedback = {}
-        for col in available_feedback_cols:
-            value = str(row[col]).strip() if pd.notna(row[col]) else ""
-            if value and value.lower() not in ['nan', 'none', '']:
-                response_feedback[col] = value
-        
-        if response_feedback:  # Only add if there's actual feedback
-            feedback_data.append(response_feedback)
+    if not ingest_summary['feedback_columns']:
+        raise Exception("No feedback columns found in the data")
     
-    print(f"Extracted {len(feedback_data)} responses with feedback")
+    print(f"Extracted {feedback_count} responses with feedback")
     
-    if not feedback_data:
-        return {
+    if not unique_feedback:
+        return apply_rating_analytics({
             'overall_sentiment': 'Neutral',
             'pain_points': ['No specific feedback provided'],
             'top_insights': ['Limited feedback data available for analysis'],
-            'response_count': len(df),
+            'response_count': response_count,
             'feedback_count': 0
+        }, rating_analytics)
+    
+    # Each distinct answer is sent once, carrying how many students gave it
+    print(f"Collapsed {feedback_count} responses into {len(unique_feedback)} unique responses")
+    
+    # Cheap local pass first: short answers that are clearly polar or say
+    # nothing get a lexicon label; only the rest are sent to the model.
+    # Then pack responses into chunks that fill the prompt token budget.
+    # Groups (strata, cohorts) share chunks: each response carries its
+    # group's tag, and a chunk that mixes groups asks for each one's sentiment
+    # Topics come from the model only if the local keyphrase pass cannot find them
+    ask_topics = topics_from_model(rating_analytics['rating_stats'])
+    prompt_overhead = chunking.estimate_tokens(build_analysis_prompt([], ask_topics))
+    pack_groups = len(groups) > 1
+    local_sentiment = None
+    group_local_sentiment = {}
+    model_feedback = []
+    for index, (label, members) in enumerate(groups):
+        group_feedback = members
+        if local_sentiment_module.SENTIMENT_CASCADE:
+            group_feedback, group_local_sentiment[label] = local_sentiment_module.route_responses(members)
+        if pack_groups:
+            tag = chunking.group_tag(index)
+            group_feedback = [{**response, chunking.GROUP_KEY: tag} for response in group_feedback]
+        model_feedback.extend(group_feedback)
+    chunks, chunk_token_counts = chunking.chunk_by_token_budget(model_feedback, prompt_overhead)
+    # Per chunk: {group label: responses it stands for}
+    if pack_groups:
+        labels = {chunking.group_tag(index): label for index, (label, _) in enumerate(groups)}
+        chunk_groups = [chunking.chunk_group_weights(chunk, labels) for chunk in chunks]
+    else:
+        chunk_groups = [{groups[0][0]: sum(dedup.multiplicity(response) for response in chunk)} for chunk in chunks]
+    
+    if local_sentiment_module.SENTIMENT_CASCADE:
+        local_sentiment = {
+            key: sum(counts[key] for counts in group_local_sentiment.values())
+            for key in local_sentiment_module.SENTIMENT_KEYS
         }
+        print(f"Labelled {len(unique_feedback) - len(model_feedback)} unique responses locally "
+              f"({sum(local_sentiment.values())} responses): {local_sentiment}")
+    print(f"Packed {len(model_feedback)} responses into {len(chunks)} chunks "
+          f"(~{sum(chunk_token_counts)} prompt tokens)")
+    
+    # Resume from chunks a previous attempt already finished
+    chunk_keys = [llm_cache_module.cache_key(ANALYSIS_MODEL_ID, ANALYSIS_TEMPERATURE,
+                                             build_analysis_prompt(chunk, ask_topics)) for chunk in chunks]
+    completed = checkpoints.resumable_results(store, run_id, chunk_keys)
+    if completed:
+        print(f"Resuming run {run_id}: {len(completed)}/{len(chunks)} chunks already analyzed")
+    
+    def save_checkpoint(index, result):
+        if store is None or result.get(FALLBACK_KEY):
+            return
+        try:
+            store.save(run_id, index, chunk_keys[index], result)
+        except Exception as e:
+            print(f"Failed to checkpoint chunk {index + 1}: {str(e)}")
+    
+    all_insights = analyze_chunks_concurrently(chunks, completed=completed, on_complete=save_checkpoint, budget=budget,
+                                               ask_topics=ask_topics)
     
-    # Chunk responses (10-20 per chunk)
-    chunk_size = 15
-    chunks = [feedback_data[i:i + chunk_size] for i in range(0, len(feedback_data), chunk_size)]
+    if lazy_value(llm_cache) is not None:
+        print(f"LLM cache stats: {llm_cache.stats()}")
+    print(f"Rate controller stats: {rate_controller.stats()}")
     
-    all_insights = []
+    # Combine insights from all chunks, weighting each by the responses it represents
+    chunk_weights = [sum(dedup.multiplicity(response) for response in chunk) for chunk in chunks]
+    def skip_failed(insight):
+        return insight.get(FALLBACK_KEY)
     
-    for i, chunk in enumerate(chunks):
-        print(f"Processing chunk {i+1}/{len(chunks)} with {len(chunk)} responses")
-        chunk_insights = analyze_chunk_with_bedrock(chunk, i+1, len(chunks))
-        all_insights.append(chunk_insights)
+    expansion = None
+    if sampling_report is not None:
+        # Sampled responses stand for N_h / n_h responses of their stratum
+        expansion = {label: stratum['population'] / stratum['sampled']
+                     for label, stratum in sampling_report['strata'].items() if stratum['sampled']}
     
-    # Combine insights from all chunks
-    final_insights = combine_insights(all_insights, len(feedback_data), len(df))
+    # Course topics and their polarity come from a local keyphrase pass over
+    # every analyzed response, not from the model, when it has a vocabulary
+    local_topics = None
+    if not ask_topics:
+        local_topics = topics_module.topic_sentiment_map(
+            [response for _, members in groups for response in members],
+            rating_analytics['rating_stats'],
+            [dedup.multiplicity(response) * (expansion.get(label, 0) if expansion is not None else 1)
+             for label, members in groups for response in members])
+        print(f"Extracted {len(local_topics)} course topics locally")
     
-    return final_insights
+    if sampling_report is not None:
+        final_insights = combine_insights(
+            all_insights, feedback_count, response_count,
+            [sum(weight * expansion[label] for label, weight in weights.items()) for weights in chunk_groups],
+            sampling.expand_counts(group_local_sentiment, expansion) if local_sentiment is not None else None,
+            local_topics)
+        stratum_counts = sampling.stratum_sentiment_counts(
+            groups, chunk_groups, all_insights, group_local_sentiment, skip=skip_failed)
+        final_insights['sampling'] = {**sampling_report,
+                                      **sampling.stratified_sentiment(sampling_report, stratum_counts)}
+        print(f"Stratified sentiment estimate: {final_insights['sampling']['sentiment']}")
+    else:
+        final_insights = combine_insights(all_insights, feedback_count, response_count, chunk_weights,
+                                          local_sentiment, local_topics)
+    if cohort_report:
+        final_insights['cohorts'] = cohorts.attach_sentiment(cohort_report, cohorts.cohort_sentiment(
+            groups, chunk_groups, all_insights, group_local_sentiment, expansion, skip=skip_failed))
+    final_insights['chunk_token_counts'] = chunk_token_counts
+    final_insights['unique_feedback_count'] = len(unique_feedback)
+    if local_sentiment is not None:
+        final_insights['sentiment_cascade'] = cascade_report(unique_feedback, model_feedback, local_sentiment,
+                                                             chunks, all_insights)
+        print(f"Sentiment cascade: {final_insights['sentiment_cascade']}")
+    
+    return apply_rating_analytics(final_insights, rating_analytics)
 
-def analyze_chunk_with_bedrock(feedback_chunk, chunk_num, total_chunks):
-    """Analyze a chunk of feedback using Amazon Bedrock"""
+def ingest_feedback(bucket, key):
+    """Stream the processed CSV and group its distinct responses for chunking.
+    
+    Extraction, dedup and rating stats run batch by batch. In sampling mode,
+    or when a survey has more distinct answers than ingestion may retain,
+    only a stratified sample is kept, one group per stratum; otherwise the
+    larger cohorts (batch_code) are analyzed on their own and everything
+    else is one group. Returns (groups, ingest_summary).
+    """
+    sampler = sampling.StratifiedSampler() if sampling.SAMPLING else None
+    try:
+        response = s3.get_object(Bucket=bucket, Key=key)
+        try:
+            unique_feedback, ingest_summary = ingest.ingest_survey(response['Body'], sampler=sampler)
+        except dedup.TooManyUniqueResponses as e:
+            # Keeping every distinct answer would not fit in memory; a sample does
+            print(f"{str(e)}; reading the survey again in sampling mode")
+            ingest_summary = None
+        if ingest_summary is None:
+            # Outside the except block, whose traceback still holds the first pass's data
+            response = s3.get_object(Bucket=bucket, Key=key)
+            unique_feedback, ingest_summary = ingest.ingest_survey(response['Body'],
+                                                                   sampler=sampling.StratifiedSampler())
+    except Exception as e:
+        raise Exception(f"Failed to load CSV from S3: {str(e)}")
+    
+    if ingest_summary.get('sampling') is not None:
+        return unique_feedback, ingest_summary
+    if ingest_summary.get('cohorts'):
+        return cohorts.cohort_groups(unique_feedback, ingest_summary['cohorts']), ingest_summary
+    return [(None, unique_feedback)], ingest_summary
+
+def cascade_report(unique_feedback, model_feedback, local_sentiment, chunks, chunk_insights):
+    """How much the local sentiment pass saved, and how well it agrees with the model.
+    
+    Agreement compares, chunk by chunk, the local scorer's label mix for the
+    responses that did go to the model with the model's sentiment scores.
+    """
+    
+    all_tokens = chunking.estimate_tokens(chunking.format_feedback_text(unique_feedback))
+    model_tokens = chunking.estimate_tokens(chunking.format_feedback_text(model_feedback)) if model_feedback else 0
+    
+    agreement_total = 0.0
+    agreement_weight = 0
+    for chunk, insight in zip(chunks, chunk_insights):
+        if insight.get(FALLBACK_KEY):
+            continue
+        labels, _ = local_sentiment_module.classify_responses(chunk)
+        agreement = local_sentiment_module.distribution_agreement(
+            local_sentiment_module.sentiment_counts(chunk, labels), insight.get('sentiment_scores', {}))
+        if agreement is not None:
+            weight = sum(dedup.multiplicity(response) for response in chunk)
+            agreement_total += agreement * weight
+            agreement_weight += weight
+    
+    return {
+        'local_responses': sum(local_sentiment.values()),
+        'local_unique_responses': len(unique_feedback) - len(model_feedback),
+        'model_unique_responses': len(model_feedback),
+        'traffic_removed_pct': round(100 * (1 - model_tokens / all_tokens), 1) if all_tokens > 0 else 0.0,
+        'agreement_pct': round(100 * agreement_total / agreement_weight, 1) if agreement_weight > 0 else None
+    }
+
+def apply_rating_analytics(insights, rating_analytics):
+    """Attach rating stats; the measured mean rating replaces the sentiment-based satisfaction estimate"""
+    
+    insights['rating_stats'] = rating_analytics['rating_stats']
+    if rating_analytics['overall_rating'] is not None:
+        insights['avg_satisfaction'] = rating_analytics['overall_rating']
+    return insights
+
+def analyze_chunks_concurrently(chunks, max_in_flight=None, completed=None, on_complete=None, budget=None,
+                                ask_topics=None):
+    """Analyze chunks with a bounded pool of Bedrock calls, returning results in chunk order.
+    
+    completed maps chunk index -> result for chunks that need no model call;
+    on_complete(index, result) runs as soon as each remaining chunk finishes.
+    Once budget has expired no new chunk is started and AnalysisIncomplete is
+    raised after the in-flight ones finish. ask_topics is passed on to
+    analysis_fields.
+    """
+    
+    max_in_flight = max_in_flight or BEDROCK_MAX_CONCURRENCY
+    completed = completed or {}
+    total_chunks = len(chunks)
+    pending = [i for i in range(total_chunks) if i not in completed]
+    workers = max(1, min(max_in_flight, len(pending)))
+    
+    def run_chunk(i):
+        if budget is not None and budget.expired():
+            return None
+        print(f"Processing chunk {i+1}/{total_chunks} with {len(chunks[i])} responses")
+        started = time.time()
+        result = analyze_chunk_with_bedrock(chunks[i], i+1, total_chunks, ask_topics)
+        if budget is not None:
+            budget.note_chunk(time.time() - started)
+        if on_complete is not None:
+            on_complete(i, result)
+        return result
+    
+    # executor.map yields results in submission order; merging them back by
+    # index keeps combine_insights seeing the chunks exactly as they were split
+    results = dict(completed)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results.update(zip(pending, executor.map(run_chunk, pending)))
+    
+    done = sum(1 for result in results.values() if result is not None)
+    if done < total_chunks:
+        raise AnalysisIncomplete(done, total_chunks)
+    return [results[i] for i in range(total_chunks)]
+
+TOPICS_SCHEMA = """,
+    "topics_mentioned": [
+        "topic 1",
+        "topic 2"
+    ],
+    "topic_ratings": {
+        "topic 1": {
+            "avg_rating": <average rating out of 5>,
+            "positive_count": <number>,
+            "negative_count": <number>
+        },
+        "topic 2": {
+            "avg_rating": <average rating out of 5>,
+            "positive_count": <number>,
+            "negative_count": <number>
+        }
+    }"""
+GROUP_INSTRUCTION = (
+    'Each response is tagged with its group ({tags}). Also give the sentiment percentages of each group\'s '
+    'responses on their own as "group_sentiment" in the JSON, keyed by tag.\n'
+)
+TOPICS_INSTRUCTION = (
+    'For each topic mentioned, estimate an average rating out of 5 (based on the feedback), and count '
+    'positive and negative mentions. Include this as "topic_ratings" in the JSON.\n'
+)
+
+def topics_from_model(rating_stats):
+    """True when the model has to name the topics: local extraction is off, or
+    the survey has no rating columns to seed the local vocabulary from"""
+    return not topics_module.TOPIC_EXTRACTION or not topics_module.topic_vocabulary(list(rating_stats))
+
+def analysis_fields(feedback_chunk=(), ask_topics=None):
+    """Top-level fields the chunk prompt asks for.
+    
+    Topics and per-topic counts come from the local keyphrase pass when it
+    can run, so the model is only asked for them with ask_topics (by
+    default, when TOPIC_EXTRACTION is off; see topics_from_model). A chunk
+    holding responses of several groups also asks for each group's sentiment.
+    """
+    
+    fields = [name for name in ANALYSIS_VALIDATORS
+              if name not in ANALYSIS_TOPIC_FIELDS and name not in ANALYSIS_GROUP_FIELDS]
+    if len(chunking.chunk_tags(feedback_chunk)) > 1:
+        fields += ANALYSIS_GROUP_FIELDS
+    if ask_topics is None:
+        ask_topics = not topics_module.TOPIC_EXTRACTION
+    if ask_topics:
+        fields += ANALYSIS_TOPIC_FIELDS
+    return fields
+
+def build_analysis_prompt(feedback_chunk, ask_topics=None):
+    """Build the chunk analysis prompt sent to Bedrock"""
     
     # Prepare the feedback text for analysis
-    feedback_text = ""
-    for i, response in enumerate(feedback_chunk, 1):
-        feedback_text += f"\n--- Response {i} ---\n"
-        for column, text in response.items():
-            feedback_text += f"{column.replace('_', ' ').title()}: {text}\n"
-    
-    # Create the prompt
-    prompt = f"""
+    feedback_text = chunking.format_feedback_text(feedback_chunk)
+    fields = analysis_fields(feedback_chunk, ask_topics)
+    
+    group_schema = ''
+    group_instruction = ''
+    if 'group_sentiment' in fields:
+        tags = chunking.chunk_tags(feedback_chunk)
+        group_schema = ',\n    "group_sentiment": {\n' + ',\n'.join(
+            f'        "{tag}": {{"positive": <percentage>, "neutral": <percentage>, "negative": <percentage>}}'
+            for tag in tags) + '\n    }'
+        group_instruction = GROUP_INSTRUCTION.format(tags=', '.join(tags))
+    
+    topics_schema = ''
+    topics_instruction = ''
+    if 'topics_mentioned' in fields:
+        topics_schema = TOPICS_SCHEMA
+        topics_instruction = TOPICS_INSTRUCTION
+    
+    return f"""
 You are an expert at analyzing educational survey feedback. Please analyze the following survey responses from students about a Full Stack Development course.
 
 Survey Responses:
 {feedback_text}
+A response marked "(xN similar responses)" stands for N students who gave essentially the same answer; weight it N times in sentiment percentages and when ranking pain points.
 
 Please provide a structured analysis in the following JSON format:
 {{
@@ -165,26 +729,9 @@ Please provide a structured analysis in the following JSON format:
         "specific actionable insight 1",
         "specific actionable insight 2",
         "specific actionable insight 3"
-    ],
-    "topics_mentioned": [
-        "topic 1",
-        "topic 2"
-    ],
-    "topic_ratings": {{
-        "topic 1": {{
-            "avg_rating": <average rating out of 5>,
-            "positive_count": <number>,
-            "negative_count": <number>
-        }},
-        "topic 2": {{
-            "avg_rating": <average rating out of 5>,
-            "positive_count": <number>,
-            "negative_count": <number>
-        }}
-    }}
+    ]{group_schema}{topics_schema}
 }}
-For each topic mentioned, estimate an average rating out of 5 (based on the feedback), and count positive and negative mentions. Include this as "topic_ratings" in the JSON.
-
+{group_instruction}{topics_instruction}
 Focus on:
 1. Overall sentiment distribution
 2. Common pain points and complaints
@@ -195,43 +742,31 @@ Focus on:
 Respond with valid JSON only.
 """
 
+def analyze_chunk_with_bedrock(feedback_chunk, chunk_num, total_chunks, ask_topics=None):
+    """Analyze a chunk of feedback using Amazon Bedrock"""
+    
+    prompt = build_analysis_prompt(feedback_chunk, ask_topics)
+    fields = analysis_fields(feedback_chunk, ask_topics)
+    
+    # Identical prompts return the stored analysis without calling the model
+    key = llm_cache_module.cache_key(ANALYSIS_MODEL_ID, ANALYSIS_TEMPERATURE, prompt)
+    cache = lazy_value(llm_cache)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            print(f"Chunk {chunk_num} served from LLM cache")
+            return cached
+
     try:
-        # Call Bedrock Claude
-        response = bedrock.invoke_model(
-            modelId='anthropic.claude-3-haiku-20240307-v1:0',
-            contentType='application/json',
-            accept='application/json',
-            body=json.dumps({
-                'anthropic_version': 'bedrock-2023-05-31',
-                'max_tokens': 2000,
-                'messages': [
-                    {
-                        'role': 'user',
-                        'content': prompt
-                    }
-                ],
-                'temperature': 0.3
-            })
-        )
-        # Parse response
-        response_body = json.loads(response['body'].read())
-        analysis_text = response_body['content'][0]['text']
+        # Call the configured model backend (Bedrock, or the offline stub);
+        # throttled calls are retried here instead of becoming fallbacks
+        parser, timings = rate_controller.call(lambda: read_analysis(prompt, fields))
+        print(f"Chunk {chunk_num} timings: {timings}")
         
-        # Extract JSON from response
-        try:
-            # Find JSON in the response
-            start_idx = analysis_text.find('{')
-            end_idx = analysis_text.rfind('}') + 1
-            json_str = analysis_text[start_idx:end_idx]
-            analysis_result = json.loads(json_str)
-
-            print("Bedrock analysis_result:", json.dumps(analysis_result, indent=2))
-            print(f"Chunk {chunk_num} analysis completed successfully")
-            return analysis_result
-            
-        except json.JSONDecodeError as e:
-            print(f"Failed to parse JSON from Bedrock response: {str(e)}")
-            print(f"Raw response: {analysis_text}")
+        analysis_result = parser.result()
+        if not any(name in analysis_result for name in fields):
+            print(f"Failed to parse JSON from Bedrock response: {'; '.join(parser.errors) or 'no requested fields'}")
+            print(f"Raw response: {parser.text}")
             
             # Fallback analysis
             return {
@@ -239,8 +774,22 @@ Respond with valid JSON only.
                 "pain_points": ["Unable to parse detailed analysis"],
                 "positive_aspects": ["Analysis completed"],
                 "actionable_insights": ["Review feedback analysis system"],
-                "topics_mentioned": ["General feedback"]
+                "topics_mentioned": ["General feedback"],
+                FALLBACK_KEY: True
             }
+        
+        # Keep the fields that did validate rather than discarding the whole answer
+        missing = [name for name in fields if name not in analysis_result and name not in ANALYSIS_OPTIONAL_FIELDS]
+        if missing:
+            print(f"Chunk {chunk_num} is missing valid {', '.join(missing)}: {'; '.join(parser.errors)}")
+            analysis_result.update({name: list(ANALYSIS_DEFAULTS[name]) for name in missing if name in ANALYSIS_DEFAULTS})
+        print("Bedrock analysis_result:", json.dumps(analysis_result, indent=2))
+        print(f"Chunk {chunk_num} analysis completed successfully")
+        
+        # Only complete analyses are cached; fallbacks and partial ones are retried next time
+        if cache is not None and not missing:
+            cache.put(key, analysis_result)
+        return analysis_result
             
     except Exception as e:
         print(f"Bedrock analysis failed for chunk {chunk_num}: {str(e)}")
@@ -251,13 +800,71 @@ Respond with valid JSON only.
             "pain_points": ["Analysis service unavailable"],
             "positive_aspects": ["Feedback collected successfully"],
             "actionable_insights": ["Retry analysis when service is available"],
-            "topics_mentioned": ["System feedback"]
+            "topics_mentioned": ["System feedback"],
+            FALLBACK_KEY: True
         }
 
-def combine_insights(chunk_insights, feedback_count, total_responses):
-    """Combine insights from multiple chunks into final analysis"""
+def read_analysis(prompt, fields):
+    """Run one model call and parse its analysis JSON field by field.
+    
+    fields are the ones the prompt asks for (analysis_fields). Returns
+    (parser, timings). In stream mode the response is abandoned as soon as
+    every one of them has arrived; timings records milliseconds to the
+    first token, to a usable result (all required fields valid) and in total.
+    """
+    
+    parser = StreamingJSONParser({name: ANALYSIS_VALIDATORS[name] for name in fields},
+                                 [name for name in fields if name not in ANALYSIS_OPTIONAL_FIELDS])
+    timings = {'mode': LLM_RESPONSE_MODE}
+    started = time.time()
+    elapsed_ms = lambda: round((time.time() - started) * 1000)
+    
+    if LLM_RESPONSE_MODE == 'stream':
+        pieces = llm_backend.stream(
+            prompt,
+            model_id=ANALYSIS_MODEL_ID,
+            max_tokens=chunking.CHUNK_OUTPUT_TOKEN_RESERVE,
+            temperature=ANALYSIS_TEMPERATURE
+        )
+        try:
+            for piece in pieces:
+                timings.setdefault('first_token_ms', elapsed_ms())
+                done = parser.feed(piece)
+                if parser.usable:
+                    timings.setdefault('usable_ms', elapsed_ms())
+                if done:
+                    timings['stopped_early'] = True
+                    break
+        finally:
+            pieces.close()
+    else:
+        parser.feed(llm_backend.complete(
+            prompt,
+            model_id=ANALYSIS_MODEL_ID,
+            max_tokens=chunking.CHUNK_OUTPUT_TOKEN_RESERVE,
+            temperature=ANALYSIS_TEMPERATURE
+        ))
+        if parser.usable:
+            timings['usable_ms'] = elapsed_ms()
+    
+    timings['total_ms'] = elapsed_ms()
+    return parser, timings
+
+def combine_insights(chunk_insights, feedback_count, total_responses, chunk_weights=None, local_sentiment=None,
+                     local_topics=None):
+    """Combine insights from multiple chunks into final analysis.
     
-    if not chunk_insights:
+    chunk_weights gives the number of original responses behind each chunk;
+    chunks are weighted equally when it is omitted. local_sentiment holds
+    label counts for responses the model never saw; they are merged into the
+    sentiment breakdown as one more chunk. local_topics (topic_sentiment_map
+    entries from the local keyphrase pass) replace the guess from each
+    chunk's overall sentiment and any topic_ratings the model returns.
+    Raises when every chunk fell back to the placeholder result.
+    """
+    
+    local_weight = sum(local_sentiment.values()) if local_sentiment else 0
+    if not chunk_insights and not local_weight:
         return {
             'overall_sentiment': 'Neutral',
             'pain_points': ['No insights generated'],
@@ -266,15 +873,40 @@ def combine_insights(chunk_insights, feedback_count, total_responses):
             'feedback_count': feedback_count
         }
     
-    # Aggregate sentiment scores
-    total_positive = sum(chunk.get('sentiment_scores', {}).get('positive', 0) for chunk in chunk_insights)
-    total_neutral = sum(chunk.get('sentiment_scores', {}).get('neutral', 0) for chunk in chunk_insights)
-    total_negative = sum(chunk.get('sentiment_scores', {}).get('negative', 0) for chunk in chunk_insights)
-    
     num_chunks = len(chunk_insights)
-    avg_positive = total_positive / num_chunks if num_chunks > 0 else 0
-    avg_neutral = total_neutral / num_chunks if num_chunks > 0 else 0
-    avg_negative = total_negative / num_chunks if num_chunks > 0 else 0
+    if not chunk_weights:
+        chunk_weights = [1] * num_chunks
+    
+    # Placeholder results from failed chunks would drag every average toward
+    # their fixed scores, so they are left out; with none left there is
+    # nothing to report and the upload is failed so that it is retried
+    analyzed = [(chunk, w) for chunk, w in zip(chunk_insights, chunk_weights) if not chunk.get(FALLBACK_KEY)]
+    if chunk_insights and not analyzed:
+        raise Exception(f"All {len(chunk_insights)} chunks failed to analyze")
+    if len(analyzed) < len(chunk_insights):
+        print(f"Excluding {len(chunk_insights) - len(analyzed)} failed chunks from aggregation")
+        chunk_insights = [chunk for chunk, _ in analyzed]
+        chunk_weights = [w for _, w in analyzed]
+    
+    if local_weight:
+        local_scores = {key: 100 * count / local_weight for key, count in local_sentiment.items()}
+        chunk_insights = list(chunk_insights) + [{'sentiment_scores': local_scores}]
+        chunk_weights = list(chunk_weights) + [local_weight]
+    
+    # Tree-reduce chunk results: sentiment sums and frequency-ranked lists
+    partials = [reduction.chunk_to_partial(chunk, w, i) for i, (chunk, w) in enumerate(zip(chunk_insights, chunk_weights))]
+    reduced, reduce_depth = reduction.tree_reduce(partials)
+    print(f"Reduced {len(chunk_insights)} chunk results in {reduce_depth} levels")
+    
+    # Aggregate sentiment scores, weighted by responses per chunk that reported them
+    total_weight = reduced['sentiment_weight']
+    total_positive = reduced['sentiment']['positive']
+    total_neutral = reduced['sentiment']['neutral']
+    total_negative = reduced['sentiment']['negative']
+    
+    avg_positive = total_positive / total_weight if total_weight > 0 else 0
+    avg_neutral = total_neutral / total_weight if total_weight > 0 else 0
+    avg_negative = total_negative / total_weight if total_weight > 0 else 0
     
     # Determine overall sentiment
     if avg_positive > avg_negative and avg_positive > 40:
@@ -284,20 +916,11 @@ def combine_insights(chunk_insights, feedback_count, total_responses):
     else:
         overall_sentiment = 'Mixed'
     
-    # Aggregate pain points and insights
-    all_pain_points = []
-    all_insights = []
-    all_positive_aspects = []
-    
-    for chunk in chunk_insights:
-        all_pain_points.extend(chunk.get('pain_points', []))
-        all_insights.extend(chunk.get('actionable_insights', []))
-        all_positive_aspects.extend(chunk.get('positive_aspects', []))
-    
-    # Remove duplicates and get top items
-    unique_pain_points = list(dict.fromkeys(all_pain_points))[:5]
-    unique_insights = list(dict.fromkeys(all_insights))[:3]
-    unique_positive = list(dict.fromkeys(all_positive_aspects))[:3]
+    # Top items by how many chunks raised them, with paraphrases merged into one label
+    top_pain_points = clustered_top_items(reduced, 'pain_points', 5)
+    unique_pain_points = [label for label, _ in top_pain_points]
+    unique_insights = [label for label, _ in clustered_top_items(reduced, 'actionable_insights', 3)]
+    unique_positive = [label for label, _ in clustered_top_items(reduced, 'positive_aspects', 3)]
     print(f"Aggregated unique positive_aspects: {unique_positive}")
 
     # If no positive aspects found, add a default message
@@ -317,8 +940,9 @@ def combine_insights(chunk_insights, feedback_count, total_responses):
         # If chunk has topics_mentioned and sentiment_scores, try to aggregate
         topics = chunk.get('topics_mentioned', [])
         sentiment = chunk.get('sentiment_scores', {})
-        # If chunk has topic_ratings, use them (custom extension, not in prompt)
-        topic_ratings = chunk.get('topic_ratings', {})
+        # topic_ratings are only requested when topics are not extracted locally;
+        # the local map replaces them, so none are merged in that case
+        topic_ratings = chunk.get('topic_ratings', {}) if local_topics is None else {}
         # If chunk has avg_satisfaction, use it (custom extension, not in prompt)
         if 'avg_satisfaction' in chunk:
             satisfaction_scores.append(chunk['avg_satisfaction'])
@@ -342,7 +966,7 @@ def combine_insights(chunk_insights, feedback_count, total_responses):
                 topic_sentiment_map[topic]['positive_count'] += rating_info.get('positive_count', 0)
                 topic_sentiment_map[topic]['negative_count'] += rating_info.get('negative_count', 0)
         # If not, try to count topics for positive/negative from sentiment
-        elif topics and sentiment:
+        elif topics and sentiment and local_topics is None:
             for topic in topics:
                 if topic not in topic_sentiment_map:
                     topic_sentiment_map[topic] = {
@@ -367,6 +991,9 @@ def combine_insights(chunk_insights, feedback_count, total_responses):
         del info['total_rating']
         del info['count']
 
+    if local_topics:
+        topic_sentiment_map.update(local_topics)
+
     # Compute avg_satisfaction
     if satisfaction_scores:
         avg_satisfaction = round(sum(satisfaction_scores) / len(satisfaction_scores), 2)
@@ -374,7 +1001,7 @@ def combine_insights(chunk_insights, feedback_count, total_responses):
         # If not available, try to estimate from sentiment (e.g., map positive/neutral/negative to 5/3/1)
         total_score = 0
         total_count = 0
-        for chunk in chunk_insights:
+        for chunk, weight in zip(chunk_insights, chunk_weights):
             sentiment = chunk.get('sentiment_scores', {})
             if sentiment:
                 total = sum(sentiment.values())
@@ -384,8 +1011,8 @@ def combine_insights(chunk_insights, feedback_count, total_responses):
                         sentiment.get('neutral', 0) * 3 +
                         sentiment.get('negative', 0) * 1
                     ) / total
-                    total_score += score
-                    total_count += 1
+                    total_score += score * weight
+                    total_count += weight
         avg_satisfaction = round(total_score / total_count, 2) if total_count > 0 else 0.0
 
     return {
@@ -396,6 +1023,7 @@ def combine_insights(chunk_insights, feedback_count, total_responses):
             'negative': round(avg_negative, 1)
         },
         'pain_points': unique_pain_points,
+        'pain_point_counts': dict(top_pain_points),
         'positive_aspects': unique_positive,
         'top_insights': unique_insights,
         'response_count': total_responses,
@@ -405,6 +1033,12 @@ def combine_insights(chunk_insights, feedback_count, total_responses):
         'topic_sentiment_map': topic_sentiment_map
     }
 
+def clustered_top_items(reduced, field, limit):
+    """Top (label, mentions) pairs for a reduced field after merging similar wording"""
+    ranked = reduction.top_items(reduced, field, reduction.REDUCE_KEEP_ITEMS)
+    clusters = text_clustering.cluster_texts([label for label, _ in ranked], [count for _, count in ranked])
+    return [(cluster['label'], cluster['count']) for cluster in clusters[:limit]]
+
 def store_insights(user_id, upload_id, insights_data):
     """Store insights in DynamoDB matching the SurveyInsights table structure"""
     try:
@@ -419,17 +1053,11 @@ def store_insights(user_id, upload_id, insights_data):
             else:
                 return obj
         
-        # Example: fetch total_survey_count and completed_analyses for the user
-        # You should implement actual logic to fetch these from your DB as needed
+        # Per-user aggregate counters: one GetItem however many surveys the user has
         total_survey_count = 0
         completed_analyses = 0
         try:
-            # Count all surveys for this user
-            response = survey_meta_table.query(
-                KeyConditionExpression=boto3.dynamodb.conditions.Key('user_id').eq(user_id)
-            )
-            total_survey_count = len(response.get('Items', []))
-            completed_analyses = sum(1 for item in response.get('Items', []) if item.get('status') == 'analyzed')
+            total_survey_count, completed_analyses = user_stats.read_user_counts(user_id, survey_meta_table)
         except Exception as e:
             print(f"Failed to fetch survey counts: {str(e)}")
 
@@ -439,16 +1067,23 @@ def store_insights(user_id, upload_id, insights_data):
             'analyzed_at': datetime.now().isoformat(),
             'status': 'completed',
             'analysis_chunks': convert_floats_to_decimal(insights_data.get('analysis_chunks', 0)),
+            'chunk_token_counts': convert_floats_to_decimal(insights_data.get('chunk_token_counts', [])),
             'feedback_count': convert_floats_to_decimal(insights_data.get('feedback_count', 0)),
+            'unique_feedback_count': convert_floats_to_decimal(insights_data.get('unique_feedback_count', 0)),
             'response_count': convert_floats_to_decimal(insights_data.get('response_count', 0)),
             'overall_sentiment': insights_data.get('overall_sentiment', 'neutral'),
             'sentiment_breakdown': convert_floats_to_decimal(insights_data.get('sentiment_breakdown', {})),
             'top_insights': convert_floats_to_decimal(insights_data.get('top_insights', [])),
             'positive_aspects': convert_floats_to_decimal(insights_data.get('positive_aspects', [])),  # <-- Ensure always present
             'pain_points': convert_floats_to_decimal(insights_data.get('pain_points', [])),
+            'pain_point_counts': convert_floats_to_decimal(insights_data.get('pain_point_counts', {})),
             'total_survey_count': convert_floats_to_decimal(total_survey_count),
             'completed_analyses': convert_floats_to_decimal(completed_analyses),
             'avg_satisfaction': convert_floats_to_decimal(insights_data.get('avg_satisfaction', 0.0)),
+            'rating_stats': convert_floats_to_decimal(insights_data.get('rating_stats', {})),
+            'sentiment_cascade': convert_floats_to_decimal(insights_data.get('sentiment_cascade', {})),
+            'sampling': convert_floats_to_decimal(insights_data.get('sampling', {})),
+            'cohorts': convert_floats_to_decimal(insights_data.get('cohorts', {})),
             'topic_sentiment_map': convert_floats_to_decimal(insights_data.get('topic_sentiment_map', {}))
         }
         # Store in DynamoDB
@@ -458,21 +1093,123 @@ def store_insights(user_id, upload_id, insights_data):
     except Exception as e:
         raise Exception(f"Failed to store insights: {str(e)}")
 
-def update_survey_status(user_id, upload_id, status):
-    """Update the survey metadata status"""
+def clear_checkpoints(user_id, upload_id):
+    """Drop a finished run's chunk checkpoints; failures only leave them to expire"""
+    
+    store = lazy_value(checkpoint_store)
+    if store is None:
+        return
+    try:
+        store.clear(checkpoints.checkpoint_run_id(user_id, upload_id))
+    except Exception as e:
+        print(f"Failed to clear checkpoints: {str(e)}")
+
+def claim_upload(user_id, upload_id, lease_owner):
+    """Atomically move an upload to analyzing.
+    
+    Allowed from preprocessed, from analysis_failed (a retried stream record)
+    or from an analyzing lease that has expired. Returns (claimed,
+    lease_expires_at); when another worker holds a live lease,
+    lease_expires_at is when it runs out, otherwise it is None.
+    """
     
+    now = int(time.time())
     try:
         survey_meta_table.update_item(
             Key={'user_id': user_id, 'upload_id': upload_id},
-            UpdateExpression="SET #s = :s, analyzed_at = :t",
+            UpdateExpression="SET #s = :analyzing, lease_owner = :o, lease_expires_at = :exp, analysis_started_at = :t",
+            ConditionExpression="#s IN (:preprocessed, :failed) OR (#s = :analyzing AND lease_expires_at < :now)",
             ExpressionAttributeNames={'#s': 'status'},
             ExpressionAttributeValues={
-                ':s': status,
+                ':analyzing': 'analyzing',
+                ':preprocessed': 'preprocessed',
+                ':failed': 'analysis_failed',
+                ':o': lease_owner,
+                ':exp': now + ANALYSIS_LEASE_SECONDS,
+                ':now': now,
                 ':t': datetime.now().isoformat()
             }
         )
+        return True, None
+    except botocore_exceptions.ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+    
+    item = survey_meta_table.get_item(Key={'user_id': user_id, 'upload_id': upload_id},
+                                      ConsistentRead=True).get('Item', {})
+    if item.get('status') == 'analyzing':
+        return False, int(item.get('lease_expires_at', now))
+    return False, None
+
+def renew_claim(user_id, upload_id, lease_owner):
+    """Extend the lease if this worker still holds it"""
+    
+    try:
+        survey_meta_table.update_item(
+            Key={'user_id': user_id, 'upload_id': upload_id},
+            UpdateExpression="SET lease_expires_at = :exp",
+            ConditionExpression="#s = :analyzing AND lease_owner = :o",
+            ExpressionAttributeNames={'#s': 'status'},
+            ExpressionAttributeValues={
+                ':analyzing': 'analyzing',
+                ':o': lease_owner,
+                ':exp': int(time.time()) + ANALYSIS_LEASE_SECONDS
+            }
+        )
+        return True
+    except botocore_exceptions.ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise
+
+def update_survey_status(user_id, upload_id, status, lease_owner=None):
+    """Update the survey metadata status.
+    
+    With lease_owner, the update only applies while that worker holds the
+    lease, which it releases.
+    """
+    
+    try:
+        if lease_owner is None:
+            survey_meta_table.update_item(
+                Key={'user_id': user_id, 'upload_id': upload_id},
+                UpdateExpression="SET #s = :s, analyzed_at = :t",
+                ExpressionAttributeNames={'#s': 'status'},
+                ExpressionAttributeValues={
+                    ':s': status,
+                    ':t': datetime.now().isoformat()
+                }
+            )
+        else:
+            update_expression = "SET #s = :s, analyzed_at = :t"
+            if status == 'analyzed':
+                # first_analyzed_at tells a first completion from a re-analysis
+                update_expression += ", first_analyzed_at = if_not_exists(first_analyzed_at, :t)"
+            response = survey_meta_table.update_item(
+                Key={'user_id': user_id, 'upload_id': upload_id},
+                UpdateExpression=update_expression + " REMOVE lease_owner, lease_expires_at",
+                ConditionExpression="lease_owner = :o",
+                ExpressionAttributeNames={'#s': 'status'},
+                ExpressionAttributeValues={
+                    ':s': status,
+                    ':t': datetime.now().isoformat(),
+                    ':o': lease_owner
+                },
+                ReturnValues='UPDATED_OLD'
+            )
+            if status == 'analyzed' and 'first_analyzed_at' not in response.get('Attributes', {}):
+                try:
+                    user_stats.record_completed_analysis(user_id)
+                except Exception as e:
+                    print(f"Failed to update survey counters: {str(e)}")
         print(f"Survey status updated to {status} for {user_id}/{upload_id}")
         
+    except botocore_exceptions.ClientError as e:
+        if lease_owner is not None and e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            print(f"Lease for {user_id}/{upload_id} was taken over; not setting status {status}")
+            return
+        print(f"Failed to update survey status: {str(e)}")
+        raise
     except Exception as e:
         print(f"Failed to update survey status: {str(e)}")
         raise
\ No newline at end of file
@@ -0,0 +1,101 @@
+import io
+import os
+
+import pandas as pd
+
+from cohorts import COHORT_ANALYTICS, COHORT_KEY, CohortAccumulator, row_cohorts
+from extraction import FEEDBACK_COLUMNS, extract_feedback_responses
+from dedup import collapse_duplicates, multiplicity
+from rating_analytics import RatingHistogramAccumulator
+from sampling import STRATUM_KEY, row_strata
+
+# 'stream' reads the object body in row batches; 'full' loads it in one go
+CSV_READ_MODE = os.environ.get('CSV_READ_MODE', 'stream')
+CSV_STREAM_BATCH_ROWS = int(os.environ.get('CSV_STREAM_BATCH_ROWS', '20000'))
+# Distinct responses retained before ingestion gives up (TooManyUniqueResponses);
+# about 1 KB each, so the default stays well inside UPLOAD_MEMORY_MB
+INGEST_MAX_UNIQUE_RESPONSES = int(os.environ.get('INGEST_MAX_UNIQUE_RESPONSES', '50000'))
+
+def iter_csv_batches(body, read_mode=None, batch_rows=None):
+    """Yield DataFrames from a file-like CSV body (e.g. an S3 StreamingBody)"""
+    read_mode = read_mode or CSV_READ_MODE
+    batch_rows = batch_rows or CSV_STREAM_BATCH_ROWS
+
+    if read_mode == 'full':
+        yield pd.read_csv(io.BytesIO(body.read()))
+        return
+
+    # read_csv pulls from the body incrementally, so only one batch is resident
+    with pd.read_csv(body, chunksize=batch_rows) as reader:
+        yield from reader
+
+def ingest_survey(body, read_mode=None, batch_rows=None, sampler=None, max_unique=None):
+    """Extract, dedup and rate a survey CSV in one pass over its rows.
+
+    Returns (unique_feedback, summary); the summary carries row_count,
+    feedback_count, feedback_columns, rating_analytics and, with
+    COHORT_ANALYTICS, cohorts (per-batch_code ratings). Responses then carry
+    their cohort and are only collapsed within it.
+
+    With a StratifiedSampler, rating analytics and counts still cover every
+    row but only the sample is kept: unique_feedback is then the list of
+    (stratum, unique responses) groups and summary['sampling'] describes
+    the design. A survey that fits the sample budget is returned as usual.
+
+    Without a sampler, only distinct answers are retained, so memory grows
+    with their number; more than max_unique (INGEST_MAX_UNIQUE_RESPONSES)
+    raises dedup.TooManyUniqueResponses and the caller should re-read the
+    survey with a sampler.
+    """
+    max_unique = INGEST_MAX_UNIQUE_RESPONSES if max_unique is None else max_unique
+    summary = {'row_count': 0, 'feedback_columns': None}
+    ratings = RatingHistogramAccumulator()
+    cohort_ratings = CohortAccumulator() if COHORT_ANALYTICS else None
+    partition_key = COHORT_KEY if COHORT_ANALYTICS else None
+
+    def feedback_batches():
+        for batch in iter_csv_batches(body, read_mode, batch_rows):
+            summary['row_count'] += len(batch)
+            ratings.add(batch)
+
+            if summary['feedback_columns'] is None:
+                summary['feedback_columns'] = [col for col in FEEDBACK_COLUMNS if col in batch.columns]
+                print(f"Available feedback columns: {summary['feedback_columns']}")
+
+            row_meta = {}
+            if cohort_ratings is not None:
+                cohort_ratings.add(batch, list(ratings.histograms))
+                cohorts = row_cohorts(batch)
+                if cohorts is not None:
+                    row_meta[COHORT_KEY] = cohorts
+            if sampler is not None:
+                row_meta[STRATUM_KEY] = row_strata(batch, list(ratings.histograms))
+            yield extract_feedback_responses(batch, summary['feedback_columns'], row_meta)
+
+    if sampler is not None:
+        for responses in feedback_batches():
+            sampler.add(responses)
+        groups, report = sampler.sample()
+        summary['feedback_columns'] = summary['feedback_columns'] or []
+        summary['feedback_count'] = report['population']
+        summary['rating_analytics'] = ratings.result()
+        if cohort_ratings is not None:
+            summary['cohorts'] = cohort_ratings.result(list(ratings.histograms))
+        if report['sample_size'] < report['population']:
+            summary['sampling'] = report
+            return groups, summary
+        # Everything fits the budget: analyze it all without strata
+        return collapse_duplicates((response for _, members in groups for response in members),
+                                   partition_key=partition_key), summary
+
+    # Only distinct answers are retained while the rows stream past
+    unique_feedback = collapse_duplicates(
+        (response for responses in feedback_batches() for response in responses), partition_key=partition_key,
+        max_unique=max_unique)
+
+    summary['feedback_columns'] = summary['feedback_columns'] or []
+    summary['feedback_count'] = sum(multiplicity(response) for response in unique_feedback)
+    summary['rating_analytics'] = ratings.result()
+    if cohort_ratings is not None:
+        summary['cohorts'] = cohort_ratings.result(list(ratings.histograms))
+    return unique_feedback, summary
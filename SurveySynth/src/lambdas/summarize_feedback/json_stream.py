@@ -0,0 +1,108 @@
+import json
+
+def is_string_list(value):
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+def is_number_map(keys):
+    """Validator for an object whose given keys all hold numbers"""
+    return lambda value: isinstance(value, dict) and all(
+        isinstance(value.get(key), (int, float)) and not isinstance(value.get(key), bool) for key in keys
+    )
+
+class StreamingJSONParser:
+    """Incrementally extract one top-level JSON object from streamed model text.
+
+    Text is scanned as it arrives, tracking string/escape state and nesting
+    depth, so braces inside strings or stray braces in surrounding prose do
+    not confuse it. Each top-level member is parsed and checked against
+    validators[name] as soon as the comma or closing brace after it is seen.
+    A candidate object that turns out not to be JSON is dropped and scanning
+    resumes at the next '{'.
+    """
+
+    def __init__(self, validators, required=None):
+        self.validators = validators
+        self.required = set(validators if required is None else required)
+        self.text = ''
+        self.errors = []
+        self.closed = False
+        self._reset_scan(0)
+
+    def _reset_scan(self, position):
+        self._pos = position
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._object_start = None
+        self._member_start = None
+        self._candidate_fields = {}
+
+    def feed(self, text):
+        """Consume more text; returns True once nothing further is needed"""
+        self.text += text
+        while not self.closed and self._pos < len(self.text):
+            position = self._pos
+            self._pos += 1
+            char = self.text[position]
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif self._object_start is None:
+                if char == '{':
+                    self._object_start = position
+                    self._member_start = position + 1
+                    self._depth = 1
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    if not self._end_member(position):
+                        continue
+                    if not self._candidate_fields:
+                        # An empty or field-less object (e.g. '{}' in prose); keep looking
+                        self._reset_scan(position + 1)
+                        continue
+                    self.closed = True
+            elif char == ',' and self._depth == 1:
+                self._end_member(position)
+        return self.done
+
+    def _end_member(self, position):
+        """Parse the member ending at position; on failure restart after this candidate"""
+        member = self.text[self._member_start:position].strip()
+        self._member_start = position + 1
+        if not member:
+            return True
+        try:
+            parsed = json.loads('{' + member + '}')
+        except json.JSONDecodeError:
+            self._reset_scan(self._object_start + 1)
+            return False
+        for name, value in parsed.items():
+            validator = self.validators.get(name)
+            if validator is not None and not validator(value):
+                self.errors.append(f"Invalid value for {name}")
+                continue
+            self._candidate_fields[name] = value
+        return True
+
+    @property
+    def done(self):
+        """The object has closed, or every field we validate has already arrived"""
+        return self.closed or all(name in self._candidate_fields for name in self.validators)
+
+    @property
+    def usable(self):
+        """Every required field arrived and passed validation"""
+        return all(name in self._candidate_fields for name in self.required)
+
+    def result(self):
+        return dict(self._candidate_fields)
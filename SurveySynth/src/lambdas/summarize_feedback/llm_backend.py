@@ -0,0 +1,261 @@
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+# Which backend serves model calls: 'bedrock' in AWS, 'stub' for offline runs
+LLM_BACKEND = os.environ.get('LLM_BACKEND', 'bedrock')
+BEDROCK_REGION = os.environ.get('BEDROCK_REGION', 'us-east-1')
+# One attempt per request: throttles are retried by rate_control's AIMD loop,
+# which must see every rejection rather than botocore's retries hiding them
+BEDROCK_CLIENT_CONFIG = Config(retries={'total_max_attempts': 1, 'mode': 'standard'})
+
+# Offline stub behaviour
+STUB_LATENCY_MS = float(os.environ.get('STUB_LATENCY_MS', '800'))
+STUB_JITTER_MS = float(os.environ.get('STUB_JITTER_MS', '200'))
+STUB_THROTTLE_RATE = float(os.environ.get('STUB_THROTTLE_RATE', '0'))
+STUB_SEED = int(os.environ.get('STUB_SEED', '42'))
+STUB_FIRST_TOKEN_SHARE = 0.2
+STUB_STREAM_PIECE_CHARS = 16
+# Group tags in response headers, e.g. "--- Response 3 [G2] ---"
+STUB_GROUP_TAG = re.compile(r' \[(G\d+)\] ---')
+
+# Rough prompt/output token estimate shared by both backends' counters
+CHARS_PER_TOKEN = 4
+
+def uses_messages_api(model_id):
+    """Claude 3+ models take the Messages body; claude-v2/instant take a raw prompt"""
+    return not any(legacy in model_id for legacy in ('claude-v2', 'claude-instant'))
+
+class LLMBackend:
+    """Common call counters; subclasses implement _complete"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {'calls': 0, 'errors': 0, 'prompt_tokens': 0, 'output_tokens': 0}
+
+    def _count(self, **increments):
+        with self._lock:
+            for name, value in increments.items():
+                self.counters[name] += value
+
+    def complete(self, prompt, model_id, max_tokens, temperature, stop_sequences=None):
+        """Send one prompt and return the model's text output"""
+        self._count(calls=1, prompt_tokens=len(prompt) // CHARS_PER_TOKEN)
+        try:
+            text = self._complete(prompt, model_id, max_tokens, temperature, stop_sequences)
+        except Exception:
+            self._count(errors=1)
+            raise
+        self._count(output_tokens=len(text) // CHARS_PER_TOKEN)
+        return text
+
+    def stream(self, prompt, model_id, max_tokens, temperature, stop_sequences=None):
+        """Yield the model's text output piece by piece as it is generated.
+
+        Closing the generator early (e.g. breaking out of the loop) ends the
+        underlying response stream.
+        """
+        self._count(calls=1, prompt_tokens=len(prompt) // CHARS_PER_TOKEN)
+        produced = 0
+        pieces = self._stream(prompt, model_id, max_tokens, temperature, stop_sequences)
+        try:
+            for piece in pieces:
+                produced += len(piece)
+                yield piece
+        except Exception:
+            self._count(errors=1)
+            raise
+        finally:
+            pieces.close()
+            self._count(output_tokens=produced // CHARS_PER_TOKEN)
+
+    def _stream(self, prompt, model_id, max_tokens, temperature, stop_sequences):
+        yield self._complete(prompt, model_id, max_tokens, temperature, stop_sequences)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
+
+class BedrockBackend(LLMBackend):
+    """Amazon Bedrock runtime"""
+
+    def __init__(self, region_name=BEDROCK_REGION, client=None):
+        super().__init__()
+        self.client = client or boto3.client('bedrock-runtime', region_name=region_name,
+                                                   config=BEDROCK_CLIENT_CONFIG)
+
+    def _request_body(self, prompt, model_id, max_tokens, temperature, stop_sequences):
+        if uses_messages_api(model_id):
+            body = {
+                'anthropic_version': 'bedrock-2023-05-31',
+                'max_tokens': max_tokens,
+                'messages': [
+                    {
+                        'role': 'user',
+                        'content': prompt
+                    }
+                ],
+                'temperature': temperature
+            }
+            if stop_sequences:
+                body['stop_sequences'] = stop_sequences
+        else:
+            body = {
+                'prompt': prompt,
+                'max_tokens_to_sample': max_tokens,
+                'temperature': temperature
+            }
+            if stop_sequences:
+                body['stop_sequences'] = stop_sequences
+        return json.dumps(body)
+
+    def _complete(self, prompt, model_id, max_tokens, temperature, stop_sequences):
+        response = self.client.invoke_model(
+            modelId=model_id,
+            contentType='application/json',
+            accept='application/json',
+            body=self._request_body(prompt, model_id, max_tokens, temperature, stop_sequences)
+        )
+        response_body = json.loads(response['body'].read())
+        if uses_messages_api(model_id):
+            return response_body['content'][0]['text']
+        return response_body.get('completion', 'No output')
+
+    def _stream(self, prompt, model_id, max_tokens, temperature, stop_sequences):
+        response = self.client.invoke_model_with_response_stream(
+            modelId=model_id,
+            contentType='application/json',
+            accept='application/json',
+            body=self._request_body(prompt, model_id, max_tokens, temperature, stop_sequences)
+        )
+        events = response['body']
+        try:
+            for event in events:
+                chunk = event.get('chunk')
+                if not chunk:
+                    continue
+                payload = json.loads(chunk['bytes'])
+                if uses_messages_api(model_id):
+                    # Messages API: text arrives in content_block_delta events
+                    if payload.get('type') == 'content_block_delta':
+                        text = payload.get('delta', {}).get('text', '')
+                    else:
+                        text = ''
+                else:
+                    text = payload.get('completion', '')
+                if text:
+                    yield text
+        finally:
+            events.close()
+
+class StubBackend(LLMBackend):
+    """Offline stand-in returning schema-valid analysis JSON.
+
+    Output depends only on the prompt, so caching and checkpointing behave as
+    they would against Bedrock. Latency, jitter and ThrottlingException
+    injection come from a seeded RNG so runs are reproducible.
+    """
+
+    PAIN_POINTS = [
+        'Pace of teaching is too fast', 'Need more hands-on projects', 'Doubt solving sessions are too short',
+        'Microservices module needs more depth', 'Assignments not aligned with lectures',
+        'Testing topics covered too briefly', 'More real-world project experience needed'
+    ]
+    POSITIVE_ASPECTS = [
+        'Instructor explains concepts clearly', 'Good coverage of Spring Boot', 'React sessions were engaging',
+        'Mini projects helped learning', 'Well structured syllabus'
+    ]
+    INSIGHTS = [
+        'Add weekly hands-on labs', 'Schedule extra doubt-clearing sessions', 'Extend the microservices module',
+        'Align assignments with lecture topics', 'Add a capstone project with code reviews'
+    ]
+    TOPICS = ['Spring', 'React', 'Hibernate', 'REST API', 'Microservices', 'Testing', 'Build tools']
+
+    def __init__(self, latency_ms=STUB_LATENCY_MS, jitter_ms=STUB_JITTER_MS,
+                 throttle_rate=STUB_THROTTLE_RATE, seed=STUB_SEED):
+        super().__init__()
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.throttle_rate = throttle_rate
+        self._timing_rng = random.Random(seed)
+        self._timing_lock = threading.Lock()
+
+    def _next_call(self):
+        """Draw (delay in seconds, throttled) for one call"""
+        with self._timing_lock:
+            delay = max(0.0, self.latency_ms + self._timing_rng.uniform(-self.jitter_ms, self.jitter_ms))
+            throttled = self._timing_rng.random() < self.throttle_rate
+        return delay / 1000, throttled
+
+    def _throttle(self, operation):
+        raise ClientError(
+            {'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded (stub)'}},
+            operation
+        )
+
+    def _complete(self, prompt, model_id, max_tokens, temperature, stop_sequences):
+        delay, throttled = self._next_call()
+        time.sleep(delay)
+        if throttled:
+            self._throttle('InvokeModel')
+        return json.dumps(self.analysis_for(prompt))
+
+    def _stream(self, prompt, model_id, max_tokens, temperature, stop_sequences):
+        # A fifth of the latency before the first piece, the rest spread over the output
+        delay, throttled = self._next_call()
+        time.sleep(delay * STUB_FIRST_TOKEN_SHARE)
+        if throttled:
+            self._throttle('InvokeModelWithResponseStream')
+        text = json.dumps(self.analysis_for(prompt), indent=2)
+        pieces = [text[i:i + STUB_STREAM_PIECE_CHARS] for i in range(0, len(text), STUB_STREAM_PIECE_CHARS)]
+        for piece in pieces:
+            time.sleep(delay * (1 - STUB_FIRST_TOKEN_SHARE) / len(pieces))
+            yield piece
+
+    def analysis_for(self, prompt):
+        """Deterministic analysis derived from a hash of the prompt"""
+        rng = random.Random(hashlib.sha256(prompt.encode('utf-8')).hexdigest())
+        positive = rng.randint(20, 70)
+        negative = rng.randint(5, 100 - positive)
+        topics = rng.sample(self.TOPICS, 3)
+        analysis = {
+            'sentiment_scores': {'positive': positive, 'neutral': 100 - positive - negative, 'negative': negative},
+            'pain_points': rng.sample(self.PAIN_POINTS, 3),
+            'positive_aspects': rng.sample(self.POSITIVE_ASPECTS, 3),
+            'actionable_insights': rng.sample(self.INSIGHTS, 3)
+        }
+        if '"group_sentiment"' in prompt:
+            analysis['group_sentiment'] = {}
+            for tag in dict.fromkeys(STUB_GROUP_TAG.findall(prompt)):
+                group_positive = rng.randint(20, 70)
+                group_negative = rng.randint(5, 100 - group_positive)
+                analysis['group_sentiment'][tag] = {'positive': group_positive,
+                                                    'neutral': 100 - group_positive - group_negative,
+                                                    'negative': group_negative}
+        # Like the model, only answer with the topic fields the prompt asks for
+        if '"topics_mentioned"' in prompt:
+            analysis['topics_mentioned'] = topics
+        if '"topic_ratings"' in prompt:
+            analysis['topic_ratings'] = {
+                topic: {
+                    'avg_rating': round(rng.uniform(2, 5), 1),
+                    'positive_count': rng.randint(0, 10),
+                    'negative_count': rng.randint(0, 10)
+                }
+                for topic in topics
+            }
+        return analysis
+
+def build_llm_backend(name=LLM_BACKEND):
+    """Create the backend selected by LLM_BACKEND"""
+    if name == 'stub':
+        return StubBackend()
+    return BedrockBackend()
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from dynamodb_tables import SharedTable
+
+# Cache configuration
+LLM_CACHE_BACKEND = os.environ.get('LLM_CACHE_BACKEND', 'memory')  # memory | dynamodb | file | none
+LLM_CACHE_TABLE = os.environ.get('LLM_CACHE_TABLE', 'LLMResponseCache')
+LLM_CACHE_DIR = os.environ.get('LLM_CACHE_DIR', '/tmp/llm-cache')
+LLM_CACHE_TTL_SECONDS = int(os.environ.get('LLM_CACHE_TTL_SECONDS', str(30 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get('LLM_CACHE_MAX_ENTRIES', '512'))
+
+def cache_key(model_id, temperature, prompt):
+    """Content address for a model call: identical inputs map to the same key"""
+    payload = json.dumps([model_id, temperature, prompt], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class MemoryLRUCache:
+    """Bounded in-process tier that survives across warm invocations"""
+
+    def __init__(self, max_entries=LLM_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+class DynamoDBCache:
+    """Persistent tier; expires_at doubles as the table's TTL attribute"""
+
+    def __init__(self, table_name=LLM_CACHE_TABLE, ttl_seconds=LLM_CACHE_TTL_SECONDS):
+        self.table = SharedTable(table_name)
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, key):
+        item = self.table.get_item(Key={'cache_key': key}).get('Item')
+        # DynamoDB deletes expired items lazily, so check the TTL on read too
+        if not item or int(item.get('expires_at', 0)) < time.time():
+            return None
+        return json.loads(item['response'])
+
+    def put(self, key, value):
+        self.table.put_item(Item={
+            'cache_key': key,
+            'response': json.dumps(value),
+            'expires_at': int(time.time()) + self.ttl_seconds
+        })
+
+class LocalFileCache:
+    """Persistent tier stand-in for local runs: one JSON file per key"""
+
+    def __init__(self, directory=LLM_CACHE_DIR, ttl_seconds=LLM_CACHE_TTL_SECONDS):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'r') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get('expires_at', 0) < time.time():
+            return None
+        return entry['response']
+
+    def put(self, key, value):
+        tmp_path = f"{self._path(key)}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'response': value, 'expires_at': time.time() + self.ttl_seconds}, f)
+        os.replace(tmp_path, self._path(key))
+
+class TieredCache:
+    """Memory LRU in front of an optional persistent tier, with hit/miss counters"""
+
+    def __init__(self, memory=None, persistent=None):
+        self.memory = memory or MemoryLRUCache()
+        self.persistent = persistent
+        self._lock = threading.Lock()
+        self.counters = {'memory_hits': 0, 'persistent_hits': 0, 'misses': 0, 'errors': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            self._count('memory_hits')
+            return value
+
+        if self.persistent is not None:
+            try:
+                value = self.persistent.get(key)
+            except Exception as e:
+                print(f"LLM cache read failed: {str(e)}")
+                self._count('errors')
+                value = None
+            if value is not None:
+                self.memory.put(key, value)
+                self._count('persistent_hits')
+                return value
+
+        self._count('misses')
+        return None
+
+    def put(self, key, value):
+        self.memory.put(key, value)
+        if self.persistent is not None:
+            try:
+                self.persistent.put(key, value)
+            except Exception as e:
+                print(f"LLM cache write failed: {str(e)}")
+                self._count('errors')
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        hits = stats['memory_hits'] + stats['persistent_hits']
+        lookups = hits + stats['misses']
+        stats['hit_rate'] = round(hits / lookups, 3) if lookups else 0.0
+        return stats
+
+def build_llm_cache(backend=LLM_CACHE_BACKEND):
+    """Create the cache configured by LLM_CACHE_BACKEND, or None when caching is disabled"""
+    if backend == 'none':
+        return None
+    if backend == 'dynamodb':
+        return TieredCache(persistent=DynamoDBCache())
+    if backend == 'file':
+        return TieredCache(persistent=LocalFileCache())
+    return TieredCache()
@@ -0,0 +1,168 @@
+import os
+
+import numpy as np
+
+from dedup import feedback_fields, multiplicity, normalize_text
+
+# Cascade routing: a response is labelled locally only when it is short, clearly
+# polar (or says nothing) and names no course aspect the model should extract
+SENTIMENT_CASCADE = os.environ.get('SENTIMENT_CASCADE', 'on') == 'on'
+SENTIMENT_LOCAL_THRESHOLD = float(os.environ.get('SENTIMENT_LOCAL_THRESHOLD', '0.6'))
+SENTIMENT_LOCAL_MAX_WORDS = int(os.environ.get('SENTIMENT_LOCAL_MAX_WORDS', '8'))
+
+SENTIMENT_KEYS = ['positive', 'neutral', 'negative']
+
+POSITIVE_WORDS = {
+    'good': 1.0, 'great': 1.0, 'excellent': 1.0, 'awesome': 1.0, 'amazing': 1.0, 'nice': 0.8,
+    'fantastic': 1.0, 'wonderful': 1.0, 'best': 1.0, 'perfect': 1.0, 'helpful': 0.8, 'useful': 0.8,
+    'clear': 0.6, 'enjoyed': 0.8, 'enjoy': 0.8, 'love': 1.0, 'loved': 1.0, 'like': 0.6, 'liked': 0.6,
+    'satisfied': 0.8, 'happy': 0.8, 'informative': 0.8, 'engaging': 0.8, 'interesting': 0.7,
+    'superb': 1.0, 'outstanding': 1.0, 'brilliant': 1.0, 'fine': 0.4, 'okay': 0.2, 'ok': 0.2,
+    'thanks': 0.6, 'thank': 0.6, 'valuable': 0.8, 'effective': 0.7, 'well': 0.5, 'fun': 0.7
+}
+NEGATIVE_WORDS = {
+    'bad': -1.0, 'poor': -1.0, 'terrible': -1.0, 'awful': -1.0, 'worst': -1.0, 'boring': -0.8,
+    'confusing': -0.8, 'confused': -0.7, 'difficult': -0.6, 'hard': -0.5, 'slow': -0.5, 'fast': -0.4,
+    'rushed': -0.7, 'useless': -1.0, 'waste': -1.0, 'disappointed': -0.9, 'disappointing': -0.9,
+    'unclear': -0.8, 'lacking': -0.7, 'lack': -0.7, 'hate': -1.0, 'hated': -1.0, 'dislike': -0.8,
+    'unhappy': -0.8, 'frustrating': -0.9, 'outdated': -0.7, 'average': -0.3, 'mediocre': -0.7,
+    'improve': -0.3, 'improvement': -0.3, 'problem': -0.7, 'problems': -0.7, 'issue': -0.6, 'issues': -0.6
+}
+LEXICON = {**POSITIVE_WORDS, **NEGATIVE_WORDS}
+NEGATORS = {'not', 'no', 'never', 'dont', 'didnt', 'isnt', 'wasnt', 'arent', 'cannot', 'cant', 'hardly', 'nor'}
+NEGATION_WINDOW = 2  # a negator flips the polarity of the next two words
+
+# Answers that carry no opinion at all, after normalize_text
+NO_OPINION_TEXTS = {
+    'nothing', 'nothing to add', 'nothing else', 'no', 'none', 'na', 'n a', 'nil', 'no comments',
+    'no comment', 'no suggestions', 'nothing much', 'not really', 'no additional comments'
+}
+
+# Words that are not a course aspect; anything else (e.g. 'instructor', 'projects') goes to the model
+FILLER_WORDS = {
+    'a', 'an', 'the', 'it', 'its', 'is', 'was', 'are', 'were', 'be', 'been', 'this', 'that', 'i', 'me',
+    'my', 'we', 'our', 'you', 'and', 'or', 'but', 'so', 'very', 'really', 'quite', 'too', 'much', 'overall',
+    'everything', 'all', 'course', 'class', 'classes', 'program', 'training', 'session', 'sessions',
+    'experience', 'to', 'add', 'of', 'for', 'in', 'on', 'with', 'just', 'pretty', 'extremely', 'super',
+    'nothing', 'else', 'anything', 'thing', 'things', 'as', 'such', 'still', 'also', 'job', 'done'
+}
+NOT_ASPECT = FILLER_WORDS | set(LEXICON) | NEGATORS
+
+def token_polarity(tokens, position):
+    """Lexicon polarity of each token in a flat token list, flipped after a negator.
+
+    position[i] is the index of token i within its own text, so negation
+    never carries over from the previous text.
+    """
+    polarity, negator = lexicon_arrays(tokens)
+    return apply_negation(polarity, negator, position)
+
+def lexicon_arrays(words):
+    """(polarity, is_negator) arrays for a list of words"""
+    polarity = np.fromiter((LEXICON.get(word, 0.0) for word in words), dtype=np.float64, count=len(words))
+    negator = np.fromiter((word in NEGATORS for word in words), dtype=bool, count=len(words))
+    return polarity, negator
+
+def apply_negation(polarity, negator, position):
+    # Flip polarity of words that follow a negator in the same text
+    negated = np.zeros(len(polarity), dtype=bool)
+    for shift in range(1, NEGATION_WINDOW + 1):
+        negated[shift:] |= negator[:-shift] & (position[shift:] >= shift)
+    return np.where(negated, -polarity, polarity)
+
+def score_texts(texts):
+    """Lexicon sentiment of many texts at once.
+
+    Tokens of all texts are scored in flat NumPy arrays, with negation
+    handled by shifted masks. Returns a dict of per-text arrays: score
+    (summed polarity / max(1, summed absolute polarity), in [-1, 1], so weak
+    or conflicting words stay near 0), polar_words, aspect_words, word_count
+    and no_opinion.
+    """
+    n = len(texts)
+    normalized = [normalize_text(text) for text in texts]
+    tokenized = [text.split() for text in normalized]
+    word_count = np.fromiter((len(tokens) for tokens in tokenized), dtype=np.int64, count=n)
+    tokens = [token for text_tokens in tokenized for token in text_tokens]
+    text_ids = np.repeat(np.arange(n), word_count)
+    position = np.arange(len(tokens)) - np.repeat(np.cumsum(word_count) - word_count, word_count)
+
+    polarity = token_polarity(tokens, position)
+    aspect = np.fromiter((token not in NOT_ASPECT for token in tokens), dtype=bool, count=len(tokens))
+
+    total = np.bincount(text_ids, weights=polarity, minlength=n)
+    magnitude = np.bincount(text_ids, weights=np.abs(polarity), minlength=n)
+    return {
+        'score': total / np.maximum(magnitude, 1.0),
+        'polar_words': np.bincount(text_ids, weights=polarity != 0, minlength=n).astype(np.int64),
+        'aspect_words': np.bincount(text_ids, weights=aspect, minlength=n).astype(np.int64),
+        'word_count': word_count,
+        'no_opinion': np.fromiter((text in NO_OPINION_TEXTS for text in normalized), dtype=bool, count=n)
+    }
+
+def label_for(score):
+    if score > 0:
+        return 'positive'
+    if score < 0:
+        return 'negative'
+    return 'neutral'
+
+def classify_responses(responses, threshold=None, max_words=None):
+    """Score every response and decide which can skip the model.
+
+    Returns (labels, local_mask): labels[i] is the local best guess for
+    response i; local_mask[i] is True when that guess is confident enough to
+    replace the model. Each field of a response is scored separately and
+    the response is local only if every field is.
+    """
+    threshold = SENTIMENT_LOCAL_THRESHOLD if threshold is None else threshold
+    max_words = SENTIMENT_LOCAL_MAX_WORDS if max_words is None else max_words
+
+    field_texts = [[text for _, text in feedback_fields(response)] for response in responses]
+    counts = np.fromiter((len(texts) for texts in field_texts), dtype=np.int64, count=len(responses))
+    scored = score_texts([text for texts in field_texts for text in texts])
+    response_ids = np.repeat(np.arange(len(responses)), counts)
+
+    # A field is decidable locally if it is short, has no aspect words and is either no-opinion or clearly polar
+    polar = (scored['polar_words'] > 0) & (np.abs(scored['score']) >= threshold)
+    field_local = (
+        (scored['word_count'] <= max_words) & (scored['aspect_words'] == 0) & (scored['no_opinion'] | polar)
+    )
+    field_score = np.where(scored['no_opinion'], 0.0, scored['score'])
+
+    response_score = np.bincount(response_ids, weights=field_score, minlength=len(responses))
+    undecided = np.bincount(response_ids, weights=~field_local, minlength=len(responses))
+    local_mask = (undecided == 0) & (counts > 0)
+    # Opposing polar fields cancel out: leave those to the model
+    mixed = (np.bincount(response_ids, weights=field_score > 0, minlength=len(responses)) > 0) & \
+        (np.bincount(response_ids, weights=field_score < 0, minlength=len(responses)) > 0)
+    local_mask &= ~mixed
+    return [label_for(score) for score in response_score], local_mask
+
+def sentiment_counts(responses, labels):
+    """Responses per label, weighted by multiplicity"""
+    counts = dict.fromkeys(SENTIMENT_KEYS, 0)
+    for response, label in zip(responses, labels):
+        counts[label] += multiplicity(response)
+    return counts
+
+def route_responses(responses, threshold=None, max_words=None):
+    """Split responses into (for_model, local_counts).
+
+    local_counts is the multiplicity-weighted label count of the responses
+    handled locally; the rest keep their order for chunking.
+    """
+    labels, local_mask = classify_responses(responses, threshold, max_words)
+    for_model = [response for response, local in zip(responses, local_mask) if not local]
+    local = [(response, label) for response, label, is_local in zip(responses, labels, local_mask) if is_local]
+    return for_model, sentiment_counts([r for r, _ in local], [label for _, label in local])
+
+def distribution_agreement(local_counts, model_scores):
+    """1 - total variation distance between two sentiment distributions, in [0, 1]"""
+    local_total = sum(local_counts.values())
+    model_total = sum(model_scores.get(key, 0) for key in SENTIMENT_KEYS)
+    if local_total <= 0 or model_total <= 0:
+        return None
+    return 1 - 0.5 * sum(
+        abs(local_counts[key] / local_total - model_scores.get(key, 0) / model_total) for key in SENTIMENT_KEYS
+    )
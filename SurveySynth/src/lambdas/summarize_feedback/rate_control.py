@@ -0,0 +1,106 @@
+import os
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+# AIMD concurrency limits for model calls; the limit starts at AIMD_INITIAL_CONCURRENCY
+# and moves between AIMD_MIN_CONCURRENCY and the BEDROCK_MAX_CONCURRENCY ceiling
+AIMD_INITIAL_CONCURRENCY = float(os.environ.get('AIMD_INITIAL_CONCURRENCY', '2'))
+AIMD_MIN_CONCURRENCY = float(os.environ.get('AIMD_MIN_CONCURRENCY', '1'))
+AIMD_DECREASE_FACTOR = float(os.environ.get('AIMD_DECREASE_FACTOR', '0.5'))
+
+# Retries of a throttled call, with full-jitter exponential backoff
+RETRY_MAX_ATTEMPTS = int(os.environ.get('RETRY_MAX_ATTEMPTS', '6'))
+RETRY_BASE_DELAY_SECONDS = float(os.environ.get('RETRY_BASE_DELAY_SECONDS', '0.5'))
+RETRY_MAX_DELAY_SECONDS = float(os.environ.get('RETRY_MAX_DELAY_SECONDS', '20'))
+
+# Mid-stream errors from invoke_model_with_response_stream use camelCase codes
+THROTTLE_ERROR_CODES = {
+    'ThrottlingException', 'TooManyRequestsException', 'ServiceUnavailableException',
+    'throttlingException', 'serviceUnavailableException'
+}
+
+def is_throttle(error):
+    """True for errors that mean 'slow down' rather than 'this request is bad'"""
+    return isinstance(error, ClientError) and error.response.get('Error', {}).get('Code') in THROTTLE_ERROR_CODES
+
+def backoff_delay(attempt, base=RETRY_BASE_DELAY_SECONDS, cap=RETRY_MAX_DELAY_SECONDS, rng=random):
+    """Full-jitter backoff: uniform in [0, min(cap, base * 2**attempt)]"""
+    return rng.uniform(0, min(cap, base * (2 ** attempt)))
+
+class AIMDController:
+    """Concurrency limit shared by every worker calling the model.
+
+    Each success raises the limit by 1/limit (about +1 per round of calls);
+    a throttle multiplies it by AIMD_DECREASE_FACTOR. Throttles from calls
+    that started before the last cut do not cut again, so one burst of
+    rejections halves the limit once instead of collapsing it to the floor.
+    """
+
+    def __init__(self, max_concurrency, initial=AIMD_INITIAL_CONCURRENCY,
+                 min_concurrency=AIMD_MIN_CONCURRENCY, decrease_factor=AIMD_DECREASE_FACTOR):
+        self.max_concurrency = max(1.0, float(max_concurrency))
+        self.min_concurrency = max(1.0, min(float(min_concurrency), self.max_concurrency))
+        self.limit = min(max(float(initial), self.min_concurrency), self.max_concurrency)
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self._epoch = 0
+        self._condition = threading.Condition()
+        self.counters = {'successes': 0, 'throttles': 0, 'errors': 0, 'retries': 0, 'peak_limit': self.limit}
+
+    def acquire(self):
+        """Block until a slot is free under the current limit; returns the epoch it started in"""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+            return self._epoch
+
+    def release(self, epoch, outcome='success'):
+        """Free a slot; outcome is 'success', 'throttle' or 'error'.
+
+        Only successes grow the limit and only throttles cut it: a call that
+        failed for another reason says nothing about the service's capacity.
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if outcome == 'throttle':
+                self.counters['throttles'] += 1
+                if epoch == self._epoch:
+                    self.limit = max(self.min_concurrency, self.limit * self.decrease_factor)
+                    self._epoch += 1
+            elif outcome == 'success':
+                self.counters['successes'] += 1
+                self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+                self.counters['peak_limit'] = max(self.counters['peak_limit'], self.limit)
+            else:
+                self.counters['errors'] += 1
+            self._condition.notify_all()
+
+    def call(self, fn, max_attempts=RETRY_MAX_ATTEMPTS):
+        """Run fn() under the limit, retrying throttles with jittered backoff.
+
+        Non-throttle errors propagate immediately; the last throttle is
+        re-raised once max_attempts is exhausted.
+        """
+        for attempt in range(max_attempts):
+            epoch = self.acquire()
+            try:
+                result = fn()
+            except Exception as e:
+                throttled = is_throttle(e)
+                self.release(epoch, 'throttle' if throttled else 'error')
+                if not throttled or attempt == max_attempts - 1:
+                    raise
+                with self._condition:
+                    self.counters['retries'] += 1
+                time.sleep(backoff_delay(attempt))
+                continue
+            self.release(epoch)
+            return result
+
+    def stats(self):
+        with self._condition:
+            return {**self.counters, 'limit': round(self.limit, 2), 'in_flight': self.in_flight}
@@ -0,0 +1,110 @@
+import numpy as np
+
+# Survey rating scale (Likert 1-5)
+RATING_MIN = 1
+RATING_MAX = 5
+TOP_BOX = (4, 5)
+BOTTOM_BOX = (1, 2)
+PROMOTER_SCORES = (5,)
+DETRACTOR_SCORES = (1, 2, 3)
+PERCENTILES = (25, 50, 75)
+
+def is_rating_series(series):
+    """True when every non-null value is a whole number on the rating scale"""
+    values = series.dropna().to_numpy(dtype=float)
+    return bool(
+        not len(values)
+        or (values.min() >= RATING_MIN and values.max() <= RATING_MAX and np.all(values == np.floor(values)))
+    )
+
+def rating_histograms(df, columns):
+    """Per-column counts of every scale value, built with a single bincount.
+
+    Returns a (columns x scale points) int array; nulls are not counted.
+    """
+    values = df[columns].to_numpy(dtype=float)
+    scale_points = RATING_MAX - RATING_MIN + 1
+    # Shift valid ratings to 1..scale_points and send nulls to bucket 0
+    buckets = np.where(np.isnan(values), 0, values - RATING_MIN + 1).astype(np.int64)
+    flat = buckets + np.arange(len(columns), dtype=np.int64)[None, :] * (scale_points + 1)
+    counts = np.bincount(flat.ravel(), minlength=len(columns) * (scale_points + 1))
+    return counts.reshape(len(columns), scale_points + 1)[:, 1:]
+
+def _percentile_from_histogram(histogram, scale, q):
+    """Exact lower percentile of a discrete distribution from its cumulative counts"""
+    cumulative = np.cumsum(histogram)
+    target = q / 100 * cumulative[-1]
+    return int(scale[np.searchsorted(cumulative, target, side='left')])
+
+def summarize_ratings(histograms, columns):
+    """Means, distributions, percentiles, top/bottom-box and NPS-style scores per column"""
+    scale = np.arange(RATING_MIN, RATING_MAX + 1)
+    counts = histograms.sum(axis=1)
+    safe_counts = np.maximum(counts, 1)
+    means = histograms @ scale / safe_counts
+    top_box = histograms[:, np.isin(scale, TOP_BOX)].sum(axis=1) / safe_counts * 100
+    bottom_box = histograms[:, np.isin(scale, BOTTOM_BOX)].sum(axis=1) / safe_counts * 100
+    promoters = histograms[:, np.isin(scale, PROMOTER_SCORES)].sum(axis=1) / safe_counts * 100
+    detractors = histograms[:, np.isin(scale, DETRACTOR_SCORES)].sum(axis=1) / safe_counts * 100
+
+    stats = {}
+    for i, col in enumerate(columns):
+        if not counts[i]:
+            continue
+        stats[col] = {
+            'count': int(counts[i]),
+            'mean': round(float(means[i]), 2),
+            'distribution': {str(v): int(c) for v, c in zip(scale, histograms[i])},
+            'percentiles': {
+                f'p{q}': _percentile_from_histogram(histograms[i], scale, q) for q in PERCENTILES
+            },
+            'top_box_pct': round(float(top_box[i]), 1),
+            'bottom_box_pct': round(float(bottom_box[i]), 1),
+            'nps': round(float(promoters[i] - detractors[i]), 1)
+        }
+    return stats
+
+class RatingHistogramAccumulator:
+    """Builds rating histograms batch by batch so the whole file never has to be in memory.
+
+    A column counts as a rating column only if it looks like one in every
+    batch where it has values.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.rejected = set()
+
+    def add(self, df):
+        numeric = set(df.select_dtypes(include='number').columns)
+        for col in df.columns:
+            if col in self.rejected or not df[col].notna().any():
+                continue
+            if col not in numeric or not is_rating_series(df[col]):
+                self.rejected.add(col)
+                self.histograms.pop(col, None)
+
+        columns = [col for col in df.columns if col in numeric and col not in self.rejected
+                   and df[col].notna().any()]
+        if not columns:
+            return
+        for col, histogram in zip(columns, rating_histograms(df, columns)):
+            if col in self.histograms:
+                self.histograms[col] += histogram
+            else:
+                self.histograms[col] = histogram
+
+    def result(self):
+        """Exact rating metrics for every rating column, plus the overall mean rating"""
+        if not self.histograms:
+            return {'rating_stats': {}, 'overall_rating': None}
+
+        columns = list(self.histograms)
+        histograms = np.stack([self.histograms[col] for col in columns])
+        stats = summarize_ratings(histograms, columns)
+        total = histograms.sum()
+        overall = histograms.sum(axis=0) @ np.arange(RATING_MIN, RATING_MAX + 1) / total if total else None
+        return {
+            'rating_stats': stats,
+            'overall_rating': round(float(overall), 2) if overall is not None else None
+        }
@@ -0,0 +1,303 @@
+import os
+from statistics import NormalDist
+
+import numpy as np
+
+from chunking import group_tag
+from dedup import collapse_duplicates
+from local_sentiment import SENTIMENT_KEYS
+
+# Sampling mode: analyze a stratified sample of at most SAMPLE_BUDGET responses
+# instead of every response; sentiment is then reported with confidence intervals
+SAMPLING = os.environ.get('SAMPLING', 'off') == 'on'
+SAMPLE_BUDGET = int(os.environ.get('SAMPLE_BUDGET', '2000'))
+SAMPLE_MIN_PER_STRATUM = int(os.environ.get('SAMPLE_MIN_PER_STRATUM', '10'))
+SAMPLE_CONFIDENCE = float(os.environ.get('SAMPLE_CONFIDENCE', '0.95'))
+SAMPLE_SEED = int(os.environ.get('SAMPLE_SEED', '20240601'))
+# Strata are batch_code x band of the row's mean rating
+SAMPLE_STRATUM_COLUMN = os.environ.get('SAMPLE_STRATUM_COLUMN', 'batch_code')
+SAMPLE_RATING_BANDS = os.environ.get('SAMPLE_RATING_BANDS', 'on') == 'on'
+
+# Mean-rating band edges: below 2.5 low, below 3.5 mid, otherwise high
+RATING_BAND_EDGES = [2.5, 3.5]
+RATING_BAND_NAMES = np.array(['low', 'mid', 'high', 'unrated'], dtype=object)
+# Candidates kept beyond the budget so random shortfalls rarely cap a stratum's allocation
+POOL_SLACK = 1.25
+
+STRATUM_KEY = '_stratum'
+# Label of the stratum that the smallest strata share when there are too many to sample each
+OTHER_STRATUM = '(other)'
+
+def row_strata(df, rating_columns):
+    """Stratum label per row: '<batch_code>|<rating band>'"""
+    if SAMPLE_STRATUM_COLUMN in df.columns:
+        groups = df[SAMPLE_STRATUM_COLUMN].fillna('unknown').astype(str).to_numpy(dtype=object)
+    else:
+        groups = np.full(len(df), 'all', dtype=object)
+    if not SAMPLE_RATING_BANDS:
+        return groups
+
+    columns = [col for col in rating_columns if col in df.columns]
+    band = np.full(len(df), len(RATING_BAND_NAMES) - 1)
+    if columns:
+        values = df[columns].to_numpy(dtype=float)
+        rated = ~np.isnan(values).all(axis=1)
+        band[rated] = np.digitize(np.nanmean(values[rated], axis=1), RATING_BAND_EDGES)
+    return groups + '|' + RATING_BAND_NAMES[band]
+
+class StratifiedSampler:
+    """Streaming stratified random sample of at most budget responses.
+
+    Every response gets a uniform random key. The candidate pool keeps the
+    POOL_SLACK x budget smallest keys overall plus the min_per_stratum
+    smallest of each stratum. For every stratum that is a prefix of its
+    responses in key order, so the final per-stratum sample (its n_h
+    smallest keys) is a simple random sample of the stratum. Memory is
+    O(budget + strata x min_per_stratum) however many rows stream past.
+    Sparse strata are merged before the sample is drawn, so the
+    per-stratum minimums leave at least half the budget to be allocated in
+    proportion to stratum size (see merged_strata).
+    """
+
+    def __init__(self, budget=None, min_per_stratum=None, seed=None):
+        self.budget = SAMPLE_BUDGET if budget is None else budget
+        self.min_per_stratum = SAMPLE_MIN_PER_STRATUM if min_per_stratum is None else min_per_stratum
+        self.pool_size = int(self.budget * POOL_SLACK)
+        self.rng = np.random.default_rng(SAMPLE_SEED if seed is None else seed)
+        self.labels = []
+        self.label_ids = {}
+        self.population = np.zeros(0, dtype=np.int64)
+        self.keys = np.zeros(0)
+        self.strata = np.zeros(0, dtype=np.int64)
+        self.items = np.zeros(0, dtype=object)
+
+    def add(self, responses):
+        """Offer a batch of responses carrying STRATUM_KEY"""
+        if not responses:
+            return
+        ids = np.fromiter((self._stratum_id(r[STRATUM_KEY]) for r in responses), dtype=np.int64,
+                          count=len(responses))
+        self.population = np.bincount(ids, minlength=len(self.labels)) + np.pad(
+            self.population, (0, len(self.labels) - len(self.population)))
+        items = np.empty(len(responses), dtype=object)
+        items[:] = responses
+
+        keys = np.concatenate([self.keys, self.rng.random(len(responses))])
+        strata = np.concatenate([self.strata, ids])
+        items = np.concatenate([self.items, items])
+
+        keep = self._ranks_within_strata(keys, strata) < self.min_per_stratum
+        if len(keys) > self.pool_size:
+            keep[np.argpartition(keys, self.pool_size - 1)[:self.pool_size]] = True
+        else:
+            keep[:] = True
+        self.keys, self.strata, self.items = keys[keep], strata[keep], items[keep]
+
+    def _stratum_id(self, label):
+        if label not in self.label_ids:
+            self.label_ids[label] = len(self.labels)
+            self.labels.append(label)
+        return self.label_ids[label]
+
+    @staticmethod
+    def _ranks_within_strata(keys, strata):
+        """Rank of each key among the keys of its own stratum (0 = smallest)"""
+        order = np.lexsort((keys, strata))
+        sorted_strata = strata[order]
+        starts = np.flatnonzero(np.r_[True, sorted_strata[1:] != sorted_strata[:-1]])
+        sizes = np.diff(np.r_[starts, len(order)])
+        ranks = np.empty(len(keys), dtype=np.int64)
+        ranks[order] = np.arange(len(order)) - np.repeat(starts, sizes)
+        return ranks
+
+    def allocation(self, population=None, available=None):
+        """Responses to draw per stratum within the budget.
+
+        Every stratum first gets min_per_stratum (or all of it if smaller,
+        and never more than an equal split of the budget); the rest of the budget is split in proportion to what each stratum
+        has beyond that. Defaults to the strata as seen, without merging.
+        """
+        population = self.population if population is None else population
+        if available is None:
+            available = np.bincount(self.strata, minlength=len(population))
+        total = population.sum()
+        if total <= self.budget:
+            return population.copy()
+
+        per_stratum = min(self.min_per_stratum, self.budget // max(len(population), 1))
+        floor = np.minimum(np.minimum(population, available), per_stratum)
+        rest = max(0, self.budget - int(floor.sum()))
+        excess = population - floor
+        share = rest * excess / excess.sum() if excess.sum() else np.zeros(len(population))
+        allocation = np.minimum(floor + np.floor(share).astype(np.int64), available)
+        # Hand what is left of the budget to the largest remainders that still
+        # have candidates, going round again if strata ran out of them
+        order = np.argsort(-(share - np.floor(share)), kind='stable')
+        while allocation.sum() < self.budget and (allocation < available).any():
+            for h in order:
+                if allocation.sum() >= self.budget:
+                    break
+                if allocation[h] < available[h]:
+                    allocation[h] += 1
+        return allocation
+
+    def merged_strata(self):
+        """(stratum index per seen stratum, merged labels): sparse strata merged to fit the budget.
+
+        The per-stratum minimums may take at most half the budget, so at least
+        half is allocated in proportion to stratum size; with more strata than
+        that allows, the rating bands of the smallest batch codes are dropped
+        first, and if that is not enough the smallest remaining strata share
+        OTHER_STRATUM.
+        """
+        max_strata = max(1, self.budget // max(2 * self.min_per_stratum, 1))
+        merged = list(self.labels)
+        if len(merged) > max_strata:
+            codes = {}
+            for h, label in enumerate(self.labels):
+                codes.setdefault(label.split('|', 1)[0], []).append(h)
+            count = len(merged)
+            for code, members in sorted(codes.items(), key=lambda item: self.population[item[1]].sum()):
+                if count <= max_strata:
+                    break
+                for h in members:
+                    merged[h] = code
+                count -= len(members) - 1
+
+        labels = list(dict.fromkeys(merged))
+        if len(labels) > max_strata:
+            sizes = {}
+            for h, label in enumerate(merged):
+                sizes[label] = sizes.get(label, 0) + int(self.population[h])
+            # Keep the largest max_strata - 1 strata; the rest become one
+            kept = set(sorted(labels, key=lambda label: -sizes[label])[:max_strata - 1])
+            merged = [label if label in kept else OTHER_STRATUM for label in merged]
+            labels = list(dict.fromkeys(merged))
+
+        ids = {label: g for g, label in enumerate(labels)}
+        return np.array([ids[label] for label in merged], dtype=np.int64), labels
+
+    def _complete_below(self):
+        """Per seen stratum, a key up to which every one of its responses is still a candidate"""
+        complete = np.full(len(self.labels), np.inf)
+        if self.population.sum() <= self.pool_size:
+            return complete
+        # The pool holds the pool_size smallest keys overall, plus each stratum's smallest ones
+        overall = np.partition(self.keys, self.pool_size - 1)[self.pool_size - 1]
+        kept = np.bincount(self.strata, minlength=len(self.labels))
+        ranks = self._ranks_within_strata(self.keys, self.strata)
+        prefix = np.full(len(self.labels), -np.inf)
+        np.maximum.at(prefix, self.strata[ranks < self.min_per_stratum],
+                      self.keys[ranks < self.min_per_stratum])
+        return np.where(kept >= self.population, np.inf, np.maximum(overall, prefix))
+
+    def sample(self):
+        """(groups, report): sampled responses collapsed per stratum, and the sampling design.
+
+        groups is a list of (stratum label, unique responses) in first-seen
+        order, after sparse strata were merged (see merged_strata).
+        """
+        merged_of, labels = self.merged_strata()
+        strata = merged_of[self.strata]
+        population = np.bincount(merged_of, weights=self.population, minlength=len(labels)).astype(np.int64)
+        # A merged stratum's candidates are a prefix of its responses in key
+        # order only up to the smallest bound of its parts
+        complete = np.full(len(labels), np.inf)
+        np.minimum.at(complete, merged_of, self._complete_below())
+        available = np.bincount(strata[self.keys <= complete[strata]], minlength=len(labels))
+
+        allocation = self.allocation(population, available)
+        chosen = self._ranks_within_strata(self.keys, strata) < allocation[strata]
+        groups = []
+        for g, label in enumerate(labels):
+            members = self.items[chosen & (strata == g)].tolist()
+            if members:
+                groups.append((label, collapse_duplicates(members)))
+        report = {
+            'budget': self.budget,
+            'population': int(population.sum()),
+            'sample_size': int(allocation.sum()),
+            'merged_strata': len(self.labels) - len(labels),
+            'strata': {
+                label: {'population': int(population[g]), 'sampled': int(allocation[g])}
+                for g, label in enumerate(labels)
+            }
+        }
+        return groups, report
+
+def normalized_scores(scores):
+    """Chunk sentiment percentages rescaled to shares that sum to 1"""
+    values = [max(float(scores.get(key, 0) or 0), 0.0) for key in SENTIMENT_KEYS]
+    total = sum(values)
+    return [value / total for value in values] if total > 0 else None
+
+def expand_counts(group_counts, expansion):
+    """Population-scale label counts from per-stratum sample counts"""
+    return {
+        key: sum(counts.get(key, 0) * expansion.get(label, 0) for label, counts in group_counts.items())
+        for key in SENTIMENT_KEYS
+    }
+
+def stratum_sentiment_counts(groups, chunk_groups, chunk_insights, local_counts, skip=None):
+    """Estimated label counts of each stratum's sampled responses.
+
+    Locally labelled responses count as labelled. chunk_groups[i] maps each
+    stratum with responses in chunk i to the responses they stand for; a
+    stratum's weight is split by its own shares in the chunk's
+    group_sentiment (keyed by group tag) when the chunk mixed strata and the
+    model gave them, else by the chunk's sentiment_scores. Chunks for which
+    skip() is true (failed analyses) are left out.
+    """
+    counts = {label: dict.fromkeys(SENTIMENT_KEYS, 0.0) for label, _ in groups}
+    tags = {label: group_tag(index) for index, (label, _) in enumerate(groups)}
+    for label, local in (local_counts or {}).items():
+        for key in SENTIMENT_KEYS:
+            counts[label][key] += local.get(key, 0)
+    for weights, insight in zip(chunk_groups, chunk_insights):
+        if skip is not None and skip(insight):
+            continue
+        chunk_shares = normalized_scores(insight.get('sentiment_scores', {}))
+        group_scores = insight.get('group_sentiment') or {}
+        for label, weight in weights.items():
+            shares = None
+            if len(weights) > 1 and tags[label] in group_scores:
+                shares = normalized_scores(group_scores[tags[label]])
+            shares = shares or chunk_shares
+            if shares is None:
+                continue
+            for key, share in zip(SENTIMENT_KEYS, shares):
+                counts[label][key] += weight * share
+    return counts
+
+def stratified_sentiment(report, counts, confidence=None):
+    """Stratified estimate of each sentiment share with a normal-approximation interval.
+
+    p = sum_h W_h p_h with W_h = N_h / N, and
+    Var(p) = sum_h W_h^2 (1 - n_h / N_h) p_h (1 - p_h) / (n_h - 1).
+    Percentages, like sentiment_breakdown.
+    """
+    confidence = SAMPLE_CONFIDENCE if confidence is None else confidence
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    population = sum(stratum['population'] for label, stratum in report['strata'].items() if label in counts)
+
+    estimate = {}
+    for key in SENTIMENT_KEYS:
+        point = 0.0
+        variance = 0.0
+        for label, stratum_counts in counts.items():
+            n = sum(stratum_counts.values())
+            big_n = report['strata'][label]['population']
+            if n <= 0 or population <= 0:
+                continue
+            weight = big_n / population
+            p = stratum_counts[key] / n
+            point += weight * p
+            if n > 1:
+                variance += weight ** 2 * max(0.0, 1 - n / big_n) * p * (1 - p) / (n - 1)
+        margin = z * variance ** 0.5
+        estimate[key] = {
+            'estimate': round(100 * point, 1),
+            'ci_low': round(100 * max(0.0, point - margin), 1),
+            'ci_high': round(100 * min(1.0, point + margin), 1)
+        }
+    return {'confidence': confidence, 'sentiment': estimate}
@@ -0,0 +1,112 @@
+import os
+import zlib
+
+import numpy as np
+
+from dedup import normalize_text
+from local_sentiment import NEGATORS
+
+# Cosine similarity above which two items are candidates for the same point
+CLUSTER_SIMILARITY = float(os.environ.get('CLUSTER_SIMILARITY', '0.55'))
+# Similar spelling is not enough: "pace is too fast" and "pace is too slow"
+# share most n-grams. Two items are only merged when the content words of
+# one are all among the other's and they agree on negation.
+STOPWORDS = {
+    'a', 'an', 'the', 'is', 'are', 'was', 'were', 'be', 'been', 'being', 'it', 'its', 'this', 'that', 'these',
+    'those', 'i', 'me', 'my', 'we', 'our', 'us', 'you', 'your', 'they', 'their', 'to', 'of', 'for', 'in', 'on',
+    'at', 'by', 'with', 'from', 'and', 'or', 'so', 'as', 'too', 'very', 'really', 'quite', 'some', 'any',
+    'should', 'could', 'would', 'can', 'will', 'please', 'also', 'just'
+}
+NEGATION_WORDS = NEGATORS | {'t'}  # "don't" normalizes to "don t"
+STEM_SUFFIXES = ('ing', 'ed', 's')
+NGRAM_SIZES = (3, 4)
+FEATURE_DIM = 1 << 10  # hashed feature space; keeps memory flat for any vocabulary
+SIMILARITY_BLOCK = 512  # rows per block when searching for neighbours
+
+def _ngram_ids(text):
+    """Hashed character n-gram ids of a normalized text, padded at word boundaries"""
+    padded = f" {text} "
+    ids = []
+    for n in NGRAM_SIZES:
+        for i in range(len(padded) - n + 1):
+            ids.append(zlib.crc32(padded[i:i + n].encode('utf-8')) % FEATURE_DIM)
+    return ids
+
+def _stem(word):
+    for suffix in STEM_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+def content_words(text):
+    """(stemmed content words, negation words) of a text"""
+    words = normalize_text(text).split()
+    negations = frozenset(word for word in words if word in NEGATION_WORDS)
+    return frozenset(_stem(word) for word in words if word not in STOPWORDS and word not in NEGATION_WORDS), negations
+
+def words_agree(first, second):
+    """True when two content_words results can name the same point"""
+    (first_words, first_negations), (second_words, second_negations) = first, second
+    return first_negations == second_negations and (first_words <= second_words or second_words <= first_words)
+
+def tfidf_matrix(texts):
+    """L2-normalized TF-IDF rows over hashed character n-grams"""
+    rows, cols = [], []
+    for i, text in enumerate(texts):
+        ids = _ngram_ids(normalize_text(text))
+        rows.extend([i] * len(ids))
+        cols.extend(ids)
+
+    flat = np.asarray(rows, dtype=np.int64) * FEATURE_DIM + np.asarray(cols, dtype=np.int64)
+    tf = np.bincount(flat, minlength=len(texts) * FEATURE_DIM).astype(np.float32)
+    tf = tf.reshape(len(texts), FEATURE_DIM)
+
+    doc_freq = np.count_nonzero(tf, axis=0)
+    idf = np.log((1 + len(texts)) / (1 + doc_freq)).astype(np.float32) + 1.0
+    matrix = np.log1p(tf) * idf
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+def cluster_texts(texts, weights=None, threshold=None):
+    """Group near-equivalent texts.
+
+    Greedy leader clustering: the most-weighted unassigned text becomes a
+    cluster label and absorbs every unassigned text within threshold cosine
+    of it whose content words agree with its own (see words_agree). Returns clusters sorted by total weight as
+    {'label', 'count', 'members'}.
+    """
+    if not texts:
+        return []
+    threshold = CLUSTER_SIMILARITY if threshold is None else threshold
+    weights = list(weights) if weights is not None else [1] * len(texts)
+
+    # Leaders are visited by descending weight, then original position
+    order = sorted(range(len(texts)), key=lambda i: (-weights[i], i))
+    matrix = tfidf_matrix([texts[i] for i in order])
+    words = [content_words(texts[i]) for i in order]
+    assigned = np.zeros(len(order), dtype=bool)
+
+    clusters = []
+    for start in range(0, len(order), SIMILARITY_BLOCK):
+        rows = start + np.flatnonzero(~assigned[start:start + SIMILARITY_BLOCK])
+        if not len(rows):
+            continue
+        # Neighbour search as one matrix product per block, against unassigned texts only
+        open_cols = np.flatnonzero(~assigned)
+        close = (matrix[rows] @ matrix[open_cols].T) >= threshold
+        taken = np.zeros(len(open_cols), dtype=bool)
+        for leader, row in zip(rows.tolist(), close):
+            if assigned[leader]:
+                continue
+            candidates = open_cols[row & ~taken]
+            members = [m for m in candidates.tolist() if words_agree(words[leader], words[m])]
+            taken[np.searchsorted(open_cols, members)] = True
+            assigned[members] = True
+            clusters.append({
+                'label': texts[order[leader]],
+                'count': sum(weights[order[m]] for m in members),
+                'members': [texts[order[m]] for m in members]
+            })
+
+    clusters.sort(key=lambda c: -c['count'])
+    return clusters
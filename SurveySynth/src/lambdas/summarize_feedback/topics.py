@@ -0,0 +1,185 @@
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from dedup import feedback_fields, multiplicity, normalize_text
+from local_sentiment import apply_negation, lexicon_arrays
+
+# Local topic extraction: course topics named in the answers, with the
+# polarity of the clause naming them, fill topic_sentiment_map without the model
+TOPIC_EXTRACTION = os.environ.get('TOPIC_EXTRACTION', 'on') == 'on'
+
+RATING_SUFFIX = '_rating'
+# Longest keyphrase matched, in words
+MAX_PHRASE_WORDS = 3
+# A topic takes the polarity of the clause that names it, not of the whole answer:
+# clauses end at these punctuation marks and connectives
+CLAUSE_PUNCTUATION = re.compile(r'[.,;:!?()]+')
+CLAUSE_WORDS = {'but', 'however', 'although', 'though', 'whereas'}
+# Marker tokens placed between clauses and between texts in the joined text
+CLAUSE_MARK = '\x02'
+TEXT_MARK = '\x01'
+NON_WORD = re.compile(r'[^\w\s\x01\x02]+')
+
+# Display label and extra keyphrases for the rating columns of the course survey,
+# keyed by column name without RATING_SUFFIX. Other rating columns are matched
+# by their own words only.
+TOPIC_VOCABULARY = {
+    'course_content': ('Course Content', ['course content', 'content', 'topics covered']),
+    'syllabus_structured': ('Syllabus', ['syllabus', 'curriculum', 'course structure']),
+    'build_tools': ('Build Tools', ['build tools', 'build tool', 'maven', 'gradle']),
+    'hibernate': ('Hibernate', ['hibernate', 'jpa', 'orm']),
+    'spring': ('Spring', ['spring', 'spring boot', 'springboot']),
+    'restapi': ('REST API', ['rest api', 'rest apis', 'restapi', 'restful', 'api', 'apis']),
+    'react': ('React', ['react', 'reactjs', 'react js']),
+    'microservices': ('Microservices', ['microservices', 'microservice', 'micro services']),
+    'testing': ('Testing', ['testing', 'tests', 'unit tests', 'junit']),
+    'instructor_explanation': ('Instructor', ['instructor', 'instructors', 'trainer', 'teacher', 'explanation',
+                                              'explanations']),
+    'pace_of_teaching': ('Pace', ['pace', 'pacing', 'speed']),
+    'doubt_solving_support': ('Doubt Solving', ['doubt', 'doubts', 'doubt solving', 'doubt sessions']),
+    'assignments_helpful': ('Assignments', ['assignment', 'assignments', 'homework']),
+    'mini_projects_given': ('Projects', ['project', 'projects', 'mini project', 'mini projects']),
+    'fullstack_exposure': ('Full Stack', ['full stack', 'fullstack']),
+    'job_readiness': ('Job Readiness', ['job readiness', 'placement', 'placements', 'interview', 'interviews'])
+}
+
+def topic_vocabulary(rating_columns):
+    """{keyphrase (tuple of words): (topic label, rating column)} seeded from the survey's rating columns"""
+    vocabulary = {}
+    for column in rating_columns:
+        stem = column[:-len(RATING_SUFFIX)] if column.endswith(RATING_SUFFIX) else column
+        label, phrases = TOPIC_VOCABULARY.get(stem, (stem.replace('_', ' ').title(), []))
+        for phrase in [stem.replace('_', ' ')] + phrases:
+            words = tuple(normalize_text(phrase).split())
+            if 0 < len(words) <= MAX_PHRASE_WORDS:
+                vocabulary.setdefault(words, (label, column))
+    return vocabulary
+
+def clause_tokens(texts):
+    """Tokenize many texts at once, cut into clauses.
+
+    All texts are joined into one string so the string work runs once in C;
+    tokens are normalized like dedup.normalize_text and factorized. Returns
+    (codes, words, clause_ids, text_of_clause): token i is words[codes[i]]
+    and lies in clause clause_ids[i]; clause c belongs to text text_of_clause[c].
+    """
+    joined = f' {TEXT_MARK} '.join(str(text) for text in texts).lower()
+    joined = NON_WORD.sub(' ', CLAUSE_PUNCTUATION.sub(f' {CLAUSE_MARK} ', joined))
+    codes, words = pd.factorize(np.array(joined.split(), dtype=object))
+    words = list(words)
+
+    text_break = np.array([word == TEXT_MARK for word in words], dtype=bool)[codes]
+    any_break = text_break | np.array([word == CLAUSE_MARK or word in CLAUSE_WORDS for word in words],
+                                      dtype=bool)[codes]
+    # A clause ends at every marker; empty clauses simply get no tokens
+    clause_of_token = np.cumsum(any_break)
+    text_of_clause = np.concatenate(([0], np.cumsum(text_break[any_break])))
+    return codes[~any_break], words, clause_of_token[~any_break], text_of_clause
+
+def topic_mentions(responses, vocabulary, weights=None):
+    """Responses mentioning each topic, split by the polarity of the mentioning clauses.
+
+    Every field is cut into clauses and all clauses are tokenized into flat
+    arrays. Keyphrases are matched as n-grams of vocabulary word ids and
+    scored with the lexicon of local_sentiment, all in NumPy. A response
+    counts once per topic, with the summed score of its clauses naming it.
+    weights default to each response's multiplicity.
+
+    Returns (labels, columns, mentions, positive, negative) with one entry per topic.
+    """
+    labels = list(dict.fromkeys(label for label, _ in vocabulary.values()))
+    topic_ids = {label: i for i, label in enumerate(labels)}
+    columns = [None] * len(labels)
+    for label, column in vocabulary.values():
+        columns[topic_ids[label]] = columns[topic_ids[label]] or column
+    texts = []
+    text_response = []
+    for i, response in enumerate(responses):
+        for _, text in feedback_fields(response):
+            texts.append(text)
+            text_response.append(i)
+    empty = np.zeros(len(labels))
+    if not texts or not labels:
+        return labels, columns, empty, empty, empty
+
+    if weights is None:
+        weights = [multiplicity(response) for response in responses]
+    codes, distinct, clause_ids, text_of_clause = clause_tokens(texts)
+    clause_response = np.asarray(text_response, dtype=np.int64)[text_of_clause]
+
+    word_count = np.bincount(clause_ids, minlength=len(text_of_clause))
+    position = np.arange(len(codes)) - (np.cumsum(word_count) - word_count)[clause_ids]
+    # Lexicon lookups run once per distinct word
+    polarity, negator = lexicon_arrays(distinct)
+    clause_score = np.bincount(clause_ids, weights=apply_negation(polarity[codes], negator[codes], position),
+                               minlength=len(text_of_clause))
+
+    # Keyphrases become integer keys over vocabulary word ids (base = vocabulary size + 1)
+    words = {word: i + 1 for i, word in enumerate(dict.fromkeys(w for phrase in vocabulary for w in phrase))}
+    base = len(words) + 1
+    word_ids = np.fromiter((words.get(word, 0) for word in distinct), dtype=np.int64, count=len(distinct))[codes]
+    phrases_by_length = {}
+    for phrase, (label, _) in vocabulary.items():
+        key = 0
+        for word in phrase:
+            key = key * base + words[word]
+        phrases_by_length.setdefault(len(phrase), {})[key] = topic_ids[label]
+
+    pair_clause = []
+    pair_topic = []
+    for n, phrases in phrases_by_length.items():
+        if len(codes) < n:
+            continue
+        starts = np.arange(len(codes) - n + 1)
+        # n-grams must lie within one clause and consist of vocabulary words only
+        valid = position[starts] + n <= word_count[clause_ids[starts]]
+        keys = np.zeros(len(starts), dtype=np.int64)
+        for offset in range(n):
+            ids = word_ids[starts + offset]
+            valid &= ids > 0
+            keys = keys * base + ids
+        phrase_keys = np.fromiter(phrases, dtype=np.int64, count=len(phrases))
+        phrase_topics = np.fromiter(phrases.values(), dtype=np.int64, count=len(phrases))
+        order = np.argsort(phrase_keys)
+        hit = valid & np.isin(keys, phrase_keys)
+        pair_clause.append(clause_ids[starts[hit]])
+        pair_topic.append(phrase_topics[order][np.searchsorted(phrase_keys[order], keys[hit])])
+
+    clauses = np.concatenate(pair_clause) if pair_clause else np.zeros(0, dtype=np.int64)
+    topics = np.concatenate(pair_topic) if pair_topic else np.zeros(0, dtype=np.int64)
+    # One entry per (clause, topic), then per (response, topic) summing clause scores
+    clause_topic = np.unique(clauses * len(labels) + topics)
+    clauses, topics = clause_topic // len(labels), clause_topic % len(labels)
+    response_topic, inverse = np.unique(clause_response[clauses] * len(labels) + topics,
+                                        return_inverse=True)
+    score = np.bincount(inverse, weights=clause_score[clauses], minlength=len(response_topic))
+    topic = response_topic % len(labels)
+    weight = np.asarray(weights, dtype=float)[response_topic // len(labels)]
+
+    mentions = np.bincount(topic, weights=weight, minlength=len(labels))
+    positive = np.bincount(topic, weights=weight * (score > 0), minlength=len(labels))
+    negative = np.bincount(topic, weights=weight * (score < 0), minlength=len(labels))
+    return labels, columns, mentions, positive, negative
+
+def topic_sentiment_map(responses, rating_stats, weights=None):
+    """topic_sentiment_map entries for every vocabulary topic the responses mention.
+
+    avg_rating is the measured mean of the rating column the topic was
+    seeded from; the counts are responses (weighted), most mentioned first.
+    """
+    vocabulary = topic_vocabulary(list(rating_stats))
+    labels, columns, mentions, positive, negative = topic_mentions(responses, vocabulary, weights)
+    result = {}
+    for i in np.argsort(-mentions, kind='stable'):
+        if mentions[i] <= 0:
+            break
+        result[labels[i]] = {
+            'avg_rating': rating_stats.get(columns[i], {}).get('mean', 0.0),
+            'positive_count': int(round(positive[i])),
+            'negative_count': int(round(negative[i])),
+            'mention_count': int(round(mentions[i]))
+        }
+    return result
@@ -0,0 +1,81 @@
+import os
+
+from dedup import text_key
+
+# How many partial results are merged at each node of the reduce tree
+REDUCE_FAN_IN = int(os.environ.get('REDUCE_FAN_IN', '8'))
+# Items kept per list at each node; bounds partial size for very large surveys
+REDUCE_KEEP_ITEMS = int(os.environ.get('REDUCE_KEEP_ITEMS', '200'))
+
+# Chunk-level list fields that are ranked by frequency across the survey
+RANKED_FIELDS = ['pain_points', 'actionable_insights', 'positive_aspects']
+SENTIMENT_KEYS = ['positive', 'neutral', 'negative']
+
+def chunk_to_partial(chunk, weight, order):
+    """Turn one chunk analysis into a mergeable partial result.
+
+    Each ranked item records [label, chunks mentioning it, responses behind
+    those chunks, first-seen position] keyed by its normalized text (see
+    dedup.text_key).
+    """
+    sentiment = chunk.get('sentiment_scores', {})
+    partial = {
+        'weight': weight,
+        # A chunk whose answer had no valid sentiment_scores adds nothing to the averages
+        'sentiment_weight': weight if sentiment else 0,
+        'sentiment': {key: sentiment.get(key, 0) * weight for key in SENTIMENT_KEYS},
+        'items': {}
+    }
+    for field in RANKED_FIELDS:
+        counted = {}
+        for position, label in enumerate(chunk.get(field, [])):
+            key = text_key(label)
+            if key and key not in counted:
+                counted[key] = [label, 1, weight, (order, position)]
+        partial['items'][field] = counted
+    return partial
+
+def _rank_key(item):
+    """Most frequent first; ties go to the larger share of responses, then first seen"""
+    return (-item[1], -item[2], item[3])
+
+def _rank(counted):
+    return sorted(counted.values(), key=_rank_key)
+
+def merge_partials(partials):
+    """Deterministically merge a group of partials into one"""
+    merged = {
+        'weight': sum(p['weight'] for p in partials),
+        'sentiment_weight': sum(p['sentiment_weight'] for p in partials),
+        'sentiment': {key: sum(p['sentiment'][key] for p in partials) for key in SENTIMENT_KEYS},
+        'items': {}
+    }
+    for field in RANKED_FIELDS:
+        counted = {}
+        for partial in partials:
+            for key, (label, mentions, weight, first_seen) in partial['items'][field].items():
+                if key in counted:
+                    entry = counted[key]
+                    entry[1] += mentions
+                    entry[2] += weight
+                    if first_seen < entry[3]:
+                        entry[0], entry[3] = label, first_seen
+                else:
+                    counted[key] = [label, mentions, weight, first_seen]
+        kept = sorted(counted.items(), key=lambda kv: _rank_key(kv[1]))[:REDUCE_KEEP_ITEMS]
+        merged['items'][field] = dict(kept)
+    return merged
+
+def tree_reduce(partials, fan_in=None):
+    """Merge partials level by level in groups of fan_in until one remains"""
+    fan_in = max(2, fan_in or REDUCE_FAN_IN)
+    level = list(partials)
+    depth = 0
+    while len(level) > 1:
+        level = [merge_partials(level[i:i + fan_in]) for i in range(0, len(level), fan_in)]
+        depth += 1
+    return (level[0] if level else None), depth
+
+def top_items(reduced, field, limit):
+    """Top-N (label, mentions) pairs for a ranked field of a reduced result"""
+    return [(item[0], item[1]) for item in _rank(reduced['items'][field])[:limit]]
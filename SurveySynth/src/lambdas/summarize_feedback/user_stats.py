@@ -0,0 +1,74 @@
+import os
+
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+from dynamodb_tables import SharedTable
+
+# One aggregate item per user (user_id hash key) holding atomic ADD counters:
+# total_survey_count (bumped by uploadSurveyHandler) and completed_analyses
+USER_STATS_TABLE = os.environ.get('USER_STATS_TABLE', 'UserSurveyStats')
+# Set by uploadSurveyHandler on the SurveyMeta items it counted in total_survey_count
+COUNTED_ATTRIBUTE = 'counted_in_stats'
+
+user_stats_table = SharedTable(USER_STATS_TABLE)
+
+def read_user_counts(user_id, survey_meta_table):
+    """(total_survey_count, completed_analyses) for a user with a single GetItem.
+
+    Users whose aggregate predates the counters are backfilled once from a
+    paginated SurveyMeta query; every later call is O(1).
+    """
+    item = user_stats_table.get_item(Key={'user_id': user_id}, ConsistentRead=True).get('Item')
+    if item is None or not item.get('backfilled'):
+        return backfill_user_counts(user_id, survey_meta_table)
+    return int(item.get('total_survey_count', 0)), int(item.get('completed_analyses', 0))
+
+def backfill_user_counts(user_id, survey_meta_table):
+    """Add a user's surveys from before the counters to the aggregate item, once.
+
+    Uploads and first completions ADD to the counters themselves, possibly
+    while this runs, so only what they never counted is added here: items
+    without COUNTED_ATTRIBUTE, and analyzed items without first_analyzed_at.
+    The counts are ADDed rather than SET so concurrent increments are kept,
+    and the backfilled flag makes sure it happens once.
+    """
+    total = 0
+    completed = 0
+    kwargs = {
+        'KeyConditionExpression': Key('user_id').eq(user_id),
+        'ProjectionExpression': '#s, first_analyzed_at, ' + COUNTED_ATTRIBUTE,
+        'ExpressionAttributeNames': {'#s': 'status'},
+        'ConsistentRead': True
+    }
+    while True:
+        response = survey_meta_table.query(**kwargs)
+        for item in response.get('Items', []):
+            total += not item.get(COUNTED_ATTRIBUTE)
+            completed += item.get('status') == 'analyzed' and 'first_analyzed_at' not in item
+        if 'LastEvaluatedKey' not in response:
+            break
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    try:
+        item = user_stats_table.update_item(
+            Key={'user_id': user_id},
+            UpdateExpression='ADD total_survey_count :t, completed_analyses :c SET backfilled = :b',
+            ConditionExpression='attribute_not_exists(backfilled)',
+            ExpressionAttributeValues={':t': total, ':c': completed, ':b': True},
+            ReturnValues='ALL_NEW'
+        )['Attributes']
+    except ClientError as e:
+        # Another worker backfilled first; its counts already include these
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        item = user_stats_table.get_item(Key={'user_id': user_id}, ConsistentRead=True).get('Item', {})
+    return int(item.get('total_survey_count', 0)), int(item.get('completed_analyses', 0))
+
+def record_completed_analysis(user_id):
+    """Atomically count one more analyzed survey for the user"""
+    user_stats_table.update_item(
+        Key={'user_id': user_id},
+        UpdateExpression='ADD completed_analyses :one',
+        ExpressionAttributeValues={':one': 1}
+    )
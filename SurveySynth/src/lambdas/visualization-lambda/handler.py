@@ -177,15 +177,19 @@ def create_sentiment_pie_chart(data, timestamp,folder_prefix):
 def create_pain_points_chart(data, timestamp, folder_prefix):
     """Create horizontal bar chart for top pain points"""
     
-    # Aggregate all pain points
-    all_pain_points = []
+    # Aggregate all pain points, using the clustered mention counts when the
+    # analysis stored them (similar wordings are already merged under one label)
+    pain_point_counts = Counter()
     for item in data:
+        counts = item.get('pain_point_counts')
+        if isinstance(counts, dict) and counts:
+            pain_point_counts.update({point: int(count) for point, count in counts.items()})
+            continue
         pain_points = item.get('pain_points', [])
         if isinstance(pain_points, list):
-            all_pain_points.extend(pain_points)
+            pain_point_counts.update(pain_points)
     
     # Count frequency
-    pain_point_counts = Counter(all_pain_points)
     top_pain_points = pain_point_counts.most_common(10)
     
     if not top_pain_points:
@@ -24,6 +24,8 @@ def lambda_handler(event, context):
     print("DynamoDB Stream Event:", json.dumps(event))
 
     email_sent = False
+    # Sequence numbers of records to retry (partial batch response)
+    failed_sequence_numbers = []
     for record in event['Records']:
         if record['eventName'] == 'INSERT':
             new_image = record['dynamodb']['NewImage']
@@ -31,13 +33,18 @@ def lambda_handler(event, context):
             upload_id = new_image['upload_id']['S']
             email = new_image.get('email', {}).get('S', 'your-verified-email@example.com')
             # Launch Glue job
-            response = glue.start_job_run(
-                JobName='Visual_job',
-                Arguments={
-                    '--user_id': user_id,
-                    '--upload_id': upload_id
-                }
-            )
+            try:
+                response = glue.start_job_run(
+                    JobName='Visual_job',
+                    Arguments={
+                        '--user_id': user_id,
+                        '--upload_id': upload_id
+                    }
+                )
+            except Exception as e:
+                print(f"Failed to start Glue job: {e}")
+                failed_sequence_numbers.append(record['dynamodb']['SequenceNumber'])
+                continue
             print(f"Started Glue job: {response['JobRunId']}")
             # Wait for Glue job to complete (polling)
             job_run_id = response['JobRunId']
@@ -51,6 +58,13 @@ def lambda_handler(event, context):
                         'MaxAttempts': 40
                     }
                 )
+            except Exception as e:
+                print(f"Glue job did not complete successfully: {e}")
+                failed_sequence_numbers.append(record['dynamodb']['SequenceNumber'])
+                continue
+            # The charts exist now: a retry would rerun the whole Glue job, so
+            # failures past this point are only logged
+            try:
                 # Update DynamoDB tables after charts are generated
                 dynamodb = boto3.resource('dynamodb')
                 # Update SurveyMeta table
@@ -88,6 +102,9 @@ def lambda_handler(event, context):
                         ':new_status': 'charts generated'
                     }
                 )
+            except Exception as e:
+                print(f"Failed to update status after Glue job {job_run_id}: {e}")
+            try:
                 # Send success email with HTML template
                 html_body = f'''
                 <html>
@@ -137,7 +154,11 @@ def lambda_handler(event, context):
                 )
                 email_sent = True
             except Exception as e:
-                print(f"Glue job did not complete successfully: {e}")
+                print(f"Failed to send completion email to {email}: {e}")
 
-    return {"statusCode": 200, "body": "Triggered visualization job and sent email." if email_sent else "Triggered visualization job."}
+    return {
+        "statusCode": 200,
+        "body": "Triggered visualization job and sent email." if email_sent else "Triggered visualization job.",
+        "batchItemFailures": [{"itemIdentifier": n} for n in failed_sequence_numbers]
+    }
 #2min 20 seconds
\ No newline at end of file
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The lambda modules import each other as top-level modules, as they do in the deployed package
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'lambdas', 'summarize_feedback'))
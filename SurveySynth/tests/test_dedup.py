@@ -0,0 +1,47 @@
+import pytest
+
+from dedup import MULTIPLICITY_KEY, TooManyUniqueResponses, collapse_duplicates, multiplicity
+
+def survey(rows):
+    """300 distinct answers (more than one SIGNATURE_BATCH), repeated with case and punctuation changes"""
+    responses = []
+    for i in range(rows):
+        text = f"Module {i % 300} assignment {i % 300 * 7} was reviewed in session {i % 300 * 13}"
+        responses.append({'feedback': text.upper() + '!' if i % 3 else text})
+    return responses
+
+def test_counts_are_conserved():
+    responses = survey(900)
+    unique = collapse_duplicates(responses)
+    assert sum(multiplicity(r) for r in unique) == 900
+    assert len(unique) <= 300
+
+def test_counts_of_collapsed_inputs_are_conserved():
+    # Responses that already stand for several originals (e.g. a sample) keep their weight
+    responses = [{**r, MULTIPLICITY_KEY: 1 + i % 4} for i, r in enumerate(survey(400))]
+    unique = collapse_duplicates(responses)
+    assert sum(multiplicity(r) for r in unique) == sum(1 + i % 4 for i in range(400))
+
+def test_near_duplicates_merge():
+    unique = collapse_duplicates([
+        {'feedback': 'The instructor explains every concept clearly and patiently with real examples'},
+        {'feedback': 'The instructor explains every concept clearly and patiently with real examples too'},
+    ])
+    assert [(r['feedback'], r[MULTIPLICITY_KEY]) for r in unique] == [
+        ('The instructor explains every concept clearly and patiently with real examples', 2)]
+
+def test_distinct_answers_stay_apart():
+    texts = ['The instructor explains every concept clearly and patiently with real examples',
+             'Assignments are due too often and the deadlines clash with the weekly quizzes']
+    unique = collapse_duplicates([{'feedback': text} for text in texts])
+    assert [(r['feedback'], r[MULTIPLICITY_KEY]) for r in unique] == [(text, 1) for text in texts]
+
+def test_partitions_are_never_merged():
+    text = 'The instructor explains every concept clearly and patiently with real examples'
+    unique = collapse_duplicates([{'feedback': text, '_cohort': 'A'}, {'feedback': text, '_cohort': 'B'}],
+                                 partition_key='_cohort')
+    assert [r[MULTIPLICITY_KEY] for r in unique] == [1, 1]
+
+def test_max_unique_stops_the_pass():
+    with pytest.raises(TooManyUniqueResponses):
+        collapse_duplicates(survey(600), max_unique=100)
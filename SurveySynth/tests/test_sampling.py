@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from dedup import multiplicity
+from sampling import STRATUM_KEY, StratifiedSampler, stratified_sentiment
+
+SIZES = {'A': 5000, 'B': 1200, 'C': 300, 'D': 40, 'E': 3}
+
+def survey():
+    """Distinct responses in strata of very different sizes, interleaved"""
+    labels = [label for label, size in SIZES.items() for _ in range(size)]
+    np.random.default_rng(7).shuffle(labels)
+    return [{'feedback': f"answer {i}", STRATUM_KEY: label} for i, label in enumerate(labels)]
+
+@pytest.mark.parametrize('budget', [60, 200, 1000])
+def test_allocation_sums_to_the_budget(budget):
+    sampler = StratifiedSampler(budget=budget, min_per_stratum=10, seed=1)
+    population = np.array(list(SIZES.values()))
+    allocation = sampler.allocation(population, population)
+    assert allocation.sum() == budget
+    assert (allocation <= population).all()
+    # The largest strata get the largest shares
+    assert list(allocation[:3]) == sorted(allocation[:3], reverse=True)
+
+def test_sample_draws_the_budget():
+    sampler = StratifiedSampler(budget=200, min_per_stratum=10, seed=1)
+    responses = survey()
+    for start in range(0, len(responses), 500):
+        sampler.add(responses[start:start + 500])
+    groups, report = sampler.sample()
+    assert report['population'] == sum(SIZES.values())
+    assert report['sample_size'] == 200
+    assert sum(stratum['sampled'] for stratum in report['strata'].values()) == 200
+    assert sum(multiplicity(r) for _, members in groups for r in members) == 200
+
+def test_small_population_is_taken_whole():
+    sampler = StratifiedSampler(budget=100, min_per_stratum=10, seed=1)
+    sampler.add([{'feedback': f"answer {i}", STRATUM_KEY: 'A' if i % 2 else 'B'} for i in range(40)])
+    _, report = sampler.sample()
+    assert report['sample_size'] == 40
+
+def test_interval_contains_the_estimate():
+    report = {'strata': {'A': {'population': 5000, 'sampled': 120}, 'B': {'population': 300, 'sampled': 30},
+                         'C': {'population': 12, 'sampled': 12}}}
+    counts = {'A': {'positive': 80, 'neutral': 30, 'negative': 10},
+              'B': {'positive': 3, 'neutral': 2, 'negative': 25},
+              'C': {'positive': 12, 'neutral': 0, 'negative': 0}}
+    result = stratified_sentiment(report, counts, confidence=0.95)
+    for key, share in result['sentiment'].items():
+        assert 0 <= share['ci_low'] <= share['estimate'] <= share['ci_high'] <= 100
+        assert share['ci_high'] > share['ci_low']
+    assert sum(share['estimate'] for share in result['sentiment'].values()) == pytest.approx(100, abs=0.2)
+
+def test_census_has_no_sampling_error():
+    report = {'strata': {'A': {'population': 20, 'sampled': 20}}}
+    result = stratified_sentiment(report, {'A': {'positive': 15, 'neutral': 5, 'negative': 0}})
+    assert result['sentiment']['positive'] == {'estimate': 75.0, 'ci_low': 75.0, 'ci_high': 75.0}
+    assert result['sentiment']['negative'] == {'estimate': 0.0, 'ci_low': 0.0, 'ci_high': 0.0}
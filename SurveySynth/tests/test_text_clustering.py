@@ -0,0 +1,22 @@
+import pytest
+
+from text_clustering import cluster_texts
+
+@pytest.mark.parametrize('first, second', [
+    ('Pace of teaching is too fast', 'Pace of teaching is too slow'),
+    ('Need more Spring Boot examples', 'Need more React examples'),
+    ('Microservices module needs more depth', 'Testing module needs more depth'),
+    ('Pace is too fast', 'Pace is not too fast'),
+])
+def test_different_points_stay_apart(first, second):
+    clusters = cluster_texts([first, second], [3, 2])
+    assert [(c['label'], c['count']) for c in clusters] == [(first, 3), (second, 2)]
+
+@pytest.mark.parametrize('first, second', [
+    ('Pace of teaching is too fast', 'The pace of teaching is too fast!'),
+    ('Need more hands-on projects', 'More hands-on projects needed'),
+    ('Doubt solving sessions are short', 'Doubt sessions are too short'),
+])
+def test_paraphrases_merge_under_the_heavier_label(first, second):
+    clusters = cluster_texts([first, second], [3, 2])
+    assert [(c['label'], c['count']) for c in clusters] == [(first, 5)]